@@ -0,0 +1,143 @@
+##
+# Benchmark of the bulk transfer engine (bulk_transfer.py) against iperf, and of the latency of the congestion control
+# switch from an OSNR change.
+#
+# Throughput: every engine sends over loopback for --time seconds, so the link is not the bottleneck and the result is
+# the ceiling of the engine on this host, with the CPU time it took (sender and receiver). Engines whose program is not
+# installed are skipped.
+#
+# Switch latency (--switch): a sender runs with its control socket while a CcaAdapter polls an OSNR source and
+# switches the algorithm at every change. The default source steps between two values every --period seconds at known
+# times; --osnr-url reads the monitor of a running mnoptical network instead, whose changes are made by hand.
+#
+
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+from os.path import dirname, realpath, join
+from time import sleep, time
+from traffic import generators, base_port
+from bulk_transfer import ControlClient
+from cca_adapter import CcaAdapter
+
+sys.path.insert(0, join(dirname(realpath(__file__)), '..', 'Scripts'))
+from iperf_loader import load_iperf
+
+
+def cpu_children():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_engine(generator, duration, outdir, port, extra=()):
+    """ Run one flow of a traffic generator over loopback.
+
+        :return Tuple (Mbps, CPU seconds of the server and client).
+    """
+    path = join(outdir, 'bench_{0}{1}'.format(generator.name, generator.suffix))
+    cpu = cpu_children()
+    server = subprocess.Popen(generator.server(port), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        sleep(0.5)
+        with open(path, 'w') as out:
+            subprocess.run(generator.client('127.0.0.1', port, 'cubic', duration) + list(extra), stdout=out,
+                           check=True)
+    finally:
+        server.terminate()
+        server.wait()
+    summary = load_iperf(path, cache=False)['summary']
+    return (summary[1] if len(summary) else float('nan')), cpu_children() - cpu
+
+
+class StepOsnr(object):
+    """ OSNR source alternating between two values every `period` seconds, recording when each change happens.
+    """
+
+    def __init__(self, values, period):
+        self.values, self.period = values, period
+        self.origin = time()
+        self.changes = list()
+
+    def __call__(self):
+        step = int((time() - self.origin) / self.period)
+        while len(self.changes) < step:
+            self.changes.append(self.origin + (len(self.changes) + 1) * self.period)
+        return self.values[step % 2]
+
+
+def switch_latency(args, outdir):
+    """ Run a sender with a CcaAdapter for --time seconds and return the latency statistics of its switches.
+    """
+    builtin = generators['builtin']()
+    control_path = join(outdir, 'control.sock')
+    server = subprocess.Popen(builtin.server(base_port), stdout=subprocess.DEVNULL)
+    sleep(0.5)
+    with open(join(outdir, 'switch.json'), 'w') as out:
+        client = subprocess.Popen(builtin.client('127.0.0.1', base_port, args.algorithms[0], args.time,
+                                                 control=control_path), stdout=out)
+    try:
+        while not os.path.exists(control_path):
+            sleep(0.01)
+        control = ControlClient(dict(flow=control_path))
+        if args.osnr_url:
+            from optical_control import OpticalControl
+            optical = OpticalControl(args.osnr_url)
+            source = lambda: optical.channel_report(args.monitor, args.channel)['osnr']
+            changes = None
+        else:
+            source = StepOsnr(args.osnr_values, args.period)
+            changes = source.changes
+        threshold = sum(args.osnr_values) / 2
+        # Above the threshold the first algorithm, below it the second one
+        decide = lambda osnr: args.algorithms[0] if osnr >= threshold else args.algorithms[1]
+        adapter = CcaAdapter(source, decide, control, args.poll, initial=args.algorithms[0])
+        adapter.start()
+        client.wait()
+        adapter.stop()
+        control.close()
+    finally:
+        client.wait()
+        server.terminate()
+        server.wait()
+    return adapter.latency(changes)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Throughput ceiling of the traffic generators and latency of the '
+                                                 'congestion control switch.')
+    parser.add_argument('-t', '--time', type=float, default=10, help='Time to send in seconds.')
+    parser.add_argument('--switch', action='store_true', help='Measure the switch latency instead of the throughput.')
+    parser.add_argument('--algorithms', nargs=2, default=['cubic', 'bbr'],
+                        help='Algorithms for the high and the low OSNR.')
+    parser.add_argument('--osnr-values', nargs=2, type=float, default=[30.0, 20.0],
+                        help='High and low OSNR (dB) of the step source; their mean is the decision threshold.')
+    parser.add_argument('--period', type=float, default=1.0, help='Time between two OSNR steps in seconds.')
+    parser.add_argument('--poll', type=float, default=0.01, help='OSNR poll interval in seconds.')
+    parser.add_argument('--osnr-url', metavar='HOST:PORT', help='Read the OSNR from a mnoptical REST server.')
+    parser.add_argument('--monitor', default='t2-monitor', help='Monitor read with --osnr-url.')
+    parser.add_argument('--channel', type=int, default=2, help='Channel read with --osnr-url.')
+    args = parser.parse_args()
+
+    outdir = tempfile.mkdtemp(prefix='bench_bulk_')
+    try:
+        if args.switch:
+            for name, value in switch_latency(args, outdir).items():
+                print('{0:>24}: {1:g}'.format(name, value))
+        else:
+            engines = [('builtin (memoryview)', generators['builtin'](), ()),
+                       ('builtin (sendfile)', generators['builtin'](), ('--sendfile',)),
+                       ('iperf2', generators['iperf2'](), ()), ('iperf3', generators['iperf3'](0.5), ())]
+            for i, (name, generator, extra) in enumerate(engines):
+                program = generator.server(base_port)[0]
+                if shutil.which(program) is None and not os.path.exists(program):
+                    print('{0:>24}: {1} not installed'.format(name, program))
+                    continue
+                mbps, cpu = run_engine(generator, args.time, outdir, base_port + i, extra)
+                print('{0:>24}: {1:8.2f} Gbps  {2:5.1f} s CPU  {3:6.2f} Gbit per CPU second'
+                      .format(name, mbps / 1e3, cpu, mbps * args.time / 1e3 / cpu if cpu else float('nan')))
+    finally:
+        shutil.rmtree(outdir)
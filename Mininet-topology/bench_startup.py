@@ -0,0 +1,47 @@
+##
+# Benchmark of the cold start of topo.py: interpreter start plus imports, and the cleanup phase.
+#
+# Every measure runs in a new Python process, as a real invocation would. The cleanup phase needs root (or sudo) and
+# is only measured with --cleanup.
+#
+
+import argparse
+import subprocess
+import sys
+from os.path import dirname, realpath, join
+from statistics import median
+from time import perf_counter
+
+here = dirname(realpath(__file__))
+
+
+def time_command(command, repeat):
+    """ Return the wall times in seconds of `repeat` runs of a command.
+    """
+    times = list()
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.run(command, cwd=here, stdout=subprocess.DEVNULL, check=True)
+        times.append(perf_counter() - start)
+    return times
+
+
+def report(name, times):
+    print('{0:>28}: median {1:7.1f} ms  min {2:7.1f} ms  max {3:7.1f} ms'
+          .format(name, 1e3 * median(times), 1e3 * min(times), 1e3 * max(times)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cold start time of topo.py.')
+    parser.add_argument('-n', '--repeat', type=int, default=10, help='Number of runs of every measure.')
+    parser.add_argument('--cleanup', action='store_true', help='Also measure the cleanup phase (needs root).')
+    args = parser.parse_args()
+
+    report('python startup', time_command([sys.executable, '-c', 'pass'], args.repeat))
+    report('import topo', time_command([sys.executable, '-c', 'import topo'], args.repeat))
+    report('topo.py --help', time_command([sys.executable, join(here, 'topo.py'), '--help'], args.repeat))
+    if args.cleanup:
+        report('targeted cleanup', time_command(
+            [sys.executable, '-c', 'from net_cleanup import cleanup_network; cleanup_network()'], args.repeat))
+        report('mn -c', time_command(
+            [sys.executable, '-c', 'from net_cleanup import cleanup_network; cleanup_network(True)'], args.repeat))
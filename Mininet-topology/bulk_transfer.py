@@ -0,0 +1,279 @@
+##
+# Bulk TCP transfer engine of the 'builtin' traffic generator (see traffic.py).
+#
+# Unlike iperf, which sets the congestion control algorithm once per connection, the sender can switch the algorithm
+# of its socket (TCP_CONGESTION) in the middle of the flow. It listens for commands on a Unix socket, one JSON object
+# per line:
+#
+#   {"cca": "bbr"}      switch the algorithm, answered with {"cca": "bbr", "previous": "cubic", "switched": <time>}
+#   {"stop": true}      stop sending, answered with {"stopped": <time>}
+#
+# Mininet hosts share the file system, so the test (in the root namespace) reaches the senders through the socket
+# files. Every switch is also written to the report stream as a 'cca' event.
+#
+# Both ends run a single asyncio loop on non-blocking sockets. The sender writes from one preallocated buffer, through
+# memoryview slices or sendfile() from a memfd, so nothing is allocated per send, and counts the bytes every send()
+# actually accepted, so reports are exact at any interval. Reports use the iperf3 --json-stream format.
+#
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+from time import time
+
+# Size of the send buffer, small enough for a send() to return within a few ms on a 100Mbps link
+send_buffer = 256 * 1024
+
+
+def parse_size(text):
+    """ Parse an amount of data as iperf does, e.g. '10M' (10 * 1024**2 bytes) or '1500'.
+    """
+    units = dict(K=1024, M=1024 ** 2, G=1024 ** 3)
+    text = str(text).strip()
+    if text[-1:].upper() in units:
+        return int(float(text[:-1]) * units[text[-1].upper()])
+    return int(text)
+
+
+def emit(event, data, out=sys.stdout):
+    out.write(json.dumps(dict(event=event, data=data)) + '\n')
+    out.flush()
+
+
+async def writable(loop, sock):
+    """ Wait until a non-blocking socket can take more data.
+    """
+    future = loop.create_future()
+    loop.add_writer(sock.fileno(), future.set_result, None)
+    try:
+        await future
+    finally:
+        loop.remove_writer(sock.fileno())
+
+
+class BulkSender(object):
+    """ Send data to a BulkReceiver as fast as TCP allows, with the congestion control algorithm switched on command.
+    """
+
+    def __init__(self, dst, port, alg, interval=0.1, duration=None, size=None, control=None, sendfile=False,
+                 buffer_size=send_buffer):
+        """ Create the sender.
+
+            :param  dst         Address of the receiver.
+            :param  port        Port of the receiver.
+            :param  alg         Initial TCP congestion control algorithm.
+            :param  interval    Report interval in seconds.
+            :param  duration    Time to send in seconds, None to send `size` bytes.
+            :param  size        Amount of data to send in bytes, None to send for `duration` seconds.
+            :param  control     Path of the Unix socket listening for commands, None for no control channel.
+            :param  sendfile    Send with sendfile() from a memfd instead of send() from a memoryview.
+            :param  buffer_size Bytes passed to every send call.
+        """
+        self.dst, self.port, self.alg = dst, port, alg
+        self.interval, self.duration, self.size = interval, duration, size
+        self.control, self.sendfile, self.buffer_size = control, sendfile, buffer_size
+        self.total = 0
+        self.stopped = False
+        # List of (requested, switched, previous, algorithm) of every switch, times in seconds since the epoch
+        self.switches = list()
+
+    def set_cca(self, alg):
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_CONGESTION, alg.encode())
+        previous, self.alg = self.alg, alg
+        return previous
+
+    async def handle_control(self, reader, writer):
+        """ Serve the commands of one control connection until it is closed, or the flow ends.
+        """
+        while True:
+            try:
+                line = await reader.readline()
+            except (asyncio.CancelledError, ConnectionResetError):
+                break
+            if not line:
+                break
+            requested = time()
+            try:
+                command = json.loads(line)
+                if command.get('stop'):
+                    self.stopped = True
+                    reply = dict(stopped=time())
+                else:
+                    previous = self.set_cca(command['cca'])
+                    switched = time()
+                    self.switches.append((requested, switched, previous, self.alg))
+                    emit('cca', dict(algorithm=self.alg, previous=previous, time=switched - self.start,
+                                     requested=requested - self.start))
+                    reply = dict(cca=self.alg, previous=previous, requested=requested, switched=switched)
+            except (ValueError, KeyError, TypeError, OSError) as e:
+                reply = dict(error=str(e))
+            writer.write((json.dumps(reply) + '\n').encode())
+            await writer.drain()
+        writer.close()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.sock = sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16 * 1024 * 1024)
+        self.set_cca(self.alg)
+        await loop.sock_connect(sock, (self.dst, self.port))
+        local_host, local_port = sock.getsockname()[:2]
+        self.start = start = time()
+        emit('start', dict(connected=[dict(local_host=local_host, local_port=local_port, remote_host=self.dst,
+                                           remote_port=self.port)],
+                           timestamp=dict(timesecs=start), test_start=dict(protocol='TCP', congestion=self.alg)))
+
+        server = None
+        if self.control is not None:
+            if os.path.exists(self.control):
+                os.unlink(self.control)
+            server = await asyncio.start_unix_server(self.handle_control, self.control)
+
+        if self.sendfile:
+            fd = os.memfd_create('bulk_transfer')
+            os.ftruncate(fd, self.buffer_size)
+            send = lambda n: os.sendfile(sock.fileno(), fd, 0, n)
+        else:
+            view = memoryview(bytearray(self.buffer_size))
+            send = lambda n: sock.send(view[:n])
+
+        # Intervals are counted from the start of the test, as in iperf3
+        sent = 0
+        last = start
+        next_report = start + self.interval
+        deadline = None if self.duration is None else start + self.duration
+        try:
+            while not self.stopped and (deadline is None or time() < deadline) and \
+                    (self.size is None or self.total < self.size):
+                try:
+                    n = send(self.buffer_size if self.size is None else min(self.buffer_size, self.size - self.total))
+                except BlockingIOError:
+                    # Socket buffer full: commands and other tasks run while waiting
+                    await writable(loop, sock)
+                    continue
+                sent += n
+                self.total += n
+                now = time()
+                if now >= next_report:
+                    emit('interval', dict(sum=dict(start=last - start, end=now - start, seconds=now - last, bytes=sent,
+                                                   bits_per_second=8 * sent / (now - last))))
+                    sent, last = 0, now
+                    next_report += self.interval
+                    # Let the control channel in even if the socket never fills up
+                    await asyncio.sleep(0)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            sock.close()
+            if self.sendfile:
+                os.close(fd)
+            if server is not None:
+                server.close()
+                os.unlink(self.control)
+            elapsed = time() - start
+            emit('end', dict(sum_sent=dict(seconds=elapsed, bytes=self.total,
+                                           bits_per_second=8 * self.total / elapsed if elapsed else 0),
+                             switches=len(self.switches)))
+
+
+class BulkReceiver(object):
+    """ Accept connections and discard everything they send, every connection reading into its own buffer.
+    """
+
+    def __init__(self, port, buffer_size=1024 * 1024):
+        self.port = port
+        self.buffer_size = buffer_size
+
+    async def drain(self, loop, conn):
+        buffer = bytearray(self.buffer_size)
+        with conn:
+            try:
+                while await loop.sock_recv_into(conn, buffer):
+                    pass
+            except ConnectionResetError:
+                pass
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16 * 1024 * 1024)
+        server.bind(('', self.port))
+        server.listen(128)
+        server.setblocking(False)
+        while True:
+            conn, _ = await loop.sock_accept(server)
+            conn.setblocking(False)
+            loop.create_task(self.drain(loop, conn))
+
+
+class ControlClient(object):
+    """ Control channel of a set of BulkSenders, e.g. all the flows of a test.
+
+        The connections are opened once and kept, so a switch costs one write and one read per sender.
+    """
+
+    def __init__(self, paths, timeout=5):
+        """ Connect to the senders.
+
+            :param  paths   Dictionary with the flow names as keys and the control socket paths as values.
+            :param  timeout Socket timeout in seconds.
+        """
+        self.conns = dict()
+        for flow, path in paths.items():
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(timeout)
+            conn.connect(path)
+            self.conns[flow] = (conn, conn.makefile('r'))
+
+    def command(self, command, flows=None):
+        """ Send a command to the given flows (all by default) at once, then collect their replies.
+
+            :return Dictionary with the flow names as keys and the replies as values.
+        """
+        flows = list(self.conns) if flows is None else flows
+        data = (json.dumps(command) + '\n').encode()
+        for flow in flows:
+            self.conns[flow][0].sendall(data)
+        return dict((flow, json.loads(self.conns[flow][1].readline())) for flow in flows)
+
+    def switch(self, alg, flows=None):
+        return self.command(dict(cca=alg), flows)
+
+    def stop(self, flows=None):
+        return self.command(dict(stop=True), flows)
+
+    def close(self):
+        for conn, file in self.conns.values():
+            file.close()
+            conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk TCP transfer with the congestion control switched on command.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    server_parser = sub.add_parser('server', help='Receive and discard data.')
+    server_parser.add_argument('-p', '--port', type=int, default=5001)
+    client_parser = sub.add_parser('client', help='Send data and report the throughput as JSON lines.')
+    client_parser.add_argument('dst', help='Address of the server.')
+    client_parser.add_argument('-p', '--port', type=int, default=5001)
+    client_parser.add_argument('-i', '--interval', type=float, default=0.1, help='Report interval in seconds.')
+    client_parser.add_argument('-C', '--congestion', default='cubic', help='Initial TCP congestion control algorithm.')
+    client_parser.add_argument('-t', '--time', type=float, help='Time to send in seconds.')
+    client_parser.add_argument('-n', '--bytes', type=parse_size, help='Amount of data to send, instead of --time.')
+    client_parser.add_argument('--control', metavar='PATH', help='Unix socket listening for commands.')
+    client_parser.add_argument('--sendfile', action='store_true',
+                               help='Send with sendfile() from a memfd instead of send() from a buffer.')
+    args = parser.parse_args()
+
+    if args.command == 'server':
+        asyncio.run(BulkReceiver(args.port).run())
+    else:
+        asyncio.run(BulkSender(args.dst, args.port, args.congestion, args.interval,
+                               args.time if args.bytes is None else None, args.bytes, args.control,
+                               args.sendfile).run())
@@ -0,0 +1,94 @@
+##
+# Dynamic congestion control adaptation: switch the algorithm of running flows when the OSNR of their lightpath changes.
+#
+# A thread polls the OSNR (from the mnoptical REST monitors or any other source), picks the algorithm for the new value
+# (e.g. with ../Scripts/cca_decision.CcaDecision) and switches the BulkSenders of the flows through their control
+# sockets (see bulk_transfer.py). Every step of the reaction is timestamped on the host clock, which the senders in the
+# Mininet hosts share, so the latency from the OSNR change to the switch of every socket is measured end to end.
+#
+
+import threading
+import numpy as np
+from time import time
+
+
+class CcaAdapter(threading.Thread):
+    """ Poll the OSNR and switch the congestion control algorithm of the flows when the decision changes.
+    """
+
+    def __init__(self, read_osnr, decide, control, poll_interval=0.1, initial=None):
+        """ Create the adapter.
+
+            :param  read_osnr       Function returning the current OSNR in dB.
+            :param  decide          Function returning the algorithm for an OSNR.
+            :param  control         bulk_transfer.ControlClient of the flows.
+            :param  poll_interval   Time between two OSNR reads in seconds.
+            :param  initial         Algorithm the flows start with.
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.read_osnr, self.decide, self.control = read_osnr, decide, control
+        self.poll_interval = poll_interval
+        self.algorithm = initial
+        self.stopped = threading.Event()
+        # One row per switch: (last read before the change, read showing the change, OSNR, decided, first and last
+        # socket switched), times in seconds since the epoch
+        self.switches = list()
+        self.errors = list()
+
+    def run(self):
+        osnr, previous_read = None, time()
+        while not self.stopped.is_set():
+            value = self.read_osnr()
+            observed = time()
+            if value is not None and value != osnr:
+                osnr = value
+                algorithm = self.decide(osnr)
+                decided = time()
+                if algorithm != self.algorithm:
+                    try:
+                        replies = self.control.switch(algorithm)
+                    except (OSError, ValueError) as e:
+                        # The flows ended
+                        self.errors.append(str(e))
+                        break
+                    switched = [reply['switched'] for reply in replies.values() if 'switched' in reply]
+                    self.errors.extend(reply['error'] for reply in replies.values() if 'error' in reply)
+                    if switched:
+                        self.switches.append((previous_read, observed, osnr, decided, min(switched), max(switched)))
+                    self.algorithm = algorithm
+            previous_read = observed
+            self.stopped.wait(max(0.0, observed + self.poll_interval - time()))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def latency(self, changes=None):
+        """ Return the reaction latency statistics in milliseconds.
+
+            :param  changes Times of the OSNR changes, when the source knows them. Otherwise the change is only known
+                            to be between the last read before it and the read showing it, and the latency is counted
+                            from the read showing it ('detection' is then the bound of the detection delay).
+        """
+        if not self.switches:
+            return dict(switches=0, errors=len(self.errors))
+        rows = np.array(self.switches)
+        if changes is None:
+            start = rows[:, 1]
+            detection = rows[:, 1] - rows[:, 0]
+        else:
+            # Each switch answers the last change before the read that showed it
+            changes = np.sort(np.asarray(changes, dtype=float))
+            start = changes[np.searchsorted(changes, rows[:, 1], side='right') - 1]
+            detection = rows[:, 1] - start
+        result = dict(switches=len(rows), errors=len(self.errors))
+        for name, values in (('detection', detection), ('decision', rows[:, 3] - rows[:, 1]),
+                             ('command', rows[:, 5] - rows[:, 3]), ('end_to_end', rows[:, 5] - start)):
+            result[name + '_ms_p50'] = 1e3 * float(np.median(values))
+            result[name + '_ms_max'] = 1e3 * float(values.max())
+        return result
+
+    def save(self, path):
+        rows = np.array(self.switches).reshape(-1, 6)
+        np.savez(path, last_read=rows[:, 0], observed=rows[:, 1], osnr=rows[:, 2], decided=rows[:, 3],
+                 first_switched=rows[:, 4], last_switched=rows[:, 5])
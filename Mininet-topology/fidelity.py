@@ -0,0 +1,206 @@
+##
+# Emulation fidelity watchdog: results are only those of the emulated network if the host running it was not
+# CPU-starved.
+#
+# With pinning, the harness (with the mnoptical simulation and its REST server) and Open vSwitch get dedicated cores,
+# and every Mininet host runs its iperf processes on its own core (taskset), the hosts of parallel jobs on distinct
+# cores as long as there are enough of them. During every test a thread samples the busy and softirq time of every
+# core from /proc/stat; the packets dropped and the softirq runs cut short (time_squeeze) by the kernel's receive
+# backlog are read from /proc/net/softnet_stat, and the netem drops of the links from tc, at the start and end of the
+# test. A test is flagged as saturated when a core it uses stayed busy, softirq work took most of a core or the
+# backlog dropped packets or was squeezed. netem drops are recorded but are no criterion: the bottleneck queue drops
+# there too.
+#
+
+import os
+import re
+import threading
+import numpy as np
+from time import time
+
+##
+# Globals
+##########
+# All the cores the harness may use, read before it pins itself
+all_cpus = sorted(os.sched_getaffinity(0))
+# Cores reserved for the harness and for Open vSwitch, taken first
+system_cores = 2
+# 95th percentile of the busy percentage of a core above which the test is saturated
+max_core_pct = 90.0
+# 95th percentile of the softirq percentage of a core above which the test is saturated
+max_softirq_pct = 50.0
+# Rate of softirq runs cut short (time_squeeze per second) above which the test is saturated
+max_squeezed_per_s = 10.0
+
+dropped_re = re.compile(r'dropped (\d+)')
+
+
+def core_plan(names, job=None):
+    """ Return the cores of the harness, of Open vSwitch and of the hosts of a network.
+
+        :param  names   List of the host names.
+        :param  job     Job slot number when running in parallel with other tests, None otherwise.
+        :return Tuple with the core of the harness, the core of Open vSwitch and a dictionary with the host names as
+                keys and their cores as values.
+    """
+    harness, datapath = all_cpus[0], all_cpus[min(1, len(all_cpus) - 1)]
+    pool = all_cpus[system_cores:] or all_cpus
+    first = (job or 0) * len(names)
+    if first + len(names) > len(pool):
+        print('*** Only {0} cores for the hosts, {1} hosts of job {2} share cores'.format(len(pool), len(names), job))
+    return harness, datapath, dict((name, pool[(first + i) % len(pool)]) for i, name in enumerate(sorted(names)))
+
+
+def pin_process(pid, cores, threads=True):
+    """ Set the cores a running process (and all its threads) may run on.
+    """
+    cores = {cores} if isinstance(cores, int) else set(cores)
+    tasks = os.listdir('/proc/{0}/task'.format(pid)) if threads else [pid]
+    for task in tasks:
+        try:
+            os.sched_setaffinity(int(task), cores)
+        except OSError:
+            # The thread ended
+            pass
+
+
+def pin_command(cores, cmd):
+    """ Prefix a command (list of arguments) with taskset, to run it on the given cores.
+    """
+    cores = [cores] if isinstance(cores, int) else cores
+    return ['taskset', '-c', ','.join(str(core) for core in cores)] + list(cmd)
+
+
+def pids(name):
+    """ Return the ids of the processes running a program, e.g. 'ovs-vswitchd'.
+    """
+    result = list()
+    for pid in os.listdir('/proc'):
+        if pid.isdigit():
+            try:
+                with open('/proc/{0}/comm'.format(pid)) as comm:
+                    if comm.read().strip() == name:
+                        result.append(int(pid))
+            except OSError:
+                pass
+    return result
+
+
+def core_times():
+    """ Return the total, busy and softirq CPU ticks of every core since boot, as three vectors indexed by core.
+    """
+    rows = dict()
+    with open('/proc/stat') as stat:
+        for line in stat:
+            if line.startswith('cpu') and line[3].isdigit():
+                fields = line.split()
+                rows[int(fields[0][3:])] = [int(v) for v in fields[1:9]]
+    times = np.zeros((max(rows) + 1, 8))
+    for core, values in rows.items():
+        times[core] = values
+    # user nice system idle iowait irq softirq steal
+    total = times.sum(axis=1)
+    return total, total - times[:, 3] - times[:, 4], times[:, 6]
+
+
+def softnet():
+    """ Return the packets dropped and the softirq runs cut short (time_squeeze) by the receive backlog of all the
+        cores since boot.
+    """
+    dropped = squeezed = 0
+    with open('/proc/net/softnet_stat') as stat:
+        for line in stat:
+            fields = line.split()
+            dropped += int(fields[1], 16)
+            squeezed += int(fields[2], 16)
+    return dropped, squeezed
+
+
+def netem_drops(output):
+    """ Return the packets dropped by the netem qdiscs in the output of `tc -s qdisc show`.
+    """
+    drops = 0
+    for block in output.split('qdisc ')[1:]:
+        if block.startswith('netem'):
+            match = dropped_re.search(block)
+            drops += int(match.group(1)) if match else 0
+    return drops
+
+
+class FidelityWatchdog(object):
+    """ Watch the cores of the host and the kernel's packet processing during a test.
+    """
+
+    def __init__(self, cores=None, read_drops=None, interval=1.0, duration=3600):
+        """ Create the watchdog.
+
+            :param  cores       List of the cores used by the test, None for all the cores.
+            :param  read_drops  Function returning a dictionary with the links as keys and the packets dropped by
+                                their netem qdiscs as values, None to not read them.
+            :param  interval    Time between two samples of the cores in seconds.
+            :param  duration    Expected duration of the test in seconds, to size the arrays (they grow if needed).
+        """
+        self.cores = sorted(cores) if cores is not None else all_cpus
+        self.read_drops, self.interval = read_drops, interval
+        self.n = 0
+        capacity = int(duration / interval) + 16
+        self.time = np.empty(capacity)
+        self.busy = np.empty((capacity, len(self.cores)), dtype='f4')
+        self.softirq = np.empty((capacity, len(self.cores)), dtype='f4')
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def sample(self):
+        total, busy, softirq = core_times()
+        while not self.stopped.wait(self.interval):
+            last = total, busy, softirq
+            total, busy, softirq = core_times()
+            elapsed = np.maximum(total - last[0], 1)[self.cores]
+            if self.n == len(self.time):
+                self.time = np.resize(self.time, 2 * self.n)
+                self.busy = np.vstack((self.busy, np.empty_like(self.busy)))
+                self.softirq = np.vstack((self.softirq, np.empty_like(self.softirq)))
+            self.time[self.n] = time()
+            self.busy[self.n] = 100 * (busy - last[1])[self.cores] / elapsed
+            self.softirq[self.n] = 100 * (softirq - last[2])[self.cores] / elapsed
+            self.n += 1
+
+    def start(self):
+        self.start_time = time()
+        self.softnet = softnet()
+        self.drops = self.read_drops() if self.read_drops is not None else dict()
+        self.thread.start()
+
+    def stop(self):
+        """ Stop watching and return the fidelity summary of the test: 95th percentiles of the busy and softirq
+            percentages of the busiest core, backlog drops and squeezes, netem drops, and whether the emulator was
+            saturated (fidelity_saturated) with the reasons.
+        """
+        self.stopped.set()
+        self.thread.join()
+        elapsed = time() - self.start_time
+        dropped, squeezed = (end - start for start, end in zip(self.softnet, softnet()))
+        drops = dict()
+        if self.read_drops is not None:
+            drops = dict((link, value - self.drops.get(link, 0)) for link, value in self.read_drops().items())
+        busy = np.percentile(self.busy[:self.n], 95, axis=0) if self.n else np.zeros(len(self.cores))
+        softirq = np.percentile(self.softirq[:self.n], 95, axis=0) if self.n else np.zeros(len(self.cores))
+        reasons = list()
+        saturated = [core for core, value in zip(self.cores, busy) if value > max_core_pct]
+        if saturated:
+            reasons.append('cores {0} busy over {1:g}%'.format(saturated, max_core_pct))
+        if softirq.max() > max_softirq_pct:
+            reasons.append('softirq at {0:.0f}% of core {1}'.format(softirq.max(), self.cores[int(softirq.argmax())]))
+        if dropped:
+            reasons.append('{0} packets dropped by the receive backlog'.format(dropped))
+        if squeezed / elapsed > max_squeezed_per_s:
+            reasons.append('{0:.0f} softirq runs cut short per second'.format(squeezed / elapsed))
+        return dict(fidelity_saturated=bool(reasons), fidelity_reasons=reasons, fidelity_cores=self.cores,
+                    fidelity_core_p95_pct=round(float(busy.max()), 1),
+                    fidelity_softirq_p95_pct=round(float(softirq.max()), 1), fidelity_softnet_dropped=dropped,
+                    fidelity_softnet_squeezed=squeezed, fidelity_netem_drops=sum(drops.values()),
+                    fidelity_netem_link_drops=drops)
+
+    def save(self, path):
+        np.savez(path, time=self.time[:self.n], cores=np.array(self.cores), busy=self.busy[:self.n],
+                 softirq=self.softirq[:self.n])
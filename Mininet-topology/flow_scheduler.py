@@ -0,0 +1,183 @@
+##
+# Event-driven scheduler of the iperf flows of a test.
+#
+# A schedule is a list of flows, each a dictionary with:
+#
+#   name        Unique name of the flow, used in the name of its data file (e.g. 'h1-h2').
+#   src, dst    Names of the sending and receiving hosts.
+#   start       Start time in seconds from the beginning of the test.
+#   duration    Duration of the transfer in seconds (iperf -t), or
+#   bytes       Amount of data to transfer (iperf -n, e.g. 10000000 or '10M').
+#   alg         TCP congestion control algorithm (optional, the algorithm of the test by default).
+#
+# Schedules are read from JSON (a list of flows) or CSV (one flow per row, with a header naming the fields above)
+# files, or drawn from a Poisson arrival process. All the flows are launched from timers of a single asyncio loop, and
+# their exit is noticed through a pidfd, so nothing polls while flows run. The intended and actual start time of every
+# flow is recorded.
+#
+
+import asyncio
+import csv
+import json
+import os
+import random
+import threading
+import numpy as np
+from time import time
+
+
+def load_schedule(path):
+    """ Read a schedule from a JSON or CSV file.
+
+        :param  path    Path of the schedule file, .json or .csv.
+    """
+    with open(path) as schedule_file:
+        if path.endswith('.json'):
+            flows = json.load(schedule_file)
+        else:
+            flows = [dict((key, value) for key, value in row.items() if value not in (None, ''))
+                     for row in csv.DictReader(schedule_file)]
+
+    for i, flow in enumerate(flows):
+        flow['start'] = float(flow.get('start', 0))
+        if 'duration' in flow:
+            flow['duration'] = float(flow['duration'])
+        if 'duration' not in flow and 'bytes' not in flow:
+            raise ValueError('Flow {0} of {1} has neither a duration nor bytes'.format(i, path))
+        flow.setdefault('name', '{0}-{1}-f{2}'.format(flow['src'], flow['dst'], i))
+    return flows
+
+
+def poisson_schedule(pairs, rate, horizon, mean_bytes, seed=None):
+    """ Draw a schedule of size-limited flows with Poisson arrivals.
+
+        :param  pairs       List of (sender, receiver, pair name) tuples the flows are spread on, uniformly at random.
+        :param  rate        Mean number of flow arrivals per second.
+        :param  horizon     No flow starts after this time in seconds.
+        :param  mean_bytes  Mean size of the transfers in bytes (exponentially distributed, at least 10 segments).
+        :param  seed        Seed of the random generator, for a reproducible schedule.
+    """
+    rnd = random.Random(seed)
+    flows = list()
+    start = rnd.expovariate(rate)
+    while start < horizon:
+        src, dst, pair = rnd.choice(pairs)
+        flows.append(dict(name='{0}-f{1}'.format(pair, len(flows)), src=src, dst=dst, start=round(start, 6),
+                          bytes=max(14600, int(rnd.expovariate(1 / mean_bytes)))))
+        start += rnd.expovariate(rate)
+    return flows
+
+
+def schedule_end(flows):
+    """ Latest intended end of the time-limited flows of a schedule (or latest start, for size-limited flows).
+    """
+    return max([flow['start'] + flow.get('duration', 0) for flow in flows] or [0])
+
+
+class FlowScheduler(object):
+    """ Launch the flows of a schedule on timers and wait for all of them to finish.
+    """
+
+    def __init__(self, flows, launch):
+        """ Create the scheduler.
+
+            :param  flows   List of flows (see the module description).
+            :param  launch  Function starting a flow, called as launch(flow). Returns the Popen of the flow.
+        """
+        self.flows = sorted(flows, key=lambda flow: flow['start'])
+        self.launch = launch
+        self.loop = None
+        self.done = None
+        self.timers = list()
+        self.running = dict()
+        self.stopped = False
+        self.fired = 0
+        self.t0 = None
+        # One record per flow: intended and actual start, end, exit code
+        self.records = [dict(name=flow['name'], src=flow['src'], dst=flow['dst'], alg=flow.get('alg', ''),
+                             intended=flow['start'], fired=np.nan, launched=np.nan, finished=np.nan, returncode=-1)
+                        for flow in self.flows]
+
+    def run(self):
+        """ Run the schedule in the calling thread until all the launched flows have exited (or stop() was called
+            and the running flows were terminated).
+
+            :return Epoch time of the beginning of the schedule.
+        """
+        self.loop = asyncio.new_event_loop()
+        try:
+            return self.loop.run_until_complete(self._run())
+        finally:
+            self.loop.close()
+
+    async def _run(self):
+        self.done = self.loop.create_future()
+        self.t0 = self.loop.time()
+        wall0 = time()
+        for i, flow in enumerate(self.flows):
+            self.timers.append(self.loop.call_at(self.t0 + flow['start'], self._launch, i))
+        self._check_done()
+        await self.done
+        return wall0
+
+    def _launch(self, i):
+        record = self.records[i]
+        record['fired'] = self.loop.time() - self.t0
+        self.fired += 1
+        popen = self.launch(self.flows[i])
+        record['launched'] = self.loop.time() - self.t0
+        self.running[i] = popen
+        try:
+            pidfd = os.pidfd_open(popen.pid)
+            self.loop.add_reader(pidfd, self._exited, i, pidfd)
+        except (AttributeError, OSError):
+            # No pidfd (Python < 3.9 or Linux < 5.3): wait for the process in a helper thread
+            threading.Thread(target=lambda: (popen.wait(), self.loop.call_soon_threadsafe(self._exited, i, None)),
+                             daemon=True).start()
+
+    def _exited(self, i, pidfd):
+        if pidfd is not None:
+            self.loop.remove_reader(pidfd)
+            os.close(pidfd)
+        popen = self.running.pop(i)
+        self.records[i]['returncode'] = popen.wait()
+        self.records[i]['finished'] = self.loop.time() - self.t0
+        self._check_done()
+
+    def _check_done(self):
+        # Done once nothing runs and every flow was launched, or the schedule was stopped
+        if not self.running and (self.stopped or self.fired == len(self.flows)) and not self.done.done():
+            self.done.set_result(None)
+
+    def stop(self):
+        """ Cancel the flows not started yet and terminate the running ones. Thread safe.
+        """
+        def _stop():
+            self.stopped = True
+            for timer in self.timers:
+                timer.cancel()
+            for popen in self.running.values():
+                popen.terminate()
+            self._check_done()
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(_stop)
+
+    def jitter(self):
+        """ Return a dictionary with the statistics of the start jitter (timer firing minus intended start) and of
+            the launch time (flow started minus timer firing), in seconds, of the flows that were started.
+        """
+        fired = np.array([r['fired'] for r in self.records])
+        started = ~np.isnan(fired)
+        jitter = fired[started] - np.array([r['intended'] for r in self.records])[started]
+        launch = np.array([r['launched'] for r in self.records])[started] - fired[started]
+        if not started.any():
+            return dict(flows_started=0)
+        return dict(flows_started=int(started.sum()), jitter_mean_s=float(jitter.mean()),
+                    jitter_p99_s=float(np.percentile(jitter, 99)), jitter_max_s=float(jitter.max()),
+                    launch_mean_s=float(launch.mean()), launch_max_s=float(launch.max()))
+
+    def save(self, path):
+        """ Write the flow records to a columnar .npz file.
+        """
+        np.savez(path, **dict((key, np.array([r[key] for r in self.records])) for key in self.records[0])
+                 if self.records else dict())
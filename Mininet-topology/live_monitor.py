@@ -0,0 +1,298 @@
+##
+# Live throughput and fairness monitoring of the iperf clients while a test runs.
+#
+# The iperf clients write their CSV reports to stdout. The monitor tails those pipes from an asyncio loop running in
+# a background thread, copies every line to the data file the rest of the code expects, and keeps per-flow running
+# statistics and the Jain index over a sliding window in constant memory. A snapshot of the statistics is served as
+# JSON on a local HTTP port and, optionally, printed to the terminal.
+#
+
+import asyncio
+import json
+import math
+import threading
+from collections import deque
+from time import time
+
+# Two-sided 95% Student's t quantiles by degrees of freedom, 1.96 above the table
+t95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228, 2.201, 2.179, 2.160, 2.145, 2.131,
+       2.120, 2.110, 2.101, 2.093, 2.086, 2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+
+class RunningStats(object):
+    """ Running mean and variance of a stream of values (Welford's algorithm).
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    def std(self):
+        return math.sqrt(self.variance())
+
+
+class FlowStats(object):
+    """ Statistics of one iperf flow: running mean/variance of the whole flow and the mean of the last `window`
+        reports.
+    """
+
+    def __init__(self, window):
+        self.stats = RunningStats()
+        self.recent = deque(maxlen=window)
+        self.recent_sum = 0.0
+        self.last_mbps = None
+        self.last_time = None
+
+    def add(self, mbps, now):
+        if len(self.recent) == self.recent.maxlen:
+            self.recent_sum -= self.recent[0]
+        self.recent.append(mbps)
+        self.recent_sum += mbps
+        self.stats.add(mbps)
+        self.last_mbps = mbps
+        self.last_time = now
+
+    def window_mean(self):
+        return self.recent_sum / len(self.recent) if self.recent else 0.0
+
+
+def jain_index(values):
+    """ Jain's fairness index of a list of throughputs.
+
+        :param  values  List of throughputs.
+    """
+    if not values:
+        return 0.0
+    square_sum = sum(v * v for v in values)
+    return sum(values) ** 2 / (len(values) * square_sum) if square_sum else 0.0
+
+
+def parse_report(line):
+    """ Parse an `iperf -y C` report line.
+
+        :param  line    String with the CSV line.
+        :return Tuple (interval start, interval end, Mbps), or None if the line is not a report.
+    """
+    fields = line.strip().split(',')
+    if len(fields) < 9:
+        return None
+    try:
+        start, end = (float(v) for v in fields[6].split('-'))
+        return start, end, int(fields[8]) / 1000000
+    except ValueError:
+        return None
+
+
+class LiveMonitor(object):
+    """ Tail the stdout of the iperf clients and keep live throughput and fairness statistics.
+    """
+
+    def __init__(self, port=None, window=10, report_interval=1, dashboard=False, parse=parse_report):
+        """ Create the monitor.
+
+            :param  port            Local TCP port of the JSON endpoint, None to not serve it.
+            :param  window          Number of reports used by the windowed means and the windowed Jain index.
+            :param  report_interval iperf report interval in seconds, used to tell the session summary apart.
+            :param  dashboard       Print a status line to the terminal for every report of the last flow.
+            :param  parse           Function parsing a line of client output into (start, end, Mbps), or None if
+                                    it is not a report (see traffic.py).
+        """
+        self.port = port
+        self.window = window
+        self.report_interval = report_interval
+        self.dashboard = dashboard
+        self.parse = parse
+        self.flows = dict()
+        self.start_time = None
+        self.loop = None
+        self.thread = None
+        self.server = None
+        self.tasks = list()
+        # Callables called as listener(monitor, flow, mbps) after every report (see ConvergenceDetector)
+        self.listeners = list()
+
+    def start(self):
+        """ Start the asyncio loop thread and the JSON endpoint.
+        """
+        self.start_time = time()
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    def _run(self, ready):
+        asyncio.set_event_loop(self.loop)
+        if self.port is not None:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self._serve, '127.0.0.1', self.port))
+            print('*** Live statistics at http://127.0.0.1:{0}/'.format(self.port))
+        ready.set()
+        self.loop.run_forever()
+
+    def attach(self, flow, popen, path):
+        """ Start tailing the stdout of an iperf client. Thread safe.
+
+            :param  flow    Name of the flow, e.g. 'h1-h2'.
+            :param  popen   Popen object of the iperf client, created with stdout=PIPE.
+            :param  path    Data file where the lines are copied to.
+        """
+        self.flows[flow] = FlowStats(self.window)
+        future = asyncio.run_coroutine_threadsafe(self._tail(flow, popen.stdout, path), self.loop)
+        self.tasks.append(future)
+        return future
+
+    async def _tail(self, flow, pipe, path):
+        reader = asyncio.StreamReader()
+        await self.loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+        with open(path, 'w') as data_file:
+            async for raw in reader:
+                line = raw.decode(errors='replace')
+                data_file.write(line)
+                data_file.flush()
+                report = self.parse(line)
+                # The summary of the session spans the whole run, skip it
+                if report is None or report[1] - report[0] > 1.5 * self.report_interval:
+                    continue
+                self.flows[flow].add(report[2], time())
+                for listener in self.listeners:
+                    listener(self, flow, report[2])
+                if self.dashboard and flow == list(self.flows)[-1]:
+                    self.print_status()
+
+    def snapshot(self):
+        """ Return a dictionary with the current statistics of every flow and the windowed Jain index.
+        """
+        flows = dict()
+        for name, stats in list(self.flows.items()):
+            flows[name] = dict(last_mbps=stats.last_mbps, reports=stats.stats.n, mean_mbps=stats.stats.mean,
+                               std_mbps=stats.stats.std(), window_mean_mbps=stats.window_mean())
+        window_means = [f['window_mean_mbps'] for f in flows.values() if f['reports']]
+        return dict(elapsed=time() - self.start_time, window=self.window, flows=flows,
+                    jain_window=jain_index(window_means))
+
+    def print_status(self):
+        snap = self.snapshot()
+        flows = ' '.join('{0}={1:.1f}Mbps'.format(name, f['last_mbps'] or 0) for name, f in snap['flows'].items())
+        print('*** [{0:7.1f}s] {1} jain({2})={3:.4f}'.format(snap['elapsed'], flows, snap['window'],
+                                                              snap['jain_window']))
+
+    async def _serve(self, reader, writer):
+        # Any GET returns the snapshot, the request itself is ignored
+        await reader.readline()
+        body = json.dumps(self.snapshot()).encode()
+        writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: application/json\r\nContent-Length: ' +
+                     str(len(body)).encode() + b'\r\n\r\n' + body)
+        await writer.drain()
+        writer.close()
+
+    def wait(self):
+        """ Wait until all the attached pipes are closed (the iperf clients exited).
+        """
+        for future in self.tasks:
+            future.result()
+
+    def stop(self):
+        """ Stop the JSON endpoint and the loop thread.
+        """
+        if self.server is not None:
+            self.server.close()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+class BatchMeans(object):
+    """ Confidence interval of the mean of an autocorrelated series by the method of batch means.
+
+        Consecutive iperf reports are strongly correlated, so the series is cut in batches of `size` reports and the
+        interval is computed over the (nearly independent) batch means.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.batch_sum = 0.0
+        self.batch_n = 0
+        self.means = RunningStats()
+
+    def add(self, value):
+        self.batch_sum += value
+        self.batch_n += 1
+        if self.batch_n == self.size:
+            self.means.add(self.batch_sum / self.size)
+            self.batch_sum = 0.0
+            self.batch_n = 0
+
+    def half_width(self):
+        """ Half-width of the 95% confidence interval of the mean, infinite with less than two batches.
+        """
+        n = self.means.n
+        if n < 2:
+            return float('inf')
+        t = t95[n - 2] if n - 1 <= len(t95) else 1.96
+        return t * self.means.std() / math.sqrt(n)
+
+    def relative_half_width(self):
+        mean = self.means.mean
+        return self.half_width() / abs(mean) if mean else float('inf')
+
+
+class ConvergenceDetector(object):
+    """ LiveMonitor listener deciding when a test has reached steady state.
+
+        Once every flow reports, the per-flow throughput and the Jain index of the latest reports are accumulated in
+        batch means. The test has converged when the relative half-width of the 95% confidence interval of every
+        per-flow mean and of the Jain index is below `ci_width`, and at least `min_runtime` seconds have passed
+        since the monitor started.
+    """
+
+    def __init__(self, flows, ci_width=0.05, min_runtime=60, batch=10, min_batches=5):
+        """ Create the detector.
+
+            :param  flows       List with the names of all the flows of the test.
+            :param  ci_width    Relative half-width of the confidence intervals to reach.
+            :param  min_runtime Minimum test duration in seconds.
+            :param  batch       Number of reports per batch.
+            :param  min_batches Minimum number of batches before deciding.
+        """
+        self.flows = list(flows)
+        self.ci_width = ci_width
+        self.min_runtime = min_runtime
+        self.min_batches = min_batches
+        self.batches = dict((name, BatchMeans(batch)) for name in self.flows + ['jain'])
+        self.converged = threading.Event()
+
+    def __call__(self, monitor, flow, mbps):
+        # Several detectors share a monitor (one per group of competing flows), each only follows its own flows
+        if flow not in self.flows:
+            return
+        if self.converged.is_set() or any(name not in monitor.flows or not monitor.flows[name].stats.n
+                                          for name in self.flows):
+            return
+
+        self.batches[flow].add(mbps)
+        # One Jain sample per round of reports, when the last flow reports
+        if flow == self.flows[-1]:
+            self.batches['jain'].add(jain_index([monitor.flows[name].last_mbps for name in self.flows]))
+
+        if time() - monitor.start_time < self.min_runtime:
+            return
+        if all(b.means.n >= self.min_batches and b.relative_half_width() <= self.ci_width
+               for b in self.batches.values()):
+            self.converged.set()
+
+    def summary(self):
+        """ Return a dictionary with the mean and relative CI half-width reached for every flow and the Jain index.
+        """
+        return dict((name, dict(mean=b.means.mean, rel_half_width=b.relative_half_width()))
+                    for name, b in self.batches.items())
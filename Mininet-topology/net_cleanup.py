@@ -0,0 +1,85 @@
+##
+# Targeted cleanup of what a previous, interrupted test left behind.
+#
+# Instead of `mn -c` (which probes and kills everything Mininet may ever have created), only the network interfaces
+# and Open vSwitch bridges named like the nodes of DumbbellTopo are looked for. Interfaces are listed from
+# /sys/class/net without running any command, and the stale ones are deleted with a single `ip -batch` call.
+#
+
+import os
+import re
+import subprocess
+
+# Interfaces of the hosts, switches, ROADMs and terminals of DumbbellTopo, with the optional job slot prefix of
+# parallel tests, e.g. s1-eth1, r1-wdm21, t2-wdm2, j3h1-eth0
+link_re = re.compile(r'^(j\d+)?[hsrt]\d+-(eth|wdm)\d+$')
+# Open vSwitch bridges of the packet switches, e.g. s1, j3s4
+bridge_re = re.compile(r'^(j\d+)?s\d+$')
+
+
+def sudo(command):
+    """ Prefix a command with sudo when not running as root.
+    """
+    return command if os.geteuid() == 0 else ['sudo'] + command
+
+
+def stale_links(net_dir='/sys/class/net'):
+    """ Return the names of the existing interfaces created by a previous test.
+    """
+    try:
+        names = os.listdir(net_dir)
+    except OSError:
+        return []
+    return sorted(name for name in names if link_re.match(name))
+
+
+def delete_links(names):
+    """ Delete network interfaces with a single `ip -batch` call. Deleting one end of a veth pair also removes the
+        other end, which is then reported as missing and skipped (-force).
+    """
+    if not names:
+        return
+    commands = ''.join('link delete dev {0}\n'.format(name) for name in names)
+    subprocess.run(sudo(['ip', '-force', '-batch', '-']), input=commands.encode(), stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+
+
+def stale_bridges():
+    """ Return the names of the existing Open vSwitch bridges of a previous test (none if OVS is not running).
+    """
+    try:
+        result = subprocess.run(sudo(['ovs-vsctl', '--timeout=5', 'list-br']), stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+    except OSError:
+        return []
+    return [name for name in result.stdout.decode().split() if bridge_re.match(name)]
+
+
+def delete_bridges(names):
+    """ Delete Open vSwitch bridges with a single ovs-vsctl transaction.
+    """
+    if not names:
+        return
+    command = ['ovs-vsctl', '--timeout=5']
+    for name in names:
+        command += ['--', '--if-exists', 'del-br', name]
+    subprocess.run(sudo(command), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def cleanup_network(full=False):
+    """ Remove the leftovers of a previous test before building a new network.
+
+        :param  full    Run the complete `mn -c` cleanup instead, e.g. after a crash of Mininet itself.
+        :return Dictionary with the number of interfaces and bridges deleted (empty for a full cleanup).
+    """
+    if full:
+        subprocess.run(sudo(['mn', '-c']))
+        return dict()
+    bridges = stale_bridges()
+    delete_bridges(bridges)
+    # Deleting the bridges already removed their internal ports
+    links = stale_links()
+    delete_links(links)
+    if bridges or links:
+        print('*** Removed {0} stale interfaces and {1} stale bridges'.format(len(links), len(bridges)))
+    return dict(links=len(links), bridges=len(bridges))
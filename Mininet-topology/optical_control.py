@@ -0,0 +1,140 @@
+##
+# In-process client for the mnoptical REST server (replaces the curl calls of config-singlelink_r1r2.sh).
+#
+# A lightpath configuration is described as a dictionary:
+#
+#   {'terminals': {'t1': [(ethPort, wdmPort, channel), ...], ...},
+#    'roadms':    {'r1': [(port1, port2, (channel, ...)), ...], ...}}
+#
+# apply_lightpaths() only pushes what changed since the previous call, so it can be called before every test.
+#
+
+import json
+from http.client import HTTPConnection, HTTPException
+from time import time
+from urllib.parse import urlencode
+
+
+class OpticalControl(object):
+    """ Control plane client for the terminals and ROADMs of an OpticalNet.
+
+        All requests go through a single persistent HTTPConnection. If the server closes the connection after a
+        response (HTTP/1.0 servers do), http.client transparently reconnects on the next request.
+    """
+
+    def __init__(self, url='localhost:8080', prefix='', timeout=30):
+        """ Create the client.
+
+            :param  url     host:port of the mnoptical REST server.
+            :param  prefix  Node name prefix of the network (see topo.node_prefix()).
+            :param  timeout Socket timeout in seconds.
+        """
+        host, port = url.split(':')
+        self.conn = HTTPConnection(host, int(port), timeout=timeout)
+        self.prefix = prefix
+        # Configuration pushed so far. None means unknown, e.g. ROADMs must be reset before the first configuration.
+        self.applied = dict(terminals=dict(), roadms=None)
+        # List of (operation, node, seconds) tuples, one per request
+        self.timings = list()
+
+    def request(self, operation, node, **query):
+        """ Send a GET request to the REST server and return its decoded response.
+
+            :param  operation   Path of the request, e.g. 'connect'.
+            :param  node        Node name the request refers to (used for the timings only).
+            :param  query       Query string parameters.
+        """
+        path = '/{0}?{1}'.format(operation, urlencode(query))
+        start = time()
+        for attempt in (1, 2):
+            try:
+                self.conn.request('GET', path)
+                response = self.conn.getresponse()
+                body = response.read().decode()
+                break
+            except (HTTPException, ConnectionError):
+                # Stale keep-alive connection, retry once on a new one
+                self.conn.close()
+                if attempt == 2:
+                    raise
+        self.timings.append((operation, node, time() - start))
+
+        if response.status != 200:
+            raise RuntimeError('{0} {1} failed: {2} {3}'.format(operation, query, response.status, body))
+        try:
+            return json.loads(body)
+        except ValueError:
+            return body
+
+    def connect_terminal(self, node, eth_port, wdm_port, channel):
+        return self.request('connect', node, node=self.prefix + node, ethPort=eth_port, wdmPort=wdm_port,
+                            channel=channel)
+
+    def turn_on(self, node):
+        return self.request('turn_on', node, node=self.prefix + node)
+
+    def reset_roadm(self, node):
+        return self.request('reset', node, node=self.prefix + node)
+
+    def connect_roadm(self, node, port1, port2, channels):
+        return self.request('connect', node, node=self.prefix + node, port1=port1, port2=port2,
+                            channels=','.join(str(c) for c in channels))
+
+    def monitor(self, monitor):
+        """ Return the OSNR/gOSNR/power report of a monitor, e.g. 't1-monitor'.
+        """
+        return self.request('monitor', monitor, monitor=self.prefix + monitor)
+
+    def channel_report(self, monitor, channel):
+        """ Return a dictionary with the 'osnr', 'gosnr' and 'power' of a channel at a monitor.
+
+            Values the monitor does not report are None.
+        """
+        report = self.monitor(monitor)
+        channels = report.get('osnr', dict()) if isinstance(report, dict) else dict()
+        values = channels.get(str(channel), dict())
+        return dict((key, values.get(key)) for key in ('osnr', 'gosnr', 'power'))
+
+    def apply_lightpaths(self, config):
+        """ Push a lightpath configuration, sending only what differs from the configuration applied before.
+
+            Terminal connections are pushed when new or changed, and the changed terminals are turned on again.
+            ROADM cross-connects are only added while the previous ones are kept; if a cross-connect is removed or
+            changed the ROADM is reset and its full set of cross-connects is pushed again.
+
+            :param  config  Lightpath configuration dictionary (see the module description).
+            :return Time in seconds spent configuring.
+        """
+        start = time()
+        previous = self.applied
+
+        changed_terminals = list()
+        for node, connections in sorted(config.get('terminals', dict()).items()):
+            done = previous['terminals'].get(node, list())
+            todo = [c for c in connections if c not in done]
+            for eth_port, wdm_port, channel in todo:
+                self.connect_terminal(node, eth_port, wdm_port, channel)
+            if todo:
+                changed_terminals.append(node)
+
+        applied_roadms = dict() if previous['roadms'] is None else previous['roadms']
+        for node, xconnects in sorted(config.get('roadms', dict()).items()):
+            xconnects = [(p1, p2, tuple(channels)) for p1, p2, channels in xconnects]
+            done = applied_roadms.get(node)
+            if done is None or any(x not in xconnects for x in done):
+                self.reset_roadm(node)
+                done = list()
+            for port1, port2, channels in xconnects:
+                if (port1, port2, channels) not in done:
+                    self.connect_roadm(node, port1, port2, channels)
+            applied_roadms[node] = xconnects
+
+        for node in changed_terminals:
+            self.turn_on(node)
+
+        self.applied = dict(terminals=dict((node, list(c)) for node, c in config.get('terminals', dict()).items()),
+                            roadms=applied_roadms)
+        return time() - start
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,190 @@
+##
+# Physical-layer telemetry of the tests: OSNR, gOSNR and power of every channel, polled from the mnoptical monitors
+# during the whole test.
+#
+# An asyncio loop in a background thread reads all the monitors at every tick, concurrently, through a pool of
+# persistent HTTP connections to the mnoptical REST server (or through any other fetch function, e.g. one reading the
+# monitors in-process). Samples are timestamped with the epoch time of the host, the clock of the iperf reports, and
+# written into preallocated arrays: one time vector per monitor and one samples x channels matrix per metric.
+#
+
+import asyncio
+import json
+import threading
+import numpy as np
+from time import time
+from urllib.parse import urlencode
+
+metrics = ('osnr', 'gosnr', 'power')
+
+
+class HttpPool(object):
+    """ Minimal asyncio HTTP/1.1 GET client keeping its connections open between requests.
+
+        Connections are only reused when the server allows it (HTTP/1.1 with a Content-Length, no Connection: close);
+        otherwise every request opens a new one, as with HTTP/1.0 servers.
+    """
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.idle = list()
+        self.opened = 0
+
+    async def connect(self):
+        self.opened += 1
+        return await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, reader, writer, path):
+        writer.write('GET {0} HTTP/1.1\r\nHost: {1}:{2}\r\n\r\n'.format(path, self.host, self.port).encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by the server')
+        version, status = status_line.split()[:2]
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = headers.get('content-length')
+        body = await (reader.readexactly(int(length)) if length is not None else reader.read())
+        keep = version == b'HTTP/1.1' and length is not None and headers.get('connection', '').lower() != 'close'
+        return int(status), body, keep
+
+    async def get(self, path):
+        """ Send a GET request and return (status, body).
+        """
+        reused = bool(self.idle)
+        reader, writer = self.idle.pop() if reused else await self.connect()
+        try:
+            status, body, keep = await self.request(reader, writer, path)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            if not reused:
+                raise
+            # Stale keep-alive connection, retry once on a new one
+            reader, writer = await self.connect()
+            status, body, keep = await self.request(reader, writer, path)
+        if keep:
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        return status, body
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = list()
+
+
+class TelemetryCollector(object):
+    """ Poll the OSNR, gOSNR and power of the channels at a set of monitors at a fixed rate.
+    """
+
+    def __init__(self, url, monitors, channels, interval=1.0, duration=3600, prefix='', fetch=None):
+        """ Create the collector.
+
+            :param  url         host:port of the mnoptical REST server.
+            :param  monitors    List of monitor names, e.g. ['t1-monitor', 't2-monitor'].
+            :param  channels    List of the channels to record.
+            :param  interval    Time between two reads of the monitors in seconds.
+            :param  duration    Expected duration of the collection in seconds, to size the arrays (they grow if
+                                needed).
+            :param  prefix      Node name prefix of the network (see topo.node_prefix()).
+            :param  fetch       Function returning the report of a monitor (as the REST server's /monitor) from its
+                                full name, run in a worker thread instead of the HTTP requests. None to use the REST
+                                server.
+        """
+        self.url, self.monitors, self.channels = url, list(monitors), list(channels)
+        self.interval, self.prefix, self.fetch = interval, prefix, fetch
+        capacity = int(duration / interval) + 16
+        self.n = dict((monitor, 0) for monitor in self.monitors)
+        self.time = dict((monitor, np.empty(capacity)) for monitor in self.monitors)
+        self.values = dict((monitor, dict((metric, np.full((capacity, len(self.channels)), np.nan, dtype='f4'))
+                                          for metric in metrics)) for monitor in self.monitors)
+        self.errors = 0
+        self.thread = None
+
+    def store(self, monitor, timestamp, report):
+        i = self.n[monitor]
+        if i == len(self.time[monitor]):
+            self.time[monitor] = np.resize(self.time[monitor], 2 * i)
+            for metric, column in self.values[monitor].items():
+                self.values[monitor][metric] = np.vstack((column, np.full_like(column, np.nan)))
+        self.time[monitor][i] = timestamp
+        channels = report.get('osnr', dict()) if isinstance(report, dict) else dict()
+        for j, channel in enumerate(self.channels):
+            values = channels.get(str(channel), dict())
+            for metric in metrics:
+                value = values.get(metric)
+                self.values[monitor][metric][i, j] = np.nan if value is None else value
+        self.n[monitor] = i + 1
+
+    async def sample(self, loop, pool, monitor):
+        start = time()
+        try:
+            if self.fetch is not None:
+                report = await loop.run_in_executor(None, self.fetch, self.prefix + monitor)
+            else:
+                status, body = await pool.get('/monitor?' + urlencode(dict(monitor=self.prefix + monitor)))
+                if status != 200:
+                    raise ValueError('status {0}'.format(status))
+                report = json.loads(body)
+        except (OSError, ValueError, asyncio.IncompleteReadError):
+            self.errors += 1
+            return
+        # Middle of the request, the best estimate of when the monitor was read
+        self.store(monitor, (start + time()) / 2, report)
+
+    async def collect(self):
+        loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.loop = loop
+        self.ready.set()
+        host, port = self.url.split(':')
+        pool = HttpPool(host, int(port))
+        tick = time()
+        while not self.stopped.is_set():
+            await asyncio.gather(*(self.sample(loop, pool, monitor) for monitor in self.monitors))
+            # Ticks missed by slow requests are skipped, not caught up
+            tick = max(tick + self.interval, time())
+            try:
+                await asyncio.wait_for(self.stopped.wait(), tick - time())
+            except asyncio.TimeoutError:
+                pass
+        pool.close()
+        self.connections = pool.opened
+
+    def start(self):
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=asyncio.run, args=(self.collect(),), daemon=True)
+        self.thread.start()
+        self.ready.wait()
+
+    def stop(self):
+        """ Stop collecting and return the samples (see arrays()).
+        """
+        self.loop.call_soon_threadsafe(self.stopped.set)
+        self.thread.join()
+        return self.arrays()
+
+    def arrays(self):
+        """ Return the samples as {monitor: {'time': vector, 'channels': vector, 'osnr'|'gosnr'|'power': samples x
+            channels matrix}}.
+        """
+        result = dict()
+        for monitor in self.monitors:
+            n = self.n[monitor]
+            result[monitor] = dict(time=self.time[monitor][:n].copy(), channels=np.array(self.channels))
+            for metric, column in self.values[monitor].items():
+                result[monitor][metric] = column[:n].copy()
+        return result
+
+    def save(self, path):
+        """ Write the samples to a .npz file, with <monitor>/<name> keys.
+        """
+        arrays = dict(('{0}/{1}'.format(monitor, name), values)
+                      for monitor, columns in self.arrays().items() for name, values in columns.items())
+        np.savez(path, **arrays)
@@ -0,0 +1,104 @@
+##
+# Header-only packet captures on the links of the emulated network during a test, analyzed right after it into
+# per-flow retransmissions, out-of-order segments and RTT samples (see Scripts/pcap_analysis.py).
+#
+# tcpdump keeps the first snaplen bytes of every TCP/IPv4 packet (Ethernet, IP and TCP headers with options), so a
+# capture of a 1Gbps flow grows by about 8MB/s instead of 125MB/s, and the capture itself is light enough to not
+# compete with the flows for the cores. The analysis streams the file in fixed-size chunks and writes compact columns
+# next to the test's other files; the pcap files are deleted afterwards unless they are kept.
+#
+#   capture = PacketCapture([('s1-t1', s1, 's1-eth1')], snaplen=96)
+#   capture.start('reno_10ms', outdir)
+#   ...
+#   summary = capture.stop()
+#
+
+import os
+import re
+import signal
+import sys
+from os.path import dirname, realpath, join
+from subprocess import PIPE, TimeoutExpired
+import numpy as np
+
+sys.path.insert(0, join(dirname(realpath(__file__)), '..', 'Scripts'))
+from pcap_analysis import analyze_pcap
+
+##
+# Globals
+##########
+# Bytes kept of every packet: Ethernet (14), IP (20) and TCP (20 + up to 40 of options) headers
+default_snaplen = 96
+# Kernel buffer of tcpdump in KiB, large enough to not drop packets at the rates of the tests
+buffer_kib = 4096
+# Time to wait for tcpdump to write its buffers and exit in seconds
+stop_timeout = 10
+
+dropped_re = re.compile(r'(\d+) packets? dropped by kernel')
+
+
+class PacketCapture(object):
+    """ tcpdump captures on some interfaces of a network while the flows of a test run.
+    """
+
+    def __init__(self, points, snaplen=default_snaplen, keep=False):
+        """ Create the captures.
+
+            :param  points  List of (name, node, interface name) tuples, one per capture.
+            :param  snaplen Bytes kept of every packet.
+            :param  keep    True to keep the pcap files after their analysis.
+        """
+        self.points, self.snaplen, self.keep = points, snaplen, keep
+        self.popens = dict()
+
+    def start(self, tag, outdir='.'):
+        """ Start capturing into pcap_<tag>_<name>.pcap files.
+        """
+        self.paths = dict((name, os.path.join(outdir, 'pcap_{0}_{1}.pcap'.format(tag, name)))
+                          for name, _, _ in self.points)
+        for name, node, intf in self.points:
+            self.popens[name] = node.popen(['tcpdump', '-i', intf, '-s', str(self.snaplen), '-B', str(buffer_kib),
+                                            '-n', '-w', self.paths[name], 'ip and tcp'], stderr=PIPE)
+        print('*** Capturing {0} bytes of the packets on {1}'.format(self.snaplen, ' '.join(self.paths)))
+
+    def stop(self):
+        """ Stop capturing and analyze the captures (written to the pcap_<tag>_<name>/ directories).
+
+            :return Dictionary with the packets dropped by the kernel before tcpdump read them (capture_kernel_drops)
+                    and, by capture (capture_links), the number of flows, data segments, retransmissions,
+                    out-of-order segments and RTT samples, and the median RTT in ms.
+        """
+        drops = dict()
+        for name, popen in self.popens.items():
+            # tcpdump flushes its file and reports its statistics on stderr on SIGINT
+            popen.send_signal(signal.SIGINT)
+            try:
+                errors = popen.communicate(timeout=stop_timeout)[1]
+            except TimeoutExpired:
+                popen.kill()
+                errors = popen.communicate()[1]
+            if isinstance(errors, bytes):
+                errors = errors.decode(errors='replace')
+            match = dropped_re.search(errors or '')
+            drops[name] = int(match.group(1)) if match else 0
+        self.popens = dict()
+
+        links = dict()
+        for name, path in self.paths.items():
+            if not os.path.exists(path):
+                print('*** No capture written to {0}'.format(path))
+                continue
+            outdir = os.path.splitext(path)[0]
+            flows = analyze_pcap(path, outdir)
+            rtt = np.load(os.path.join(outdir, 'rtt_ms.npy'), mmap_mode='r')
+            links[name] = dict(flows=int((flows['segments'] > 0).sum()), segments=int(flows['segments'].sum()),
+                               retransmissions=int(flows['retransmissions'].sum()),
+                               out_of_order=int(flows['out_of_order'].sum()), rtt_samples=len(rtt),
+                               rtt_median_ms=round(float(np.median(rtt)), 3) if len(rtt) else None,
+                               kernel_drops=drops[name])
+            if not self.keep:
+                os.unlink(path)
+            print('*** Capture {0}: {flows} flows, {segments} segments, {retransmissions} retransmissions, '
+                  '{out_of_order} out of order, median RTT {rtt_median_ms}ms, {kernel_drops} packets dropped by the '
+                  'kernel'.format(name, **links[name]))
+        return dict(capture_kernel_drops=sum(drops.values()), capture_links=links)
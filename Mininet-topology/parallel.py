@@ -0,0 +1,89 @@
+##
+# Parallel sweep executor for the TCP congestion control tests.
+#
+# Every test runs in its own process on its own emulated network. The job slot number given to each test is unique
+# among the running tests, so it can be used to build unique node/interface names and REST server ports.
+#
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from time import sleep, time
+
+
+##
+# Globals
+##########
+# Cores needed by one emulated network: two iperf clients, two iperf servers and the HTB/netem softirq work.
+cores_per_job = 4
+# 1-minute load average per core above which no new test is started
+max_load_per_core = 0.75
+# Time (sec) to wait between two test starts, so that the load average reflects the last started test
+admission_interval = 30
+
+
+def cap_jobs(jobs):
+    """ Cap the number of parallel tests to the number of cores available on the host.
+
+        :param  jobs    Number of parallel tests requested.
+    """
+    cpus = os.cpu_count() or 1
+    capped = max(1, min(jobs, cpus // cores_per_job))
+    if capped < jobs:
+        print('*** Only {0} cores available, running {1} tests at a time instead of {2}'.format(cpus, capped, jobs))
+    return capped
+
+
+def cpu_saturated():
+    """ Check if the host CPU is becoming the bottleneck of the emulation.
+    """
+    return os.getloadavg()[0] / (os.cpu_count() or 1) > max_load_per_core
+
+
+def run_parallel(test, points, jobs):
+    """ Run the tests in a process pool.
+
+        A new test is only started when a job slot is free, the last start was at least `admission_interval` seconds
+        ago and the host load is below `max_load_per_core`. Starting more emulations than the host can handle would
+        make the results CPU-bound instead of network-bound.
+
+        :param  test    Function running a single test. Called as test(*args, job=<slot>, outdir=<outdir>).
+        :param  points  List of (outdir, args) tuples: the output directory of each test and the tuple of its
+                        positional arguments.
+        :param  jobs    Maximum number of tests to run at the same time.
+        :return Dictionary with the output directories of the failed tests as keys and their errors as values.
+    """
+    jobs = cap_jobs(jobs)
+    failed = dict()
+    pending = list(points)
+    running = dict()
+    free_slots = list(range(jobs))
+    last_start = 0
+
+    # Fork so the workers inherit the already imported modules instead of importing topo.py again
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork')) as executor:
+        while pending or running:
+            can_start = pending and free_slots and time() - last_start >= admission_interval
+            if can_start and (not running or not cpu_saturated()):
+                point_dir, args = pending.pop(0)
+                slot = free_slots.pop(0)
+                os.makedirs(point_dir, exist_ok=True)
+                print('*** Starting test {0} in job slot {1}...'.format(point_dir, slot))
+                running[executor.submit(test, *args, job=slot, outdir=point_dir)] = (slot, point_dir)
+                last_start = time()
+                continue
+
+            if not running:
+                sleep(1)
+                continue
+            done, _ = wait(running, timeout=admission_interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                slot, point_dir = running.pop(future)
+                free_slots.append(slot)
+                try:
+                    future.result()
+                    print('*** Test {0} finished'.format(point_dir))
+                except Exception as e:
+                    print('*** Test {0} failed: {1}'.format(point_dir, e))
+                    failed[point_dir] = str(e)
+    return failed
@@ -0,0 +1,183 @@
+##
+# Timing spans around the phases of the test harness (cleanup, topology build, net.start(), REST configuration,
+# flows, net.stop(), parsing, plotting...), exported as Chrome trace events (chrome://tracing, Perfetto).
+#
+#   with span('net.start', delay=delay):
+#       net.start()
+#
+# Tracing is off unless enable() was called: span() then returns a shared no-op context manager, one global lookup
+# and one comparison per phase. When on, a sampler thread records the CPU use and available memory of the host and
+# the memory of the harness as counter events on the same clock (CLOCK_MONOTONIC, shared by all processes, so the
+# spans of tests run in forked workers line up with those of the parent).
+#
+
+import json
+import os
+import resource
+import threading
+from contextlib import nullcontext
+from glob import glob
+from time import monotonic_ns
+from tcp_sampler import host_cpu
+
+# Active Tracer, None when tracing is off
+tracer = None
+_null = nullcontext()
+
+
+def span(name, **args):
+    """ Return a context manager timing a phase, a no-op one when tracing is off.
+
+        :param  name    Name of the phase.
+        :param  args    Values shown with the span, e.g. the algorithm and delay of the test.
+    """
+    if tracer is None:
+        return _null
+    return Span(tracer, name, args)
+
+
+def enable(path, sample_interval=0.5):
+    """ Turn tracing on.
+
+        :param  path            Path of the Chrome trace JSON file written by save().
+        :param  sample_interval Time between two CPU/memory samples in seconds.
+    """
+    global tracer
+    tracer = Tracer(path, sample_interval)
+    tracer.start()
+    return tracer
+
+
+def mark():
+    """ Return the position of the next span and the host CPU counters, to summarize the run from there (see
+        summary()).
+    """
+    return None if tracer is None else (len(tracer.events), host_cpu())
+
+
+def summary(start=None):
+    """ Return the total seconds spent in every phase since a mark(), plus the host CPU use and the peak memory
+        (resident set) of the harness and its children, as a dictionary for the run's result row. Empty when tracing
+        is off.
+    """
+    if tracer is None or start is None:
+        return dict()
+    return tracer.summary(*start)
+
+
+def flush():
+    """ Hand the spans recorded in a forked worker over to the parent process (see Tracer.flush()).
+    """
+    if tracer is not None:
+        tracer.flush()
+
+
+def save():
+    if tracer is not None:
+        tracer.save()
+
+
+class Span(object):
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer, self.name, self.args = tracer, name, args
+
+    def __enter__(self):
+        self.start = monotonic_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end = monotonic_ns()
+        event = dict(name=self.name, ph='X', ts=self.start / 1e3, dur=(end - self.start) / 1e3, pid=os.getpid(),
+                     tid=threading.get_ident() % 100000)
+        if self.args:
+            event['args'] = self.args
+        if exc[0] is not None:
+            event.setdefault('args', dict())['error'] = exc[0].__name__
+        self.tracer.events.append(event)
+        return False
+
+
+class Tracer(object):
+    """ Spans and CPU/memory counters of the harness.
+    """
+
+    def __init__(self, path, sample_interval=0.5):
+        self.path, self.sample_interval = path, sample_interval
+        self.pid = os.getpid()
+        self.events = list()
+        self.flushed = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        os.register_at_fork(after_in_child=self.forked)
+
+    def forked(self):
+        # The spans recorded before the fork belong to the parent
+        self.flushed = len(self.events)
+
+    def start(self):
+        self.thread.start()
+
+    def counters(self):
+        """ Host CPU busy percentage since the previous call, available memory and harness memory in MB.
+        """
+        total, idle = host_cpu()
+        previous, self.last_cpu = getattr(self, 'last_cpu', (total, idle)), (total, idle)
+        busy = 100 * (1 - (idle - previous[1]) / (total - previous[0])) if total > previous[0] else 0.0
+        values = dict(cpu_pct=round(busy, 1))
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    values['mem_available_mb'] = int(line.split()[1]) // 1024
+                    break
+        with open('/proc/self/statm') as statm:
+            values['harness_rss_mb'] = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 2 ** 20
+        return values
+
+    def sample(self):
+        while not self.stopped.wait(self.sample_interval):
+            self.events.append(dict(name='host', ph='C', ts=monotonic_ns() / 1e3, pid=self.pid,
+                                    args=self.counters()))
+
+    def summary(self, start=0, cpu=None):
+        phases = dict()
+        spans = [event for event in self.events[start:] if event['ph'] == 'X']
+        for event in spans:
+            key = 'phase_{0}_s'.format(event['name'].replace('.', '_').replace(' ', '_'))
+            phases[key] = round(phases.get(key, 0.0) + event['dur'] / 1e6, 6)
+        if cpu is not None:
+            total, idle = host_cpu()
+            if total > cpu[0]:
+                phases['host_cpu_pct'] = round(100 * (1 - (idle - cpu[1]) / (total - cpu[0])), 1)
+        # ru_maxrss is in kB on Linux
+        phases['peak_rss_mb'] = max(resource.getrusage(who).ru_maxrss
+                                    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) // 1024
+        return phases
+
+    def flush(self):
+        """ In a forked worker, append the spans recorded since the last flush to a part file next to the trace,
+            merged by the parent's save().
+        """
+        if os.getpid() == self.pid:
+            return
+        with open('{0}.{1}.part'.format(self.path, os.getpid()), 'a') as part:
+            for event in self.events[self.flushed:]:
+                part.write(json.dumps(event) + '\n')
+        self.flushed = len(self.events)
+
+    def save(self):
+        """ Write the Chrome trace of the parent and all the workers.
+        """
+        self.stopped.set()
+        events = list(self.events)
+        for part_path in glob('{0}.*.part'.format(self.path)):
+            with open(part_path) as part:
+                events.extend(json.loads(line) for line in part)
+            os.unlink(part_path)
+        for pid in sorted(set(event['pid'] for event in events)):
+            name = 'topo.py' if pid == self.pid else 'worker {0}'.format(pid)
+            events.append(dict(name='process_name', ph='M', pid=pid, args=dict(name=name)))
+        with open(self.path, 'w') as trace:
+            json.dump(dict(traceEvents=events, displayTimeUnit='ms'), trace)
+        print('*** Trace of {0} spans written to {1}'.format(sum(e['ph'] == 'X' for e in events), self.path))
@@ -0,0 +1,126 @@
+##
+# Manifest of the points of a sweep, to resume interrupted sweeps and extend finished ones.
+#
+# Every point of a sweep (one test) is identified by a content hash of its full parameter set. A point is complete
+# once a run carrying its hash is in the result store. A run and its series are written in a single transaction, so a
+# test interrupted at any moment leaves no partial result and its point is simply run again. Every attempt and its
+# error are recorded in the store as well. Adding delays or algorithms to a finished sweep only adds new hashes, so
+# only the new points run.
+#
+# A planned sweep runs only part of the points: it fits surrogate models to the complete points and runs, batch by
+# batch, those where the best algorithm is most uncertain, up to a budget.
+#
+
+import hashlib
+import json
+import os
+import shutil
+from result_store import open_store, completed_points, record_attempt, find_runs, load_series
+from fairness_metrics import run_metrics
+from sweep_planner import FEATURES, SweepModel, plan, decision_map
+
+
+def point_key(params):
+    """ Return the content hash of the parameter set of a sweep point.
+
+        :param  params  Dictionary with all the parameters that change the result of the test. Key order does not
+                        matter.
+    """
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def run_sweep(points, run_points, store, retries=2):
+    """ Run the points of a sweep that are not complete yet, retrying the failed ones.
+
+        :param  points      List of dictionaries with the 'key' (see point_key()), 'params' and 'outdir' of every
+                            point, plus anything run_points needs.
+        :param  run_points  Function running a list of points, returning a dictionary with the keys of the points
+                            that raised an exception as keys and the errors as values.
+        :param  store       Path of the SQLite result store the runs are recorded in.
+        :param  retries     Number of times a failed point is run again.
+        :return List of the points still not complete.
+    """
+    conn = open_store(store)
+    done = completed_points(conn)
+    pending = [point for point in points if point['key'] not in done]
+    print('*** Sweep of {0} points: {1} already complete, {2} to run'
+          .format(len(points), len(points) - len(pending), len(pending)))
+
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        if attempt:
+            print('*** Retrying {0} failed points (retry {1} of {2})...'.format(len(pending), attempt, retries))
+        # Remove what a previous, unfinished attempt left in the point directory
+        for point in pending:
+            if os.path.exists(point['outdir']):
+                shutil.rmtree(point['outdir'])
+            os.makedirs(point['outdir'])
+
+        errors = run_points(pending)
+        done = completed_points(conn)
+        for point in pending:
+            error = None if point['key'] in done else errors.get(point['key'], 'no run recorded')
+            record_attempt(conn, point['key'], point['params'], error)
+        pending = [point for point in pending if point['key'] not in done]
+
+    for point in pending:
+        print('*** Point {0} ({1}) failed after {2} attempts'.format(point['key'], point['outdir'], retries + 1))
+    conn.close()
+    return pending
+
+
+def run_planned_sweep(points, run_points, store, features, budget, batch=4, retries=2, objective='throughput',
+                      capacity_mbps=96, n_flows=2):
+    """ Run the points of a sweep chosen by an adaptive planner, up to a budget of runs, instead of all of them.
+
+        Before every batch, surrogate models of the throughput and Jain index of every algorithm are fitted to the
+        complete points of the sweep, and the next points are those where the predicted best algorithm is most
+        uncertain (see ../Scripts/sweep_planner.plan()).
+
+        :param  points      List of sweep points (see run_sweep()).
+        :param  run_points  Function running a list of points (see run_sweep()).
+        :param  store       Path of the SQLite result store the runs are recorded in.
+        :param  features    Function returning the algorithm and the model axes (sweep_planner.FEATURES) of a point.
+        :param  budget      Maximum number of points to run.
+        :param  batch       Number of points chosen and run at a time.
+        :param  retries     Number of times a failed point is run again.
+        :param  objective   'throughput', 'jain' or 'mix', the metric ranking the algorithms.
+        :param  capacity_mbps   Bottleneck capacity, the bound of the analytical throughput prior.
+        :param  n_flows     Number of competing flows of every test.
+        :return List of the decision map rows (see sweep_planner.decision_map()) of the final models.
+    """
+    by_key = dict((point['key'], point) for point in points)
+    algorithms = sorted(set(features(point)['algorithm'] for point in points))
+    conn = open_store(store)
+    spent = 0
+    while True:
+        done = completed_points(conn)
+        observations = list()
+        keys = list(done & set(by_key))
+        for run in find_runs(conn, point_key=keys) if keys else list():
+            metrics = run_metrics(load_series(conn, run['id']))
+            if metrics is not None:
+                observations.append(dict(features(by_key[run['point_key']]), throughput=metrics[0], jain=metrics[1]))
+        rows = [features(point) for point in points]
+        configs = sorted(set(tuple(row[name] for name in FEATURES) for row in rows))
+        model = SweepModel(observations, algorithms, configs, capacity_mbps, n_flows)
+        pending = [dict(row, index=i) for i, row in enumerate(rows) if points[i]['key'] not in done]
+        if spent >= budget or not pending:
+            break
+
+        chosen = plan(model, pending, min(batch, budget - spent), objective)
+        print('*** Planner: {0} of {1} points complete, next {2}: {3}'.format(
+            len(points) - len(pending), len(points), len(chosen),
+            ', '.join('{0} {1}'.format(points[c['index']]['outdir'], round(c['score'], 3)) for c in chosen)))
+        run_sweep([points[c['index']] for c in chosen], run_points, store, retries)
+        spent += len(chosen)
+    conn.close()
+
+    decisions = decision_map(model, configs, objective)
+    for row in decisions:
+        print('*** {0}: best {1} (then {2}, P(swapped) {3:.2f})'.format(
+            ', '.join('{0}={1:g}'.format(name, row[name]) for name in FEATURES), row['best'], row['second'],
+            row['swapped']))
+    return decisions
@@ -0,0 +1,221 @@
+##
+# Declarative sweep specifications: the axes, fixed parameters and constraints of a sweep in a JSON file, expanded
+# into a deduplicated list of tests, ordered so that the network is rebuilt as rarely as possible.
+#
+#   {
+#     "fixed": {"iperf_runtime": 600, "iperf_delayed_start": 150, "pairs": 2, "channels": [2]},
+#     "axes": {"algorithm": ["reno", "cubic", "bbr"], "delay_ms": [10, 50, 100],
+#              "span_km": [5, 25, 50], "n_spans": [1, 2], "amp_gains_db": ["none", "auto"]},
+#     "constraints": ["span_km * n_spans <= 50", "amp_gains_db != 'none' or span_km < 50"],
+#     "repetitions": 2,
+#     "mode": "warm"
+#   }
+#
+# Every parameter (see parameters) can be fixed or swept. Constraints are Python expressions over the parameters of a
+# test, which is dropped when one of them is false. Tests are compared once their parameters are resolved (e.g. 'auto'
+# in-line amplifier gains for 25km spans and an explicit 5.5dB gain), so equivalent combinations only run once.
+#
+# Tests are grouped by physical configuration (optical layer, link bandwidths and queues, pairs and channels): in warm
+# mode every group is one network, only reconfigured between its tests (delays in increasing order, then the
+# algorithms), and in cold mode the groups still follow each other so that the OSNR of a configuration is read once.
+#
+
+import json
+import statistics
+from itertools import product
+from sweep_manifest import point_key
+
+# Parameters of a test, by part of the test they belong to
+parameters = dict(
+    test=('algorithm', 'delay_ms', 'iperf_runtime', 'iperf_delayed_start'),
+    optical=('span_km', 'n_spans', 'boost_gain_db', 'amp_gains_db', 'launch_power_dbm'),
+    layout=('pairs', 'channels', 'flow_channels'),
+    # Bandwidth (Mbps) and queue size (packets per ms of one-way delay) of the backbone, access router and host links
+    links=('backbone_bw', 'backbone_queue', 'access_bw', 'access_queue', 'host_bw', 'host_queue'))
+# Time (sec) taken by the steps of a sweep when the result store has no phase timings yet (see phase_trace)
+default_costs = dict(build=30.0, osnr_read=10.0, stop=10.0, set_delay=1.0, set_cca=0.5, process=5.0)
+# Functions available to the constraints
+constraint_builtins = dict(abs=abs, min=min, max=max, len=len, round=round)
+
+
+def amp_gains(amp, span_km, n_spans):
+    """ Return the in-line amplifier gains of a WDM link.
+
+        :param  amp     'none' for no in-line amplifiers, 'auto' to compensate the span loss (0.22 dB/km), a gain in
+                        dB for every amplifier, or the list of gains.
+        :param  span_km Span length in km.
+        :param  n_spans Number of spans of the link.
+    """
+    if isinstance(amp, (list, tuple)):
+        return [float(gain) for gain in amp]
+    if amp == 'none':
+        return []
+    if amp == 'auto':
+        return [round(span_km*.22, 3)]*n_spans
+    return [float(amp)]*n_spans
+
+
+def load_spec(path):
+    """ Read a sweep specification and check its parameter names.
+
+        :param  path    Path of the JSON specification.
+    """
+    with open(path) as spec_file:
+        spec = json.load(spec_file)
+    known = set(name for names in parameters.values() for name in names)
+    unknown = set(spec) - {'fixed', 'axes', 'constraints', 'repetitions', 'mode'}
+    if unknown:
+        raise ValueError('Unknown sections in {0}: {1}'.format(path, sorted(unknown)))
+    for section in ('fixed', 'axes'):
+        unknown = set(spec.get(section, dict())) - known
+        if unknown:
+            raise ValueError('Unknown parameters in {0} of {1}: {2}'.format(section, path, sorted(unknown)))
+    for name, values in spec.get('axes', dict()).items():
+        if not isinstance(values, list) or not values:
+            raise ValueError('Axis {0} of {1} needs a non-empty list of values'.format(name, path))
+    if spec.get('mode', 'warm') not in ('warm', 'cold'):
+        raise ValueError("The mode of {0} is 'warm' or 'cold'".format(path))
+    return spec
+
+
+def check(text, code, values):
+    try:
+        return bool(eval(code, dict(__builtins__=constraint_builtins), dict(values)))
+    except Exception as e:
+        raise ValueError('Constraint {0!r} failed on {1}: {2}'.format(text, values, e))
+
+
+def expand(spec, defaults, make_layout):
+    """ Expand a sweep specification into its list of tests, without the combinations rejected by the constraints
+        and the duplicates.
+
+        :param  spec        Specification (see load_spec()).
+        :param  defaults    Dictionary with the value of every parameter not given by the specification.
+        :param  make_layout Function returning the layout of the network from the pairs, channels and channels of the
+                            pairs (see topo.make_layout()).
+        :return Tuple with the list of tests, each a dictionary with the test parameters plus its 'optical', 'layout'
+                and 'links' dictionaries, its 'repetition' and its 'key' (see sweep_manifest.point_key()), and a
+                dictionary with the number of combinations, rejected combinations and duplicates.
+    """
+    axes = spec.get('axes', dict())
+    constraints = [(text, compile(text, '<constraint>', 'eval')) for text in spec.get('constraints', list())]
+    base = dict(defaults, **spec.get('fixed', dict()))
+    tests, seen = list(), set()
+    counts = dict(combinations=0, rejected=0, duplicates=0)
+    for combination in product(*axes.values()):
+        values = dict(base, **dict(zip(axes, combination)))
+        counts['combinations'] += 1
+        if not all(check(text, code, values) for text, code in constraints):
+            counts['rejected'] += 1
+            continue
+        optical = dict((name, values[name]) for name in parameters['optical'])
+        optical['amp_gains_db'] = amp_gains(values['amp_gains_db'], values['span_km'], values['n_spans'])
+        test = dict((name, values[name]) for name in parameters['test'])
+        test.update(optical=optical, layout=make_layout(values['pairs'], values['channels'], values['flow_channels']),
+                    links=dict((name, values[name]) for name in parameters['links']))
+        for repetition in range(spec.get('repetitions', 1)):
+            key = point_key(dict(test, repetition=repetition))
+            if key in seen:
+                counts['duplicates'] += 1
+                continue
+            seen.add(key)
+            tests.append(dict(test, repetition=repetition, key=key))
+    return tests, counts
+
+
+def physical_key(test):
+    """ Return the canonical JSON of what changing needs a new network: optical layer, links and layout.
+    """
+    return json.dumps([test['optical'], test['links'], test['layout']], sort_keys=True)
+
+
+def order(tests):
+    """ Group the tests by physical configuration and order them to minimize the expensive transitions.
+
+        Groups sharing an optical configuration follow each other (its OSNR is then read only once) and the
+        repetitions of a configuration are consecutive groups. Within a group the tests are sorted by delay, so the
+        links are reconfigured once per delay, then by algorithm in the order of the specification.
+
+        :param  tests   List of tests (see expand()).
+        :return List of groups, each a dictionary with its 'optical', 'links', 'layout', 'repetition' and 'tests'.
+    """
+    algorithms = list()
+    for test in tests:
+        if test['algorithm'] not in algorithms:
+            algorithms.append(test['algorithm'])
+    groups = dict()
+    for test in tests:
+        groups.setdefault((physical_key(test), test['repetition']), list()).append(test)
+    ordered = list()
+    for (_, repetition), members in sorted(groups.items()):
+        members.sort(key=lambda test: (test['delay_ms'], algorithms.index(test['algorithm'])))
+        first = members[0]
+        ordered.append(dict(optical=first['optical'], links=first['links'], layout=first['layout'],
+                            repetition=repetition, tests=members))
+    return ordered
+
+
+def measured_costs(conn):
+    """ Return the median time of every step of a sweep (see default_costs) in the phase timings recorded with the
+        runs of a result store (see phase_trace.summary()), the default for the steps never timed.
+
+        :param  conn    Connection to the result store (see result_store.open_store()).
+    """
+    # The store phase ends after the run is recorded, so it is never part of the recorded timings
+    steps = dict(build=('build_topo', 'net_start', 'rest_config'), osnr_read=('osnr_read',),
+                 stop=('stop_servers', 'net_stop'), set_delay=('set_delay',), set_cca=('set_cca',),
+                 process=('parse_iperf_data', 'draw_fairness_plot'))
+    samples = dict((step, list()) for step in steps)
+    for row in conn.execute('SELECT params FROM runs'):
+        params = json.loads(row[0])
+        for step, phases in steps.items():
+            keys = ['phase_{0}_s'.format(phase) for phase in phases]
+            if any(key in params for key in keys):
+                samples[step].append(sum(params.get(key, 0.0) for key in keys))
+    return dict((step, statistics.median(values) if values else default_costs[step])
+                for step, values in samples.items())
+
+
+def estimate(groups, costs=None, mode='warm', jobs=1, admission_interval=0):
+    """ Return the estimated wall-clock time of a sweep.
+
+        :param  groups              Ordered groups of tests (see order()).
+        :param  costs               Dictionary with the time of every step (see default_costs and measured_costs()).
+        :param  mode                'warm' to build one network per group, 'cold' to build one per test.
+        :param  jobs                Number of tests run at the same time in cold mode.
+        :param  admission_interval  Minimum time between two test starts in parallel (see parallel.run_parallel()).
+        :return Dictionary with the total time in seconds and the number of tests, network builds, OSNR reads and
+                delay changes.
+    """
+    costs = dict(default_costs, **(costs or dict()))
+    result = dict(tests=0, builds=0, osnr_reads=0, delay_changes=0, total_s=0.0)
+    read = set()
+    for group in groups:
+        tests = group['tests']
+        optical = json.dumps(group['optical'], sort_keys=True)
+        osnr = 0.0 if optical in read else costs['osnr_read']
+        read.add(optical)
+        flows = sum(test['iperf_runtime'] + test['iperf_delayed_start'] for test in tests)
+        if mode == 'warm':
+            # A delay change in the middle of a group reconfigures the links of the running network
+            delay_changes = len(set(test['delay_ms'] for test in tests)) - 1
+            result['builds'] += 1
+            result['delay_changes'] += delay_changes
+            result['total_s'] += costs['build'] + osnr + flows + delay_changes * costs['set_delay'] \
+                + len(tests) * (costs['set_cca'] + costs['process']) + costs['stop']
+        else:
+            # The tests of a group run in parallel, the groups one after the other
+            slots = min(jobs, len(tests))
+            busy = flows + len(tests) * (costs['build'] + costs['stop'] + costs['process'])
+            result['builds'] += len(tests)
+            result['total_s'] += osnr + max(busy / slots, admission_interval * (slots - 1) + busy / len(tests))
+        result['tests'] += len(tests)
+        result['osnr_reads'] += osnr > 0
+    return result
+
+
+def format_duration(seconds):
+    """ Format a duration as h:mm:ss.
+    """
+    seconds = int(round(seconds))
+    return '{0}:{1:02d}:{2:02d}'.format(seconds // 3600, seconds // 60 % 60, seconds % 60)
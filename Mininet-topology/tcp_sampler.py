@@ -0,0 +1,194 @@
+##
+# High-frequency sampler of the kernel TCP state (cwnd, RTT, retransmissions) of the iperf flows.
+#
+# One shell loop per sending host runs `ss -tin` in the host's namespace every `interval` seconds. A reader thread
+# parses its output straight into preallocated NumPy ring buffers, which are written to a single .npz file at the end
+# of the test. The CPU time used by the loops (ss and sleep included) and by the reader threads is measured, so the
+# cost of sampling can be told apart from effects on the emulated network.
+#
+
+import os
+import re
+import threading
+import numpy as np
+from time import time, thread_time
+
+# Columns of the samples and their types. time is the epoch time of the ss call, retrans the total number of
+# retransmitted segments of the connection, rtt/rttvar are in ms. Values ss does not report are -1.
+sample_columns = [('time', 'f8'), ('host', 'i2'), ('sport', 'i4'), ('cwnd', 'i4'), ('ssthresh', 'i4'),
+                  ('rtt_ms', 'f4'), ('rttvar_ms', 'f4'), ('retrans', 'i4'), ('unacked', 'i4'), ('lost', 'i4')]
+
+# One `ss` call per interval. $EPOCHREALTIME (bash >= 5) timestamps the call without forking date.
+sampler_script = 'while :; do echo "T $EPOCHREALTIME"; ss -tinH state established "( {filter} )"; ' \
+                 'sleep {interval}; done'
+
+info_re = re.compile(r'\b(cwnd|ssthresh|rtt|retrans|unacked|lost):([\d.]+)(?:/([\d.]+))?')
+clock_ticks = os.sysconf('SC_CLK_TCK')
+
+
+class SampleRing(object):
+    """ Fixed-size ring buffer of TCP samples, one preallocated array per column.
+
+        When full, the oldest samples are overwritten and counted in `overwritten`.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.columns = dict((name, np.full(capacity, -1, dtype=kind)) for name, kind in sample_columns)
+        self.n = 0
+
+    def add(self, values):
+        """ Store one sample.
+
+            :param  values  Dictionary with the values of the sample, missing columns are stored as -1.
+        """
+        i = self.n % self.capacity
+        for name, column in self.columns.items():
+            column[i] = values.get(name, -1)
+        self.n += 1
+
+    @property
+    def overwritten(self):
+        return max(0, self.n - self.capacity)
+
+    def arrays(self):
+        """ Return the stored samples in time order as a dictionary of arrays.
+        """
+        if self.n <= self.capacity:
+            return dict((name, column[:self.n].copy()) for name, column in self.columns.items())
+        i = self.n % self.capacity
+        return dict((name, np.concatenate((column[i:], column[:i]))) for name, column in self.columns.items())
+
+
+def parse_info(line):
+    """ Parse the info line of a socket printed by `ss -i`.
+
+        :return Dictionary with the sample columns found in the line.
+    """
+    values = dict()
+    for key, first, second in info_re.findall(line):
+        if key == 'rtt':
+            values['rtt_ms'] = float(first)
+            values['rttvar_ms'] = float(second) if second else -1
+        elif key == 'retrans':
+            # retrans:<currently unacknowledged retransmits>/<total retransmits>
+            values['retrans'] = int(second) if second else int(first)
+        else:
+            values[key] = int(float(first))
+    return values
+
+
+def process_cpu(pid):
+    """ CPU seconds used by a process and its exited (waited for) children, from /proc/<pid>/stat.
+    """
+    try:
+        with open('/proc/{0}/stat'.format(pid)) as stat:
+            fields = stat.read().rsplit(')', 1)[1].split()
+    except OSError:
+        return 0.0
+    # utime, stime, cutime, cstime are fields 14-17, counted from the state field (3)
+    return sum(int(v) for v in fields[11:15]) / clock_ticks
+
+
+def host_cpu():
+    """ Total and idle CPU seconds of the emulation host since boot, from /proc/stat.
+    """
+    with open('/proc/stat') as stat:
+        fields = [int(v) for v in stat.readline().split()[1:]]
+    return sum(fields) / clock_ticks, (fields[3] + fields[4]) / clock_ticks
+
+
+class TcpSampler(object):
+    """ Sample the TCP state of the connections of some hosts to a server port.
+    """
+
+    def __init__(self, hosts, interval=0.01, port=5001, duration=1000):
+        """ Create the sampler.
+
+            :param  hosts       Dictionary with the names of the sending hosts as keys and the hosts as values.
+            :param  interval    Sampling interval in seconds.
+            :param  port        Server port of the connections to sample, or (first, last) range of server ports.
+            :param  duration    Expected sampling duration in seconds, used to size the ring buffer.
+        """
+        self.hosts = hosts
+        self.names = sorted(hosts)
+        self.interval = interval
+        self.port = port
+        # Every sending host has one data connection (iperf -c) and may briefly have its control connection
+        self.ring = SampleRing(int(2 * len(hosts) * (duration / interval + 1)))
+        self.lock = threading.Lock()
+        self.popens = dict()
+        self.threads = list()
+        self.reader_cpu = dict()
+        self.start_cpu = None
+        self.start_time = None
+
+    def start(self):
+        self.start_cpu = host_cpu()
+        self.start_time = time()
+        if isinstance(self.port, int):
+            ports = 'dport = :{0}'.format(self.port)
+        else:
+            ports = 'dport >= :{0} and dport <= :{1}'.format(*self.port)
+        script = sampler_script.format(filter=ports, interval=self.interval)
+        for index, name in enumerate(self.names):
+            popen = self.hosts[name].popen(['bash', '-c', script])
+            self.popens[name] = popen
+            thread = threading.Thread(target=self._read, args=(name, index, popen.stdout), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _read(self, name, index, pipe):
+        start_cpu = thread_time()
+        stamp = None
+        sport = None
+        for raw in pipe:
+            line = raw.decode(errors='replace')
+            if line.startswith('T '):
+                stamp = float(line[2:])
+            elif not line[:1].isspace():
+                # Socket line: recv-q send-q local:port peer:port (no state column with a state filter)
+                fields = line.split()
+                sport = int(fields[2].rsplit(':', 1)[1]) if len(fields) > 2 else None
+            elif sport is not None and stamp is not None:
+                values = parse_info(line)
+                values.update(time=stamp, host=index, sport=sport)
+                with self.lock:
+                    self.ring.add(values)
+                sport = None
+        self.reader_cpu[name] = thread_time() - start_cpu
+
+    def stop(self):
+        """ Stop the sampling loops and return the overhead of sampling.
+
+            :return Dictionary with the CPU seconds used by the sampling loops (sampler_cpu_s) and reader threads
+                    (sampler_reader_cpu_s), their share of one core (sampler_core_pct) and of the whole host
+                    (sampler_host_pct) during the test, and the number of samples.
+        """
+        loop_cpu = sum(process_cpu(popen.pid) for popen in self.popens.values())
+        for popen in self.popens.values():
+            popen.terminate()
+        for popen in self.popens.values():
+            popen.wait()
+        for thread in self.threads:
+            thread.join()
+
+        elapsed = time() - self.start_time
+        total, idle = host_cpu()
+        host_busy = (total - self.start_cpu[0]) - (idle - self.start_cpu[1])
+        reader_cpu = sum(self.reader_cpu.values())
+        used = loop_cpu + reader_cpu
+        return dict(sampler_interval_s=self.interval, sampler_samples=self.ring.n,
+                    sampler_overwritten=self.ring.overwritten, sampler_cpu_s=loop_cpu,
+                    sampler_reader_cpu_s=reader_cpu, sampler_core_pct=100 * used / elapsed if elapsed else 0.0,
+                    sampler_host_pct=100 * used / (total - self.start_cpu[0]) if total > self.start_cpu[0] else 0.0,
+                    host_busy_pct=100 * host_busy / (total - self.start_cpu[0]) if total > self.start_cpu[0] else 0.0)
+
+    def save(self, path, overhead=None):
+        """ Write the samples (and the overhead of sampling) to a columnar .npz file.
+        """
+        arrays = self.ring.arrays()
+        arrays['hosts'] = np.array(self.names)
+        for key, value in (overhead or dict()).items():
+            arrays[key] = np.array(value)
+        np.savez(path, **arrays)
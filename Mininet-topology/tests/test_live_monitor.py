@@ -0,0 +1,45 @@
+##
+# ConvergenceDetector with several groups of competing flows sharing one LiveMonitor, as in multiplexed adaptive
+# tests (one group per wavelength).
+#
+
+import os
+import sys
+from time import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+from live_monitor import LiveMonitor, FlowStats, ConvergenceDetector
+
+
+def report(monitor, flow, mbps):
+    """ Feed a report to the monitor the way its tail task does.
+    """
+    if flow not in monitor.flows:
+        monitor.flows[flow] = FlowStats(monitor.window)
+    monitor.flows[flow].add(mbps, time())
+    for listener in monitor.listeners:
+        listener(monitor, flow, mbps)
+
+
+def test_groups_converge_independently():
+    monitor = LiveMonitor()
+    monitor.start_time = time() - 3600
+    steady = ConvergenceDetector(['h1-h2', 'h3-h4'], min_runtime=0, batch=5)
+    noisy = ConvergenceDetector(['h5-h6', 'h7-h8'], min_runtime=0, batch=5)
+    monitor.listeners += [steady, noisy]
+
+    # Interleaved reports: the first group is stable, the second swings between two rates
+    for i in range(100):
+        report(monitor, 'h1-h2', 40 + 0.1 * (i % 3))
+        report(monitor, 'h5-h6', 10 if i % 10 < 5 else 90)
+        report(monitor, 'h3-h4', 45 + 0.1 * (i % 2))
+        report(monitor, 'h7-h8', 90 if i % 10 < 5 else 10)
+    assert steady.converged.is_set()
+    assert not noisy.converged.is_set()
+    assert set(steady.batches) == {'h1-h2', 'h3-h4', 'jain'}
+
+    # The second group converges on its own once it settles
+    for i in range(2000):
+        report(monitor, 'h5-h6', 50 + 0.1 * (i % 3))
+        report(monitor, 'h7-h8', 48 + 0.1 * (i % 2))
+    assert noisy.converged.is_set()
@@ -3,13 +3,10 @@
 #
 
 import argparse
-from time import sleep, mktime
-import subprocess
-import csv
-from datetime import datetime
-import matplotlib
-matplotlib.use('Agg')   # Force matplotlib to not use any Xwindows backend.
-import matplotlib.pyplot as plt
+import json
+from itertools import product
+from time import time
+import sys
 from mininet.topo import Topo
 from mininet.net import Mininet
 from mininet.link import TCLink
@@ -30,19 +27,26 @@ from subprocess import run
 from sys import argv
 import os
 
-
-os.system("sudo mn -c")
-
-interfaces = ["r1-wdm1", "r1-wdm2","r1-wdm3","r1-wdm4","r1-wdm5","r1-wdm6","r1-wdm7","r1-wdm8","r1-wdm9","r1-wdm10",
-"r1-wdm21", "r1-wdm22","r1-wdm23","r1-wdm24","r1-wdm25","r1-wdm26","r1-wdm27","r1-wdm28","r1-wdm29","r1-wdm30",
-"r2-wdm11", "r2-wdm12","r2-wdm13","r2-wdm14","r2-wdm15","r2-wdm16","r2-wdm17","r2-wdm18","r2-wdm19","r2-wdm20",
-"r2-wdm21", "r2-wdm22","r2-wdm23","r2-wdm24","r2-wdm25","r2-wdm26","r2-wdm27","r2-wdm28","r2-wdm29","r2-wdm20", "s1-eth1",
-"s1-eth2","s2-eth1","s2-eth2","s3-eth1","s4-eth1","t1-wdm1","t2-wdm2","t3-wdm3","t4-wdm4","t5-wdm5","t6-wdm6","t7-wdm7",
-"t8-wdm8","t9-wdm9","t10-wdm10","t11-wdm11","t12-wdm12","t13-wdm13","t14-wdm14","t15-wdm15","t16-wdm16","t17-wdm17","t18-wdm18","t19-wdm19",
-"t20-wdm20","h1-eth0","t1-eth1"]
-
-for interface in interfaces:
-    subprocess.run(["sudo","ip","link","delete", interface])
+# Analysis code shared with the scripts in ../Scripts
+sys.path.insert(0, join(dirname(realpath(__file__)), '..', 'Scripts'))
+from iperf_loader import load_iperf
+from result_store import open_store, add_run, find_optical, add_optical, completed_points
+from live_monitor import LiveMonitor, ConvergenceDetector
+from tcp_sampler import TcpSampler
+from traffic import Iperf2, base_port, make_generator
+from optical_telemetry import TelemetryCollector
+import fidelity
+from fidelity import FidelityWatchdog
+from packet_capture import PacketCapture, default_snaplen
+from flow_scheduler import FlowScheduler, schedule_end, load_schedule, poisson_schedule
+from optical_control import OpticalControl
+from parallel import run_parallel, admission_interval
+from sweep_manifest import point_key, run_sweep, run_planned_sweep
+from sweep_planner import estimate_osnr
+import sweep_spec
+from net_cleanup import cleanup_network
+import phase_trace
+from phase_trace import span
 
 
 ##
@@ -51,8 +55,148 @@ for interface in interfaces:
 # time (sec), cwnd (MSS)
 #tcpprobe_csv_header = ['time', 'src_addr_port', 'dst_addr_port', 'bytes', 'next_seq', 'unacknowledged', 'cwnd',
 #                       'slow_start', 'swnd', 'smoothedRTT', 'rwnd']
-# time (YYYYMMDDHHMMSS), interval (S.S-S.S), bps (bps)
-iperf_csv_header = ['time', 'src_addr', 'src_port', 'dst_addr' ,'dst_port', 'other', 'interval', 'B_sent', 'bps']
+# Port of the mnoptical REST server. Parallel jobs use rest_port + job.
+rest_port = 8080
+# Optical layer parameters: span length (km) and number of spans of every WDM link, boost amplifier gain (dB),
+# in-line amplifier gains (dB) and transceiver launch power (dBm)
+optical_params = dict(span_km=5, n_spans=1, boost_gain_db=3.0, amp_gains_db=[], launch_power_dbm=0)
+# Bandwidth (Mbps) and queue size (packets per ms of one-way delay) of the backbone, access router and host links
+link_config = dict(backbone_bw=192, backbone_queue=16, access_bw=96, access_queue=1.6, host_bw=180, host_queue=15)
+# Number of sender/receiver pairs, WDM channels of the lightpaths between t1 and t2, and channel of every pair
+wdm_layout = dict(pairs=2, channels=[2], flow_channels=[2, 2])
+# OSNR/gOSNR/power already measured, by canonical JSON of the optical configuration
+osnr_cache = dict()
+# Traffic generator of the test flows and its report interval (see traffic.py)
+traffic = Iperf2()
+# Optical telemetry during the tests: poll interval (sec, None to not collect it) and monitors read
+telemetry_params = dict(interval=None, monitors=['t1-monitor', 't2-monitor'])
+# Emulation fidelity watchdog (see fidelity.py): watch the cores during the tests, sample interval (sec), pin the
+# processes to dedicated cores, and number of times a test run on a saturated emulator is run again
+fidelity_params = dict(watch=False, interval=1.0, pin=False, reruns=0)
+# Header-only packet captures during the tests (see packet_capture.py): bytes kept of every packet (None to not
+# capture) and whether the pcap files are kept after their analysis
+capture_params = dict(snaplen=None, keep=False)
+
+
+def node_prefix(job):
+    """ Return the node name prefix for the given job slot ('' when not running in parallel).
+
+        :param  job Job slot number or None.
+    """
+    return '' if job is None else 'j{0}'.format(job)
+
+
+def switch_opts(job, number):
+    """ Return the extra addSwitch() options for packet switch s<number> of the given job slot.
+
+        Mininet derives the DPID from the first number in the switch name, so 'j3s1' and 'j3s2' would collide. Parallel
+        jobs get an explicit DPID made of the job slot and the switch number instead.
+
+        :param  job     Job slot number or None.
+        :param  number  Switch number (1..4).
+    """
+    return dict() if job is None else dict(dpid='{0:012x}{1:04x}'.format(job + 1, number))
+
+
+def optical_spans(optical, link, prefix=''):
+    """ Return the mnoptical spans list of a WDM link: n_spans fiber spans of span_km, each followed by an in-line
+        amplifier when amplifier gains are given.
+
+        :param  optical Dictionary with the optical layer parameters (see optical_params).
+        :param  link    Name of the link, used to give its amplifiers unique names.
+        :param  prefix  Node name prefix of the network.
+    """
+    spans = list()
+    gains = optical['amp_gains_db']
+    for i in range(optical['n_spans']):
+        spans.append(optical['span_km']*km)
+        if i < len(gains):
+            spans.append(('{0}{1}-amp{2}'.format(prefix, link, i + 1), {'target_gain': gains[i]*dB}))
+    return spans
+
+
+def make_layout(pairs, channels, flow_channels=None):
+    """ Return the layout of the network: number of sender/receiver pairs, WDM channels, and channel of each pair.
+
+        Pair i is made of hosts h<2i-1> (sender) and h<2i> (receiver). Every channel carries its own packet domain
+        (see DumbbellTopo), and each pair is pinned to one channel.
+
+        :param  pairs           Number of sender/receiver pairs.
+        :param  channels        List of WDM channel numbers.
+        :param  flow_channels   List with the channel of each pair. Pairs are spread round robin over the channels by
+                                default.
+    """
+    if flow_channels is None:
+        flow_channels = [channels[i % len(channels)] for i in range(pairs)]
+    if len(flow_channels) != pairs or any(ch not in channels for ch in flow_channels):
+        raise ValueError('Every one of the {0} pairs needs a channel among {1}, got {2}'
+                         .format(pairs, channels, flow_channels))
+    return dict(pairs=pairs, channels=list(channels), flow_channels=list(flow_channels))
+
+
+def flow_pairs(layout, channel=None):
+    """ Return the list of (sender, receiver, pair name) tuples of a layout, e.g. ('h1', 'h2', 'h1-h2').
+
+        :param  layout  Dictionary with the pairs and channels of the network (see make_layout()).
+        :param  channel Only return the pairs pinned to this channel, None for all the pairs.
+    """
+    return [('h{0}'.format(2*i + 1), 'h{0}'.format(2*i + 2), 'h{0}-h{1}'.format(2*i + 1, 2*i + 2))
+            for i in range(layout['pairs']) if channel is None or layout['flow_channels'][i] == channel]
+
+
+def domain_switches(k):
+    """ Return the numbers of the backbone and access switches of the packet domain of the k-th channel (1-based):
+        s<4k-3> & s<4k-2> are the backbone routers, s<4k-1> & s<4k> the access routers.
+    """
+    return 4*k - 3, 4*k - 2, 4*k - 1, 4*k
+
+
+def optical_configs(span_lengths, span_counts, boost_gains, amp_gains, launch_powers):
+    """ Return the list of optical configurations of the sweep (cartesian product of the optical axes).
+
+        :param  span_lengths    List of span lengths in km.
+        :param  span_counts     List of numbers of spans per WDM link.
+        :param  boost_gains     List of boost amplifier gains in dB.
+        :param  amp_gains       List of in-line amplifier gains in dB, 'none' for no in-line amplifiers or 'auto' to
+                                compensate the span loss (0.22 dB/km).
+        :param  launch_powers   List of transceiver launch powers in dBm.
+    """
+    configs = list()
+    for span_km, n_spans, boost, amp, power in product(span_lengths, span_counts, boost_gains, amp_gains,
+                                                       launch_powers):
+        configs.append(dict(span_km=span_km, n_spans=n_spans, boost_gain_db=boost,
+                            amp_gains_db=sweep_spec.amp_gains(amp, span_km, n_spans), launch_power_dbm=power))
+    return configs
+
+
+def optical_tag(optical):
+    """ Return a short name of an optical configuration, used for result directories.
+
+        :param  optical Dictionary with the optical layer parameters.
+    """
+    gains = '-'.join('{0:g}'.format(g) for g in sorted(set(optical['amp_gains_db']))) or 'none'
+    return '{0:g}km_x{1}_boost{2:g}dB_amp{3}_{4:g}dBm'.format(optical['span_km'], optical['n_spans'],
+                                                             optical['boost_gain_db'], gains,
+                                                             optical['launch_power_dbm'])
+
+
+def link_params(delay, links=None):
+    """ Return the TCLink parameters of the backbone, access router and host links for the given delay.
+
+        :param  delay   One way propagation delay in ms.
+        :param  links   Dictionary with the bandwidths and queue sizes of the links, link_config by default.
+    """
+    links = links or link_config
+    # The bandwidth (bw) is in Mbps, delay in milliseconds and queue size is in packets
+    br_params = dict(bw=links['backbone_bw'], delay='{0}ms'.format(delay),
+                     max_queue_size=round(links['backbone_queue']*delay, 6),
+                     use_htb=True)  # backbone router interface tc params
+    ar_params = dict(bw=links['access_bw'], delay='0ms', max_queue_size=round(links['access_queue']*delay, 6),
+                     use_htb=True)  # access router intf tc params
+    # TODO: remove queue size from hosts and try.
+    hi_params = dict(bw=links['host_bw'], delay='0ms', max_queue_size=round(links['host_queue']*delay, 6),
+                     use_htb=True)  # host interface tc params
+    return br_params, ar_params, hi_params
 
 
 class DumbbellTopo(Topo):
@@ -81,79 +225,79 @@ class DumbbellTopo(Topo):
         routers and the backbone routers will have a max queue size = 0.2 * bandwidth * delay, where the bandwidth is
         252Mbps = 21 packets per ms for packets of 1500B size, and delay is the one-way propagation delay in ms.
         For all calculations, we assume a packet size (MTU) of 1500Bytes.
+
+        With several WDM channels, every channel k carries its own packet domain: backbone routers s<4k-3> & s<4k-2>
+        and access routers s<4k-1> & s<4k>. Terminal ethPort k connects the domain's backbone router, wdmPort M+k
+        connects ROADM port k, and port M+1 of the ROADMs is the line between r1 and r2 (M being the number of
+        channels). Each sender/receiver pair is attached to the access routers of the domain of its channel. With the
+        default layout (one channel, two pairs) this is the network above.
     """
 
-    def build(self, delay=2):
+    def build(self, delay=2, job=None, optical=None, layout=None):
         """ Create the topology by overriding the class parent's method.
 
             :param  delay   One way propagation delay, delay = RTT / 2. Default is 2ms.
+            :param  job     Job slot number when several topologies run side by side. Node names (and therefore
+                            interface names) get a 'j<job>' prefix and the switches get explicit, unique DPIDs.
+            :param  optical Dictionary with the optical layer parameters, optical_params by default.
+            :param  layout  Dictionary with the pairs and channels of the network (see make_layout()), wdm_layout by
+                            default.
         """
-        # The bandwidth (bw) is in Mbps, delay in milliseconds and queue size is in packets
-        br_params = dict(bw=192, delay='{0}ms'.format(delay), max_queue_size=16*delay,
-                         use_htb=True)  # backbone router interface tc params
-        ar_params = dict(bw=96, delay='0ms', max_queue_size=(8*delay*20)/100,
-                         use_htb=True)  # access router intf tc params
-        # TODO: remove queue size from hosts and try.
-        hi_params = dict(bw=180, delay='0ms', max_queue_size=15*delay, use_htb=True)  # host interface tc params
-
-        # Create routers s1 to s4
-        s1 = self.addSwitch('s1')
-        s2 = self.addSwitch('s2')
-        s3 = self.addSwitch('s3')
-        s4 = self.addSwitch('s4')
-
-        # Optical network elements
-        params = {'transceivers': [('tx1',0*dBm,'C')],
+        prefix = node_prefix(job)
+        optical = optical or optical_params
+        layout = layout or wdm_layout
+        n_channels = len(layout['channels'])
+        br_params, ar_params, hi_params = link_params(delay)
+
+        # Optical network elements, one transceiver per channel
+        params = {'transceivers': [('tx{0}'.format(k), optical['launch_power_dbm']*dBm, 'C')
+                                   for k in range(1, n_channels + 1)],
                   'monitor_mode': 'in'}
-        t1 = self.addSwitch('t1', cls=Terminal, **params)
-        t2 = self.addSwitch('t2', cls=Terminal, **params)
+        t1 = self.addSwitch(prefix + 't1', cls=Terminal, **params)
+        t2 = self.addSwitch(prefix + 't2', cls=Terminal, **params)
 	    # ADD ROADM as r1
-        r1 = self.addSwitch('r1', cls=ROADM)
-        r2 = self.addSwitch('r2', cls=ROADM)
+        r1 = self.addSwitch(prefix + 'r1', cls=ROADM)
+        r2 = self.addSwitch(prefix + 'r2', cls=ROADM)
+        boost = ('boost', {'target_gain': optical['boost_gain_db']*dB})
 
+        access = dict()
+        for k, ch in enumerate(layout['channels'], 1):
+            # Create routers s1 to s4 of the channel's packet domain
+            s1, s2, s3, s4 = (self.addSwitch(prefix + 's{0}'.format(n), **switch_opts(job, n))
+                              for n in domain_switches(k))
+            access[ch] = (s3, s4)
 
 ###################################################
-        # Link backbone routers (s1 & s2) together
-        # Ethernet links
-        self.addLink(s1,t1)
-        self.addLink(s2,t2)
-        
-        # WDM link
-        boost = ('boost', {'target_gain': 3.0*dB})
-        amp1 = ('amp1', {'target_gain': 25*.22*dB})
-        amp2 = ('amp2', {'target_gain': 40*.22*dB})
-        amp3 = ('amp3', {'target_gain': 50*.22*dB})
-
-        spans = [5*km]
-        
-        self.addLink(r1, t1, cls=OpticalLink, port1=1, port2=2,
-                     boost1=boost, spans=spans)
-        self.addLink(r2, t2, cls=OpticalLink, port1=1, port2=2,
-                     boost1=boost, spans=spans)
-        self.addLink(r2, r1, cls=OpticalLink, port1=2, port2=2,
-                     boost1=boost, spans=spans, loss = 0)
-        
+            # Link backbone routers (s1 & s2) together
+            # Ethernet links
+            self.addLink(s1, t1, port2=k)
+            self.addLink(s2, t2, port2=k)
+
+            # WDM links between the terminals and the ROADMs
+            suffix = '' if k == 1 else 'c{0}'.format(k)
+            self.addLink(r1, t1, cls=OpticalLink, port1=k, port2=n_channels + k,
+                         boost1=boost, spans=optical_spans(optical, 'r1t1' + suffix, prefix))
+            self.addLink(r2, t2, cls=OpticalLink, port1=k, port2=n_channels + k,
+                         boost1=boost, spans=optical_spans(optical, 'r2t2' + suffix, prefix))
+
 ###################################################
-        # Link access routers (s3 & s4) to the backbone routers
-        self.addLink(s1, s3, cls=TCLink, **ar_params)
-        self.addLink(s2, s4, cls=TCLink, **br_params)
-
-        # Create the hosts h1 to h4, and link them to access router 1
-        h1 = self.addHost('h1')
-        h2 = self.addHost('h2')
-        h3 = self.addHost('h3')
-        h4 = self.addHost('h4')
-
-        # Link the source hosts (h1 & h3) to access router 1 (s3)
-        self.addLink(s3, h1, cls=TCLink, **hi_params)
-        self.addLink(s3, h3, cls=TCLink, **hi_params)
-        
-        # Link the receiver hosts (h2 & h4) to access router 2 (s4)
-        self.addLink(s4, h2, cls=TCLink, **hi_params)
-        self.addLink(s4, h4, cls=TCLink, **hi_params)
-        
-
-def draw_fairness_plot(time_h1, bw_h1, time_h3, bw_h3, alg, delay):
+            # Link access routers (s3 & s4) to the backbone routers
+            self.addLink(s1, s3, cls=TCLink, **ar_params)
+            self.addLink(s2, s4, cls=TCLink, **br_params)
+
+        # WDM line between the ROADMs, shared by all the channels
+        self.addLink(r2, r1, cls=OpticalLink, port1=n_channels + 1, port2=n_channels + 1,
+                     boost1=boost, spans=optical_spans(optical, 'r2r1', prefix), loss = 0)
+
+        # Create the hosts. The source host of each pair is linked to access router 1 (s3) of its channel's domain and
+        # the receiver host to access router 2 (s4).
+        for (src, dst, _), ch in zip(flow_pairs(layout), layout['flow_channels']):
+            s3, s4 = access[ch]
+            self.addLink(s3, self.addHost(prefix + src), cls=TCLink, **hi_params)
+            self.addLink(s4, self.addHost(prefix + dst), cls=TCLink, **hi_params)
+
+
+def draw_fairness_plot(data, alg, delay, outdir='.'):
     """ Draw the fairness plot for the iperf client hosts.
 
             |
@@ -165,38 +309,30 @@ def draw_fairness_plot(time_h1, bw_h1, time_h3, bw_h3, alg, delay):
            -|--------|-----------------
         h1-h2 start  h3-h4 start  time
 
-        :param  time_h1 List of time values for host h1.
-        :param  bw_h1   List of bandwidth values for host h1.
-        :param  time_h3 List of time values for host h3.
-        :param  bw_h3   List of bandwidth values for host h3.
+        Long series are downsampled (LTTB) before plotting, see ../Scripts/render.py.
+
+        :param  data    Dictionary with the flow names as keys and their 'src', 'time' and 'Mbps' values, as
+                        returned by parse_iperf_data().
         :param  alg     TCP Congestion Control algorithm used in the test.
         :param  delay   Delay used in the test.
+        :param  outdir  Directory where the plot is saved.
     """
     print('*** Drawing the fairness plot...')
-    plt.plot(time_h1, bw_h1, label='Source Host 1 (h1)')
-    plt.plot(time_h3, bw_h3, label='Source Host 2 (h3)')
-
-    plt.xlabel('Time (sec)')
-    plt.ylabel('Bandwidth (Mbps)')
-    plt.ylim(0,120)
-    plt.grid()
-
-
-    plt.title("TCP Fairness Graph\n{0} TCP Cong Control Alg Delay={1}ms"
-              .format(alg.capitalize(), delay))
-
-    plt.legend()
-
-    plt.savefig('fairness_graph_{0}_{1}ms'.format(alg, delay))
-    plt.close()
+    # Imported here: matplotlib takes most of a second to load and is only needed once the test is over
+    from render import plot_fairness
+    series = dict((flow, dict(time=values['time'], mbps=values['Mbps'], src=values['src']))
+                  for flow, values in data.items())
+    plot_fairness(series, alg, delay, join(outdir, 'fairness_graph_{0}_{1}ms.png'.format(alg, delay)))
 
 
 def dumbbell_test():
     """ Create and test a dumbbell network.
     """
-    topo = DumbbellTopo(delay=21)
-    net = Mininet(topo)
-    net.start()
+    with span('build_topo'):
+        topo = DumbbellTopo(delay=21)
+        net = Mininet(topo)
+    with span('net.start'):
+        net.start()
 
     print("Dumping host connections...")
     dumpNodeConnections(net.hosts)
@@ -205,81 +341,67 @@ def dumbbell_test():
     h1, h2 = net.get('h1', 'h2')
     h3, h4 = net.get('h3', 'h4')
 
-    for i in range(1, 10):
-        net.pingFull(hosts=(h1, h2))
+    with span('ping'):
+        for i in range(1, 10):
+            net.pingFull(hosts=(h1, h2))
 
-    for i in range(1, 10):
-        net.pingFull(hosts=(h2, h1))
+        for i in range(1, 10):
+            net.pingFull(hosts=(h2, h1))
 
-    for i in range(1, 10):
-        net.pingFull(hosts=(h4, h3))
+        for i in range(1, 10):
+            net.pingFull(hosts=(h4, h3))
 
-    for i in range(1, 10):
-        net.pingFull(hosts=(h3, h4))
+        for i in range(1, 10):
+            net.pingFull(hosts=(h3, h4))
 
-    print("Testing bandwidth between h1 and h2...")
-    net.iperf(hosts=(h1, h2), fmt='m', seconds=10, port=5001)
+    with span('iperf'):
+        print("Testing bandwidth between h1 and h2...")
+        net.iperf(hosts=(h1, h2), fmt='m', seconds=10, port=5001)
 
-    print("Testing bandwidth between h3 and h4...")
-    net.iperf(hosts=(h3, h4), fmt='m', seconds=10, port=5001)
+        print("Testing bandwidth between h3 and h4...")
+        net.iperf(hosts=(h3, h4), fmt='m', seconds=10, port=5001)
 
     print("Stopping test...")
-    net.stop()
+    with span('net.stop'):
+        net.stop()
 
 
 #def parse_iperf_data(alg, delay, host_addrs, Ganho_Amp):
-def parse_iperf_data(alg, delay, host_addrs):
+def parse_iperf_data(alg, delay, host_addrs, outdir='.', layout=None, channel=None, flows=None):
     """ Parse the iperf data files for the given algorithm and RTT.
 
         :param  alg         String with the TCP congestion control algorithms data to parse.
         :param  delay       Integer with the delay data to parse.
         :param  host_addrs  Dictionary with the host names as keys and their addresses as values.
+        :param  outdir      Directory holding the iperf data files.
+        :param  layout      Dictionary with the pairs of the network (see make_layout()), wdm_layout by default.
+        :param  channel     Only parse the pairs pinned to this channel, None for all the pairs.
+        :param  flows       List of (sender, receiver, flow name) tuples to parse instead of the pairs of the layout,
+                            e.g. the flows of a schedule.
+        :return Dictionary with the flow names as keys and dictionaries with the sender ('src'), the throughput
+                ('Mbps'), the time since the start of the first flow ('time') and since the start of the flow
+                ('start') as values. Flows without any report are left out.
     """
     print('*** Parsing iperf data...')
-    data = dict({'h1': {'Mbps': list(), 'time': list()}, 'h2': {'Mbps': list(), 'time': list()},
-                 'h3': {'Mbps': list(), 'time': list()}, 'h4': {'Mbps': list(), 'time': list()}})
-
-    # Use time's first value as time=0, and convert the bps to Mbps
-    first_row = True
-    with open('iperf_{0}_h1-h2_{1}ms.txt'.format(alg, delay),'r+') as fcsv:
-        r = csv.DictReader(fcsv, delimiter=',', fieldnames=iperf_csv_header)
-        for row in r:
-            if host_addrs['h1'] in row['src_addr']:
-                time = mktime(datetime.strptime(str(row['time']), '%Y%m%d%H%M%S').timetuple())
-
-                # On the first row set up the required values. Then, check for repeated timestamps and fix that
-                if first_row:
-                    time_init = time
-                    first_row = False
-                    data['h1']['time'].append(time - time_init)
-                elif time-time_init == data['h1']['time'][-1]:
-                    data['h1']['time'].append(time - time_init + 1)
-                else:
-                    data['h1']['time'].append(time - time_init)
-                data['h1']['Mbps'].append(int(row['bps'])/1000000)
-    # Pop the last row because it is the average bandwidth of the session
-    print('h1: time={0}, bandwidth={1}'.format(data['h1']['time'].pop(), data['h1']['Mbps'].pop()))
-
-    # Use time's first value obtained for the previous host as time=0 since the seconds iperf command was started with
-    # a few seconds after the first cmd, and convert the bps to Mbps
-    first_row = True
-   
-    with open('iperf_{0}_h3-h4_{1}ms.txt'.format(alg, delay), 'r+') as fcsv:
-        r = csv.DictReader(fcsv, delimiter=',', fieldnames=iperf_csv_header)
-        for row in r:
-            if host_addrs['h3'] in row['src_addr']:
-                time = mktime(datetime.strptime(str(row['time']), '%Y%m%d%H%M%S').timetuple())
-                # Check for repeated timestamps and fix that
-                if first_row:
-                    first_row = False
-                    data['h3']['time'].append(time - time_init)
-                elif time-time_init == data['h3']['time'][-1]:
-                    data['h3']['time'].append(time - time_init + 1)
-                else:
-                    data['h3']['time'].append(time - time_init)
-                data['h3']['Mbps'].append(int(row['bps'])/1000000)
-    # Pop the last row because it is the average bandwidth of the session
-    print('h3: time={0}, bandwidth={1}'.format(data['h3']['time'].pop(), data['h3']['Mbps'].pop()))
+    data = dict()
+
+    # Use the first timestamp of the first sender as time=0. The time of each row is the start of its interval plus
+    # the offset of the first timestamp of its file, since the other iperf commands were started a few seconds after
+    # the first one.
+    time_init = None
+    for src, _, pair in flows or flow_pairs(layout or wdm_layout, channel):
+        rows = load_iperf(join(outdir, 'iperf_{0}_{1}_{2}ms{3}'.format(alg, pair, delay, traffic.suffix)),
+                          host_addrs[src])
+        if not len(rows['time']):
+            print('{0}: no reports'.format(pair))
+            continue
+        if time_init is None:
+            time_init = rows['time'][0]
+        data[pair] = {'src': src, 'Mbps': rows['mbps'], 'time': rows['time'][0] - time_init + rows['start'],
+                      'start': rows['start']}
+        # The last row of the file is the average bandwidth of the session
+        if len(rows['summary']):
+            print('{0}: time={1}, bandwidth={2}'.format(src, rows['summary'][0], rows['summary'][1]))
 
     return data
 
@@ -296,105 +418,1018 @@ def test(net):
 
 
 
-def tcp_tests(algs, delays, iperf_runtime, iperf_delayed_start):
+def lightpath_config(layout=None):
+    """ Return the lightpath configuration of the network: every channel from t1 to t2 through r1 and r2.
+
+        For the k-th of M channels, the terminals connect ethPort k to wdmPort M+k, and the ROADMs forward the channel
+        between port k (terminal side) and port M+1 (line side). With the default layout this is channel 2 between
+        ethPort 1 and wdmPort 2, and between ROADM ports 1 and 2.
+
+        :param  layout  Dictionary with the channels of the network (see make_layout()), wdm_layout by default.
+    """
+    channels = (layout or wdm_layout)['channels']
+    n_channels = len(channels)
+    terminal = [(k, n_channels + k, ch) for k, ch in enumerate(channels, 1)]
+    roadm = [(k, n_channels + 1, (ch,)) for k, ch in enumerate(channels, 1)]
+    return dict(terminals={'t1': terminal, 't2': terminal}, roadms={'r1': roadm, 'r2': roadm})
+
+
+def osnr_key(optical, ch, layout):
+    """ Return the key of the OSNR cache for a channel: the canonical JSON of the optical configuration, the channel
+        and, when several channels share the line, all of them.
+    """
+    key = dict(optical, channel=ch)
+    if len(layout['channels']) > 1:
+        key['channels'] = layout['channels']
+    return json.dumps(key, sort_keys=True)
+
+
+def start_network(delay, job=None, optical=None, store=None, layout=None):
+    """ Build and start the optical and packet network, and configure the lightpaths between t1 and t2.
+
+        The OSNR/gOSNR/power of an optical configuration is only read from the monitors the first time the
+        configuration is built. It is then cached in memory and in the result store, keyed by the optical parameters.
+
+        :param  delay   Integer with the one-directional propagation delay of the backbone link.
+        :param  job     Job slot number when running in parallel with other tests, None otherwise.
+        :param  optical Dictionary with the optical layer parameters, optical_params by default.
+        :param  store   Path of the SQLite result store holding the OSNR cache, None to only cache in memory.
+        :param  layout  Dictionary with the pairs and channels of the network (see make_layout()), wdm_layout by
+                        default.
+        :return Tuple with the network, a dictionary with the host names (without prefix) as keys and the hosts
+                as values, and a dictionary with the channels as keys and the OSNR/gOSNR/power measured at t2 as
+                values.
+    """
+    prefix = node_prefix(job)
+    port = rest_port if job is None else rest_port + job
+
+    # Create the net topology
+    print('*** Creating topology for delay={0}ms...'.format(delay))
+    optical = optical or optical_params
+    layout = layout or wdm_layout
+    with span('build_topo', delay=delay):
+        topo = DumbbellTopo(delay=delay, job=job, optical=optical, layout=layout)
+
+        # Start mininet. Parallel jobs can not share the OpenFlow controller port, so they use standalone bridges.
+        if job is None:
+            net = Mininet(topo)
+        else:
+            net = Mininet(topo, switch=OVSBridge, controller=None)
+
+        restServer = RestServer(net, port=port)
+    with span('net.start'):
+        net.start()
+
+    # Get the hosts
+    hosts = dict((name, net.get(prefix + name)) for pair in flow_pairs(layout) for name in pair[:2])
+    if fidelity_params['pin']:
+        pin_hosts(hosts, job)
+
+
+    restServer.start()
+    ################%%%%%%%%%%%%%%%%%%%%%%%%%#############3
+    control = OpticalControl('localhost:{0}'.format(port), prefix)
+    with span('rest_config'):
+        elapsed = control.apply_lightpaths(lightpath_config(layout))
+    print('*** Lightpaths configured in {0:.3f}s ({1} requests)'.format(elapsed, len(control.timings)))
+    measured = dict()
+    for ch in layout['channels']:
+        key = osnr_key(optical, ch, layout)
+        measured[ch] = cached_osnr(key, store)
+        if measured[ch] is None:
+            with span('osnr_read', channel=ch):
+                if ch == layout['channels'][0]:
+                    for monitor in ('t1-monitor', 't2-monitor'):
+                        print('*** {0}: {1}'.format(monitor, control.monitor(monitor)))
+                # Physical layer quality at the receiving end of the lightpath
+                measured[ch] = control.channel_report('t2-monitor', ch)
+            cache_osnr(key, measured[ch], store)
+        else:
+            print('*** Optical configuration already evaluated for channel {0}: {1}'.format(ch, measured[ch]))
+    control.close()
+    info(__doc__)
+    #test(net) if 'test' in argv else CLI(net)
+    # The telemetry collector reads the monitors through the REST server during the tests
+    if telemetry_params['interval'] is None:
+        restServer.stop()
+    else:
+        net.rest_server = restServer
+    #net.stop()
+
+    return net, hosts, measured
+
+
+def stop_network(net):
+    """ Stop a network started by start_network(), and its REST server if it was kept running for the telemetry.
+    """
+    rest_server = getattr(net, 'rest_server', None)
+    if rest_server is not None:
+        rest_server.stop()
+    with span('net.stop'):
+        net.stop()
+
+
+def pin_system():
+    """ Pin the harness (with the mnoptical simulation and its REST server) and Open vSwitch to their dedicated cores
+        (see fidelity.core_plan()). Parallel tests forked later inherit the core of the harness.
+    """
+    harness, datapath, _ = fidelity.core_plan([])
+    fidelity.pin_process(os.getpid(), harness)
+    for pid in fidelity.pids('ovs-vswitchd') + fidelity.pids('ovsdb-server'):
+        fidelity.pin_process(pid, datapath)
+    print('*** Harness pinned to core {0}, Open vSwitch to core {1}'.format(harness, datapath))
+
+
+def pin_hosts(hosts, job=None):
+    """ Give every host its own core, on which its iperf processes are started (see pinned()).
+
+        :param  hosts   Dictionary with the host names (without prefix) as keys and the hosts as values.
+        :param  job     Job slot number of the network, None if it is not run in parallel.
+    """
+    _, _, cores = fidelity.core_plan(list(hosts), job)
+    for name, host in hosts.items():
+        host.cores = cores[name]
+    print('*** Hosts pinned to cores {0}'.format(' '.join('{0}:{1}'.format(name, core)
+                                                          for name, core in sorted(cores.items()))))
+
+
+def pinned(host, cmd):
+    """ Return a command of a host run on the core of the host, if it was pinned (see pin_hosts()).
+    """
+    cores = getattr(host, 'cores', None)
+    return cmd if cores is None else fidelity.pin_command(cores, cmd)
+
+
+def fidelity_watchdog(net, hosts, job=None, layout=None, duration=3600):
+    """ Return a FidelityWatchdog (see fidelity.py) of a network, None if the watchdog is disabled.
+
+        :param  net         Running network built by start_network().
+        :param  hosts       Dictionary with the host names (without prefix) as keys and the hosts as values.
+        :param  job         Job slot number of the network, None if it is not run in parallel.
+        :param  layout      Dictionary with the pairs and channels of the network, wdm_layout by default.
+        :param  duration    Expected duration of the test in seconds.
+    """
+    if not fidelity_params['watch']:
+        return None
+    prefix = node_prefix(job)
+    links = [link for ch_links in domain_links(layout or wdm_layout, 0).values() for link in ch_links]
+
+    def read_drops():
+        drops = dict()
+        for node1, node2, _ in links:
+            for link in net.linksBetween(net.get(prefix + node1), net.get(prefix + node2)):
+                for intf in (link.intf1, link.intf2):
+                    output = intf.node.cmd('tc -s qdisc show dev {0}'.format(intf.name))
+                    drops['{0}-{1}'.format(node1, node2)] = drops.get('{0}-{1}'.format(node1, node2), 0) + \
+                        fidelity.netem_drops(output)
+        return drops
+
+    cores = None
+    if fidelity_params['pin']:
+        harness, datapath, _ = fidelity.core_plan([])
+        cores = set([harness, datapath] + [host.cores for host in hosts.values()])
+    return FidelityWatchdog(cores, read_drops, fidelity_params['interval'], duration)
+
+
+def packet_capture(net, job=None, layout=None):
+    """ Return a PacketCapture (see packet_capture.py) of the backbone router to terminal link and the access links
+        of every packet domain of a network, None if the captures are disabled.
+
+        :param  net     Running network built by start_network().
+        :param  job     Job slot number of the network, None if it is not run in parallel.
+        :param  layout  Dictionary with the channels of the network (see make_layout()), wdm_layout by default.
+    """
+    if capture_params['snaplen'] is None:
+        return None
+    prefix = node_prefix(job)
+    points = list()
+    for k in range(1, len((layout or wdm_layout)['channels']) + 1):
+        s1, s2, s3, s4 = ('s{0}'.format(n) for n in domain_switches(k))
+        for node1, node2 in ((s1, 't1'), (s1, s3), (s2, s4)):
+            node = net.get(prefix + node1)
+            for link in net.linksBetween(node, net.get(prefix + node2)):
+                intf = link.intf1 if link.intf1.node == node else link.intf2
+                points.append(('{0}-{1}'.format(node1, node2), node, intf.name))
+    return PacketCapture(points, capture_params['snaplen'], capture_params['keep'])
+
+
+def telemetry_collector(job=None, layout=None, duration=3600):
+    """ Return a TelemetryCollector (see optical_telemetry) of the monitors of a network, None if the telemetry is
+        disabled.
+
+        :param  job         Job slot number of the network, None if it is not run in parallel.
+        :param  layout      Dictionary with the channels of the network (see make_layout()), wdm_layout by default.
+        :param  duration    Expected duration of the test in seconds.
+    """
+    if telemetry_params['interval'] is None:
+        return None
+    port = rest_port if job is None else rest_port + job
+    return TelemetryCollector('localhost:{0}'.format(port), telemetry_params['monitors'],
+                              (layout or wdm_layout)['channels'], telemetry_params['interval'], duration,
+                              node_prefix(job))
+
+
+def cached_osnr(key, store=None):
+    """ Return the cached OSNR/gOSNR/power of an optical configuration, None if it was never evaluated.
+
+        :param  key     Canonical JSON of the optical configuration.
+        :param  store   Path of the SQLite result store, None to only look in memory.
+    """
+    if key not in osnr_cache and store:
+        conn = open_store(store)
+        measured = find_optical(conn, key)
+        conn.close()
+        if measured is not None:
+            osnr_cache[key] = measured
+    return osnr_cache.get(key)
+
+
+def cache_osnr(key, measured, store=None):
+    """ Cache the OSNR/gOSNR/power of an optical configuration in memory and in the result store.
+
+        :param  key         Canonical JSON of the optical configuration.
+        :param  measured    Dictionary with the 'osnr', 'gosnr' and 'power' read from the monitor.
+        :param  store       Path of the SQLite result store, None to only cache in memory.
+    """
+    osnr_cache[key] = measured
+    if store:
+        conn = open_store(store)
+        add_optical(conn, key, measured)
+        conn.close()
+
+
+def domain_links(layout, delay):
+    """ Return the TCLinks of the packet domain of every channel, as (node1, node2, tc params) tuples.
+
+        :param  layout  Dictionary with the pairs and channels of the network (see make_layout()).
+        :param  delay   Integer with the one-directional propagation delay of the backbone links.
+        :return Dictionary with the channels as keys and the list of their links as values.
+    """
+    br_params, ar_params, hi_params = link_params(delay)
+    links = dict()
+    for k, ch in enumerate(layout['channels'], 1):
+        s1, s2, s3, s4 = ('s{0}'.format(n) for n in domain_switches(k))
+        links[ch] = [(s2, s4, br_params), (s1, s3, ar_params)]
+    for (src, dst, _), ch in zip(flow_pairs(layout), layout['flow_channels']):
+        s3, s4 = links[ch][1][1], links[ch][0][1]
+        links[ch] += [(s3, src, hi_params), (s4, dst, hi_params)]
+    return links
+
+
+def set_delay(net, delay, job=None, layout=None, channels=None):
+    """ Change the delay and queue sizes of the existing links in place.
+
+        Mininet's TCIntf.config() replaces the root qdisc of the interface, so this re-runs tc on the existing
+        interfaces with the parameters DumbbellTopo.build() would use for the given delay.
+
+        :param  net     Running network built by start_network().
+        :param  delay   Integer with the new one-directional propagation delay of the backbone link.
+        :param  job     Job slot number used to build the network.
+        :param  layout  Dictionary with the pairs and channels of the network, wdm_layout by default.
+        :param  channels    List of the channels whose packet domain is changed, None for all of them.
+    """
+    prefix = node_prefix(job)
+    links = domain_links(layout or wdm_layout, delay)
+    channels = list(links) if channels is None else channels
+
+    print('*** Setting delay={0}ms on the existing links of channels {1}...'.format(delay, channels))
+    for node1, node2, params in (link for ch in channels for link in links[ch]):
+        for link in net.linksBetween(net.get(prefix + node1), net.get(prefix + node2)):
+            link.intf1.config(**params)
+            link.intf2.config(**params)
+
+
+def set_cca(hosts, alg):
+    """ Select the default TCP congestion control algorithm of the hosts and forget the cached TCP metrics.
+
+        iperf selects the algorithm of its own sockets with -Z, but the hosts' default is set as well so that any
+        other connection uses it too. The cached metrics (ssthresh, RTT) of a previous run would otherwise be used as
+        the starting point of the next one.
+
+        :param  hosts   Dictionary with the host names as keys and the hosts as values.
+        :param  alg     String with the TCP congestion control algorithm.
+    """
+    for host in hosts.values():
+        host.cmd('sysctl -qw net.ipv4.tcp_congestion_control={0}'.format(alg))
+        host.cmd('ip tcp_metrics flush all')
+
+
+def start_iperf_client(src, dst, alg, pair, delay, iperf_runtime, outdir='.', monitor=None, size=None,
+                       port=base_port, control=None):
+    """ Start a client of the traffic generator writing its reports to iperf_<alg>_<pair>_<delay>ms.<suffix>, .txt
+        for iperf2 and .json for the JSON generators.
+
+        :param  src             Host running the client.
+        :param  dst             Host running the server.
+        :param  alg             String with the TCP congestion control algorithm.
+        :param  pair            Name of the host pair, e.g. 'h1-h2'.
+        :param  delay           Integer with the one-directional propagation delay being tested.
+        :param  iperf_runtime   Time to run the iperf client in seconds.
+        :param  outdir          Directory where the iperf data file is written.
+        :param  monitor         LiveMonitor tailing the client output, None to redirect it straight to the file.
+        :param  size            Amount of data to send (iperf -n), instead of sending for iperf_runtime seconds.
+        :param  port            Port of the server.
+        :param  control         Path of the control socket switching the algorithm of the flow (builtin generator,
+                                see bulk_transfer.py), None for no control socket.
+    """
+    options = dict() if control is None else dict(control=control)
+    cmd = pinned(src, traffic.client(dst.IP(), port, alg, iperf_runtime, size, **options))
+    path = '{0}/iperf_{1}_{2}_{3}ms{4}'.format(outdir, alg, pair, delay, traffic.suffix)
+    if monitor is None:
+        return src.popen('{0} > "{1}"'.format(' '.join(cmd), path), shell=True)
+
+    # Mininet's popen pipes stdout by default, the monitor copies it to the data file. No shell, so that terminating
+    # the popen stops iperf itself.
+    popen = src.popen(cmd)
+    monitor.attach(pair, popen, path)
+    return popen
+
+
+def run_iperf(hosts, alg, delay, iperf_runtime, iperf_delayed_start, outdir='.', live_port=None, adaptive=None,
+              sample_interval=None, layout=None, schedule=None, telemetry=None, watchdog=None, capture=None):
+    """ Run the competing iperf flows h1->h2, h3->h4, ... of a test.
+
+        The first flow starts alone, the others iperf_delayed_start seconds later. In adaptive mode the clients are
+        stopped as soon as the per-flow throughput and the Jain index have converged (see
+        live_monitor.ConvergenceDetector), iperf_runtime being the maximum duration.
+
+        :param  hosts               Dictionary with the host names as keys and the hosts as values.
+        :param  alg                 String with the TCP congestion control algorithm to test.
+        :param  delay               Integer with the one-directional propagation delay being tested.
+        :param  iperf_runtime       Time to run the iperf clients in seconds.
+        :param  iperf_delayed_start Time to wait before starting the other iperf clients in seconds.
+        :param  outdir              Directory where the iperf data files are written.
+        :param  live_port           Local port of the live statistics endpoint, None to not monitor the flows live.
+        :param  adaptive            Dictionary with the ConvergenceDetector options (ci_width, min_runtime), None to
+                                    run the clients for iperf_runtime seconds.
+        :param  sample_interval     Interval in seconds between two samples of the TCP state of the clients (written
+                                    to tcp_<alg>_<delay>ms.npz), None to not sample it.
+        :param  layout              Dictionary with the pairs of the network (see make_layout()), wdm_layout by
+                                    default.
+        :param  schedule            List of flows (see flow_scheduler) to run instead of the flows of the layout.
+                                    Flows without an algorithm use alg.
+        :param  telemetry           TelemetryCollector polling the optical monitors during the flows (see
+                                    telemetry_collector()), None to not collect telemetry.
+        :param  watchdog            FidelityWatchdog watching the cores of the host during the flows (see
+                                    fidelity_watchdog()), None to not watch them.
+        :param  capture             PacketCapture of the links during the flows (see packet_capture()), None to not
+                                    capture them.
+        :return Dictionary with the actual duration of the test (duration_s), why it stopped (stop_reason), the start
+                jitter of the flows (see flow_scheduler.FlowScheduler.jitter()), when sampling, the overhead of the
+                TCP sampler (see tcp_sampler.TcpSampler.stop()), when watching, the fidelity summary (see
+                fidelity.FidelityWatchdog.stop()) and, when capturing, the capture summary (see
+                packet_capture.PacketCapture.stop()).
+    """
+    tag = '{0}_{1}ms'.format(alg, delay)
+    if schedule is not None:
+        flows = [dict(flow, alg=flow.get('alg', alg), delay=delay) for flow in schedule]
+        return run_flows(hosts, flows, outdir=outdir, live_port=live_port, sample_interval=sample_interval, tag=tag,
+                         telemetry=telemetry, watchdog=watchdog, capture=capture)
+    flows = [(src, dst, pair, alg, delay) for src, dst, pair in flow_pairs(layout or wdm_layout)]
+    return run_flows(hosts, group_schedule([flows], iperf_runtime, iperf_delayed_start), [flows], outdir, live_port,
+                     adaptive, sample_interval, tag, telemetry, watchdog, capture)
+
+
+def group_schedule(groups, iperf_runtime, iperf_delayed_start):
+    """ Return the schedule of groups of competing flows: in every group the first flow starts at once and the other
+        flows iperf_delayed_start seconds later, all of them running for iperf_runtime seconds.
+
+        :param  groups              List of groups, each a list of (sender, receiver, pair name, algorithm, delay)
+                                    tuples.
+        :param  iperf_runtime       Time to run the iperf clients in seconds.
+        :param  iperf_delayed_start Time to wait before starting the other iperf clients of each group in seconds.
+    """
+    return [dict(name=pair, src=src, dst=dst, alg=alg, delay=delay, start=0 if i == 0 else iperf_delayed_start,
+                 duration=iperf_runtime)
+            for group in groups for i, (src, dst, pair, alg, delay) in enumerate(group)]
+
+
+def run_flows(hosts, schedule, groups=(), outdir='.', live_port=None, adaptive=None, sample_interval=None,
+              tag='flows', telemetry=None, watchdog=None, capture=None):
+    """ Run a schedule of iperf flows (see flow_scheduler) and wait for all of them to finish.
+
+        The flows are started on timers of a single event loop. In adaptive mode every group of competing flows has
+        its own ConvergenceDetector and all the flows are stopped when all the groups have converged.
+
+        :param  hosts               Dictionary with the host names as keys and the hosts as values.
+        :param  schedule            List of flows, each with its algorithm ('alg') and delay ('delay') besides the
+                                    fields of flow_scheduler.
+        :param  groups              List of groups of competing flows, each a list of (sender, receiver, pair name,
+                                    algorithm, delay) tuples, used by the ConvergenceDetectors.
+        :param  outdir              Directory where the iperf data files and the flow records (flows_<tag>.npz) are
+                                    written.
+        :param  live_port           Local port of the live statistics endpoint, None to not monitor the flows live.
+        :param  adaptive            Dictionary with the ConvergenceDetector options (ci_width, min_runtime), None to
+                                    run the flows as scheduled.
+        :param  sample_interval     Interval in seconds between two samples of the TCP state of the clients (written
+                                    to tcp_<tag>.npz), None to not sample it.
+        :param  tag                 Name of the TCP sampler, telemetry, fidelity, capture and flow record files.
+        :param  telemetry           TelemetryCollector polling the optical monitors while the flows run (written to
+                                    telemetry_<tag>.npz), None to not collect telemetry.
+        :param  watchdog            FidelityWatchdog watching the cores of the host while the flows run (written to
+                                    fidelity_<tag>.npz), None to not watch them.
+        :param  capture             PacketCapture of the links while the flows run (written to pcap_<tag>_<link>.pcap
+                                    and analyzed into pcap_<tag>_<link>/), None to not capture them.
+        :return See run_iperf().
+    """
+    monitor = None
+    if live_port is not None or adaptive is not None:
+        monitor = LiveMonitor(port=live_port, report_interval=traffic.interval, dashboard=live_port is not None,
+                              parse=traffic.parse_report)
+        monitor.start()
+    detectors = list()
+    if adaptive is not None:
+        for group in groups:
+            detectors.append(ConvergenceDetector([pair for _, _, pair, _, _ in group], **adaptive))
+            monitor.listeners.append(detectors[-1])
+
+    # Run the servers: one per receiver serving all its flows, or one per flow for the generators whose servers
+    # handle a single test (iperf3)
+    servers = dict()
+    ports = dict()
+    if traffic.port_per_flow:
+        for i, flow in enumerate(schedule):
+            ports[flow['name']] = base_port + i
+            receiver = hosts[flow['dst']]
+            servers[flow['name']] = receiver.popen(pinned(receiver, traffic.server(base_port + i)))
+    else:
+        for dst in sorted(set(flow['dst'] for flow in schedule)):
+            servers[dst] = hosts[dst].popen(pinned(hosts[dst], traffic.server(base_port)))
+    print("*** Started {0} {1} servers {2}...".format(len(servers), traffic.name, ' '.join(sorted(servers))))
+
+    # Flows of the builtin generator can switch algorithm on command (see bulk_transfer.py and cca_adapter.py)
+    controls = dict()
+    if traffic.switchable:
+        controls = dict((flow['name'], '/tmp/bulk_{0}_{1}_{2}.sock'.format(os.getpid(), tag, flow['name']))
+                        for flow in schedule)
+        print('*** Control sockets of the flows: {0}'.format(' '.join(sorted(controls.values()))))
+
+    # The client options of every generator are in traffic.py
+    # TODO: run iperfs without the -y C to see if we get errors setting the MSS. Use sudo?
+    sampler = None
+    if sample_interval is not None:
+        senders = dict((flow['src'], hosts[flow['src']]) for flow in schedule)
+        print("*** Sampling the TCP state of {0} every {1}ms...".format(' '.join(senders), sample_interval * 1000))
+        sampler = TcpSampler(senders, sample_interval, (base_port, base_port + len(schedule) - 1)
+                             if traffic.port_per_flow else base_port, duration=schedule_end(schedule) + 60)
+        sampler.start()
+    if telemetry is not None:
+        print("*** Polling {0} every {1:g}s...".format(' '.join(telemetry.monitors), telemetry.interval))
+        telemetry.start()
+
+    def launch(flow):
+        print("*** Starting {0} client {1} ({2})...".format(traffic.name, flow['src'], flow['name']))
+        return start_iperf_client(hosts[flow['src']], hosts[flow['dst']], flow['alg'], flow['name'], flow['delay'],
+                                  flow.get('duration'), outdir, monitor, flow.get('bytes'),
+                                  ports.get(flow['name'], base_port), controls.get(flow['name']))
+
+    scheduler = FlowScheduler(schedule, launch)
+    if detectors:
+        # Stop everything from the monitor thread once the last group converged
+        monitor.listeners.append(lambda *_: not scheduler.stopped and all(d.converged.is_set() for d in detectors)
+                                 and scheduler.stop())
+        print("*** Waiting up to {0:g}sec for the flows to converge...".format(schedule_end(schedule)))
+    else:
+        print("*** Running {0} flows for {1:g}sec...".format(len(schedule), schedule_end(schedule)))
+    if capture is not None:
+        capture.start(tag, outdir)
+    if watchdog is not None:
+        watchdog.start()
+    fidelity_summary = dict()
+    capture_summary = dict()
+    try:
+        with span('flows', flows=len(schedule)):
+            start = scheduler.run()
+        duration = time() - start
+    finally:
+        # tcpdump and the watchdog thread are stopped even when the flows failed
+        if watchdog is not None:
+            fidelity_summary = watchdog.stop()
+            watchdog.save('{0}/fidelity_{1}.npz'.format(outdir, tag))
+            print('*** Fidelity: busiest core {fidelity_core_p95_pct:.0f}%, softirq {fidelity_softirq_p95_pct:.0f}%, '
+                  '{fidelity_softnet_dropped} backlog drops, {fidelity_netem_drops} netem drops: {0}'
+                  .format('; '.join(fidelity_summary['fidelity_reasons']) or 'not saturated', **fidelity_summary))
+        if capture is not None:
+            with span('capture_analysis'):
+                capture_summary = capture.stop()
+    if telemetry is not None:
+        telemetry.stop()
+        telemetry.save('{0}/telemetry_{1}.npz'.format(outdir, tag))
+        print('*** Telemetry: {0} reads of {1} monitors, {2} failed, over {3} connections'
+              .format(sum(telemetry.n.values()), len(telemetry.monitors), telemetry.errors, telemetry.connections))
+    if not detectors:
+        stop_reason = 'fixed'
+    else:
+        stop_reason = 'converged' if all(d.converged.is_set() for d in detectors) else 'max_runtime'
+        print('*** Stopped after {0:.0f}sec ({1}): {2}'.format(duration, stop_reason,
+                                                                [detector.summary() for detector in detectors]))
+    if monitor is not None:
+        monitor.wait()
+        monitor.stop()
+    result = dict(duration_s=duration, stop_reason=stop_reason, n_flows=len(schedule))
+    result.update(scheduler.jitter())
+    result.update(fidelity_summary)
+    result.update(capture_summary)
+    scheduler.save('{0}/flows_{1}.npz'.format(outdir, tag))
+    print('*** Flow start jitter: {0}'.format(scheduler.jitter()))
+    if sampler is not None:
+        overhead = sampler.stop()
+        sampler.save('{0}/tcp_{1}.npz'.format(outdir, tag), overhead)
+        print('*** TCP sampler: {sampler_samples} samples, {sampler_cpu_s:.1f}s CPU in ss loops, '
+              '{sampler_reader_cpu_s:.1f}s in parsing, {sampler_core_pct:.1f}% of a core, {sampler_host_pct:.1f}% of '
+              'the host (host busy {host_busy_pct:.1f}%)'.format(**overhead))
+        result.update(overhead)
+
+    # Terminate the servers and tcpprobe subprocesses
+    print('*** Terminate the iperf servers and tcpprobe processes...')
+    with span('stop_servers'):
+        for popen in servers.values():
+            popen.terminate()
+
+
+        for popen in servers.values():
+            popen.wait()
+
+    return result
+
+
+def run_params(alg, delay, measured, optical=None, repetition=0, outdir='.', layout=None, channel=None):
+    """ Return the full parameter set of a test, as recorded in the result store.
+
+        The OSNR/gOSNR/power columns are those of the channel of the test (the first channel by default); the values
+        of every channel are kept in channel_reports.
+
+        :param  alg         String with the TCP congestion control algorithm tested.
+        :param  delay       Integer with the delay tested.
+        :param  measured    Dictionary with the channels as keys and the OSNR/gOSNR/power measured at the receiving
+                            terminal as values.
+        :param  optical     Dictionary with the optical layer parameters, optical_params by default.
+        :param  repetition  Repetition number of the test.
+        :param  outdir      Directory holding the iperf data files.
+        :param  layout      Dictionary with the pairs and channels of the network, wdm_layout by default.
+        :param  channel     Channel carrying the flows of the test in a multiplexed experiment, None otherwise.
+    """
+    layout = layout or wdm_layout
+    channel = layout['channels'][0] if channel is None else channel
+    first = measured[channel]
+    br_params, ar_params, hi_params = link_params(delay)
+    params = dict(algorithm=alg, delay_ms=delay, queue_br=br_params['max_queue_size'],
+                  queue_ar=ar_params['max_queue_size'], queue_hi=hi_params['max_queue_size'],
+                  osnr_db=first.get('osnr'), gosnr_db=first.get('gosnr'), power_dbm=first.get('power'),
+                  channel=channel, channel_reports=measured, n_pairs=layout['pairs'],
+                  n_channels=len(layout['channels']), channels=layout['channels'],
+                  flow_channels=layout['flow_channels'], repetition=repetition, started=time(), outdir=outdir,
+                  traffic_generator=traffic.name, report_interval_s=traffic.interval,
+                  telemetry_interval_s=telemetry_params['interval'], links=dict(link_config))
+    params.update(optical or optical_params)
+    return params
+
+
+def process_data(alg, delay, host_addrs, outdir='.', store=None, params=None, layout=None, channel=None,
+                 schedule=None, telemetry=None, phases=None):
+    """ Parse the iperf data files of a test, draw its fairness plot and record it in the result store.
+
+        :param  alg         String with the TCP congestion control algorithm tested.
+        :param  delay       Integer with the delay tested.
+        :param  host_addrs  Dictionary with the host names as keys and their addresses as values.
+        :param  outdir      Directory holding the iperf data files.
+        :param  store       Path of the SQLite result store, None to not record the test.
+        :param  params      Parameter set of the test (see run_params()).
+        :param  layout      Dictionary with the pairs of the network, wdm_layout by default.
+        :param  channel     Only process the pairs pinned to this channel, None for all the pairs.
+        :param  schedule    List of flows (see flow_scheduler) run instead of the pairs of the layout.
+        :param  telemetry   Optical telemetry of the test (see optical_telemetry.TelemetryCollector.arrays()), None if
+                            it was not collected.
+        :param  phases      phase_trace.mark() taken at the start of the test, to record the time spent in each phase
+                            with the test. None to not record it.
+    """
+    print('*** Processing data...')
+    layout = layout or wdm_layout
+    flows = None if schedule is None else [(flow['src'], flow['dst'], flow['name']) for flow in schedule]
+    with span('parse_iperf_data'):
+        data_fairness = parse_iperf_data(alg, delay, host_addrs, outdir, layout, channel, flows)
+
+    with span('draw_fairness_plot'):
+        draw_fairness_plot(data_fairness, alg, delay, outdir)
+
+    if params is not None:
+        params.update(phase_trace.summary(phases))
+    if store:
+        series = dict()
+        for pair, values in data_fairness.items():
+            series[pair] = dict(time=values['time'], start=values['start'], mbps=values['Mbps'])
+        with span('store'):
+            conn = open_store(store)
+            print('*** Recorded run {0} in {1}'.format(add_run(conn, params, series, telemetry), store))
+            conn.close()
+
+
+def run_test(alg, delay, iperf_runtime, iperf_delayed_start, store=None, live_port=None, adaptive=None, optical=None,
+             sample_interval=None, layout=None, schedule=None, repetition=0, point=None, job=None, outdir='.'):
+    """ Run a single TCP congestion control test on a freshly built network.
+
+        :param  alg                 String with the TCP congestion control algorithm to test.
+        :param  delay               Integer with the one-directional propagation delay to test.
+        :param  iperf_runtime       Time to run the iperf clients in seconds.
+        :param  iperf_delayed_start Time to wait before starting the second iperf client in seconds.
+        :param  store               Path of the SQLite result store, None to not record the test.
+        :param  live_port           Local port of the live statistics endpoint (plus the job slot when running in
+                                    parallel), None to not monitor the flows live.
+        :param  adaptive            Dictionary with the convergence options, None to run the clients for
+                                    iperf_runtime seconds (see run_iperf()).
+        :param  optical             Dictionary with the optical layer parameters, optical_params by default.
+        :param  sample_interval     Interval in seconds between two TCP state samples, None to not sample it.
+        :param  layout              Dictionary with the pairs and channels of the network (see make_layout()),
+                                    wdm_layout by default.
+        :param  schedule            List of flows (see flow_scheduler) to run instead of the pairs of the layout.
+        :param  repetition          Repetition number of the test, recorded with its results.
+        :param  point               Hash of the sweep point of the test (see sweep_manifest), recorded with its
+                                    results.
+        :param  job                 Job slot number when running in parallel with other tests, None otherwise.
+        :param  outdir              Directory where the iperf data files and the plot are written.
+    """
+    phases = phase_trace.mark()
+    try:
+        with span('run_test', alg=alg, delay=delay, job=job):
+            if live_port is not None and job is not None:
+                live_port += job
+            # A test run on a saturated emulator is run again on a fresh network, the last attempt is kept
+            for attempt in range(fidelity_params['reruns'] + 1):
+                net, hosts, measured = start_network(delay, job, optical, store, layout)
+                host_addrs = dict((name, host.IP()) for name, host in hosts.items())
+                print('Host addrs: {0}'.format(host_addrs))
+
+                params = run_params(alg, delay, measured, optical, repetition, outdir, layout)
+                params.update(point_key=point, fidelity_attempts=attempt + 1)
+                telemetry = telemetry_collector(job, layout, iperf_runtime + iperf_delayed_start)
+                watchdog = fidelity_watchdog(net, hosts, job, layout, iperf_runtime + iperf_delayed_start)
+                try:
+                    params.update(run_iperf(hosts, alg, delay, iperf_runtime, iperf_delayed_start, outdir, live_port,
+                                            adaptive, sample_interval, layout, schedule, telemetry, watchdog,
+                                            packet_capture(net, job, layout)))
+                finally:
+                    print("*** Stopping test...")
+                    stop_network(net)
+                if not params.get('fidelity_saturated') or attempt == fidelity_params['reruns']:
+                    break
+                print('*** Emulator saturated, running the test again ({0} of {1})...'
+                      .format(attempt + 1, fidelity_params['reruns']))
+
+            process_data(alg, delay, host_addrs, outdir, store, params, layout, schedule=schedule,
+                         telemetry=telemetry and telemetry.arrays(), phases=phases)
+    finally:
+        # Tests run in forked workers hand their spans over to the parent
+        phase_trace.flush()
+
+
+def warm_tests(algs, delays, iperf_runtime, iperf_delayed_start, outdir='.', store=None, live_port=None,
+               adaptive=None, optical=None, sample_interval=None, layout=None, schedule=None, repetition=0,
+               points=None):
+    """ Run all the tests on a single network ("warm topology").
+
+        The optical and packet network is built and configured once. Between tests only the hosts' congestion
+        control algorithm and the tc parameters of the links are changed.
+
+        :param  algs                List of strings with the TCP congestion control algorithms to test.
+        :param  delays              List of integers with the one-directional propagation delays to test.
+        :param  iperf_runtime       Time to run the iperf clients in seconds.
+        :param  iperf_delayed_start Time to wait before starting the second iperf client in seconds.
+        :param  outdir              Directory where the results are written.
+        :param  store               Path of the SQLite result store, None to not record the tests.
+        :param  live_port           Local port of the live statistics endpoint, None to not monitor the flows live.
+        :param  adaptive            Dictionary with the convergence options, None to run the clients for
+                                    iperf_runtime seconds (see run_iperf()).
+        :param  optical             Dictionary with the optical layer parameters, optical_params by default.
+        :param  sample_interval     Interval in seconds between two TCP state samples, None to not sample it.
+        :param  layout              Dictionary with the pairs and channels of the network (see make_layout()),
+                                    wdm_layout by default.
+        :param  schedule            List of flows (see flow_scheduler) to run instead of the pairs of the layout.
+        :param  repetition          Repetition number of the tests, recorded with their results.
+        :param  points              List of tests to run in this order instead of every algorithm for every delay,
+                                    each a dictionary with its algorithm, delay_ms, iperf_runtime, iperf_delayed_start,
+                                    outdir and sweep point key (see sweep_spec.expand()).
+    """
+    # The delay is the outer loop, so the links are only reconfigured once per delay
+    points = points or [dict(algorithm=alg, delay_ms=delay, iperf_runtime=iperf_runtime,
+                             iperf_delayed_start=iperf_delayed_start, outdir=outdir, key=None)
+                        for delay in delays for alg in algs]
+    net, hosts, measured = start_network(points[0]['delay_ms'], optical=optical, store=store, layout=layout)
+    host_addrs = dict((name, host.IP()) for name, host in hosts.items())
+    print('Host addrs: {0}'.format(host_addrs))
+
+    try:
+        current_delay = None
+        for point in points:
+            alg, delay, point_dir = point['algorithm'], point['delay_ms'], point['outdir']
+            runtime, delayed_start = point['iperf_runtime'], point['iperf_delayed_start']
+            # Marked before the delay change, so its time is recorded with the first test of the delay
+            phases = phase_trace.mark()
+            if delay != current_delay:
+                print('*** Starting test for delay={0}ms...'.format(delay))
+                with span('set_delay', delay=delay):
+                    set_delay(net, delay, layout=layout)
+                current_delay = delay
+            print('*** Starting test for algorithm={0}...'.format(alg))
+            for attempt in range(fidelity_params['reruns'] + 1):
+                with span('set_cca', alg=alg):
+                    set_cca(hosts, alg)
+                params = run_params(alg, delay, measured, optical, repetition, point_dir, layout)
+                params.update(point_key=point['key'], fidelity_attempts=attempt + 1)
+                telemetry = telemetry_collector(layout=layout, duration=runtime + delayed_start)
+                watchdog = fidelity_watchdog(net, hosts, layout=layout, duration=runtime + delayed_start)
+                params.update(run_iperf(hosts, alg, delay, runtime, delayed_start, point_dir, live_port, adaptive,
+                                        sample_interval, layout, schedule, telemetry, watchdog,
+                                        packet_capture(net, layout=layout)))
+                if not params.get('fidelity_saturated') or attempt == fidelity_params['reruns']:
+                    break
+                print('*** Emulator saturated, running the test again ({0} of {1})...'
+                      .format(attempt + 1, fidelity_params['reruns']))
+            process_data(alg, delay, host_addrs, point_dir, store, params, layout, schedule=schedule,
+                         telemetry=telemetry and telemetry.arrays(), phases=phases)
+    finally:
+        print("*** Stopping test...")
+        stop_network(net)
+
+
+def multiplex_tests(algs, delays, iperf_runtime, iperf_delayed_start, outdir='.', store=None, live_port=None,
+                    adaptive=None, optical=None, sample_interval=None, layout=None, repetition=0):
+    """ Run the tests several at a time on the wavelengths of a single network ("multiplexed experiments").
+
+        Every channel of the layout carries an isolated packet domain (see DumbbellTopo). The (algorithm, delay)
+        points are taken in batches of one point per channel: each domain gets the delay of its point on its links
+        and runs its flows with the algorithm of its point, all the domains at the same time. Every point of a batch
+        therefore sees the same physical layer conditions, and is recorded as its own test with the OSNR of its
+        channel.
+
+        :param  algs                List of strings with the TCP congestion control algorithms to test.
+        :param  delays              List of integers with the one-directional propagation delays to test.
+        :param  iperf_runtime       Time to run the iperf clients in seconds.
+        :param  iperf_delayed_start Time to wait before starting the other iperf clients of each domain in seconds.
+        :param  outdir              Directory where the results are written.
+        :param  store               Path of the SQLite result store, None to not record the tests.
+        :param  live_port           Local port of the live statistics endpoint, None to not monitor the flows live.
+        :param  adaptive            Dictionary with the convergence options, None to run the clients for
+                                    iperf_runtime seconds (see run_flows()).
+        :param  optical             Dictionary with the optical layer parameters, optical_params by default.
+        :param  sample_interval     Interval in seconds between two TCP state samples, None to not sample it.
+        :param  layout              Dictionary with the pairs and channels of the network (see make_layout()). Every
+                                    channel needs at least one pair.
+        :param  repetition          Repetition number of the tests, recorded with their results.
+    """
+    layout = layout or wdm_layout
+    channels = layout['channels']
+    points = [(alg, delay) for delay in delays for alg in algs]
+    batches = [points[i:i + len(channels)] for i in range(0, len(points), len(channels))]
+    print('*** {0} tests in {1} batches of up to {2} wavelengths'.format(len(points), len(batches), len(channels)))
+
+    net, hosts, measured = start_network(delays[0], optical=optical, store=store, layout=layout)
+    host_addrs = dict((name, host.IP()) for name, host in hosts.items())
+    print('Host addrs: {0}'.format(host_addrs))
+
+    try:
+        for batch_number, batch in enumerate(batches):
+            phases = phase_trace.mark()
+            groups = list()
+            runs = list()
+            for ch, (alg, delay) in zip(channels, batch):
+                print('*** Channel {0}: algorithm={1}, delay={2}ms'.format(ch, alg, delay))
+                pairs = flow_pairs(layout, ch)
+                set_delay(net, delay, layout=layout, channels=[ch])
+                set_cca(dict((name, hosts[name]) for pair in pairs for name in pair[:2]), alg)
+                groups.append([(src, dst, pair, alg, delay) for src, dst, pair in pairs])
+                params = run_params(alg, delay, measured, optical, repetition, outdir, layout, ch)
+                params.update(batch=batch_number, batch_points=batch)
+                runs.append((ch, alg, delay, params))
+
+            telemetry = telemetry_collector(layout=layout, duration=iperf_runtime + iperf_delayed_start)
+            # The batch shares the host, so a saturated emulator is only flagged: rerunning would rerun every channel
+            watchdog = fidelity_watchdog(net, hosts, layout=layout, duration=iperf_runtime + iperf_delayed_start)
+            result = run_flows(hosts, group_schedule(groups, iperf_runtime, iperf_delayed_start), groups, outdir,
+                               live_port, adaptive, sample_interval, 'batch{0}'.format(batch_number), telemetry,
+                               watchdog, packet_capture(net, layout=layout))
+            for ch, alg, delay, params in runs:
+                params.update(result)
+                process_data(alg, delay, host_addrs, outdir, store, params, layout, ch,
+                             telemetry=telemetry and telemetry.arrays(), phases=phases)
+    finally:
+        print("*** Stopping test...")
+        stop_network(net)
+
+
+def tcp_tests(algs, delays, iperf_runtime, iperf_delayed_start, jobs=1, outdir='.', warm=False, store=None,
+              live_port=None, adaptive=None, opticals=None, sample_interval=None, layout=None, multiplex=False,
+              schedule=None, repetitions=1, resume=False, retries=2, plan=None):
     """ Run the TCP congestion control tests.
 
         :param  algs                List of strings with the TCP congestion control algorithms to test.
         :param  delays              List of integers with the one-directional propagation delays to test.
         :param  iperf_runtime       Time to run the iperf clients in seconds.
         :param  iperf_delayed_start Time to wait before starting the second iperf client in seconds.
+        :param  jobs                Maximum number of tests to run at the same time on isolated networks.
+        :param  outdir              Directory where the results are written. Parallel tests write to one
+                                    sub-directory per (algorithm, delay) pair, and with several optical
+                                    configurations each one writes to its own sub-directory.
+        :param  warm                Reuse a single network for all the tests instead of rebuilding it per test.
+        :param  store               Path of the SQLite result store, None to not record the tests.
+        :param  live_port           Local port of the live statistics endpoint, None to not monitor the flows live.
+                                    Parallel tests use live_port + job slot.
+        :param  adaptive            Dictionary with the convergence options, None to run the clients for
+                                    iperf_runtime seconds (see run_iperf()).
+        :param  opticals            List of optical configurations to test (see optical_configs()), [optical_params]
+                                    by default.
+        :param  sample_interval     Interval in seconds between two TCP state samples, None to not sample it.
+        :param  layout              Dictionary with the pairs and channels of the network (see make_layout()),
+                                    wdm_layout by default.
+        :param  multiplex           Run one test per wavelength at the same time on a single network (see
+                                    multiplex_tests()).
+        :param  schedule            List of flows (see flow_scheduler) to run in every test instead of the pairs of
+                                    the layout.
+        :param  repetitions         Number of times every test is run. Each repetition writes to its own rep<n>
+                                    sub-directory and is recorded as its own trial.
+        :param  resume              Run the tests as a resumable sweep (see sweep_manifest): every test writes to its
+                                    own <alg>_<delay>ms_<hash> directory, tests already in the store are skipped and
+                                    failed tests are run again. Not available in warm or multiplexed mode.
+        :param  retries             Number of times a failed test is run again when resuming.
+        :param  plan                Dictionary with the budget (maximum number of tests), batch size and objective
+                                    of an adaptive sweep (see sweep_manifest.run_planned_sweep()), which only runs the
+                                    tests chosen by the planner. None to run all the tests. Needs resume.
     """
+    opticals = opticals or [optical_params]
     print("*** Tests settings:\n - Algorithms: {0}\n - delays: {1}\n - Iperf runtime: {2}\n - Iperf delayed start: {3}"
           .format(algs, delays, iperf_runtime, iperf_delayed_start))
-    for alg in algs:
-        print('*** Starting test for algorithm={0}...'.format(alg))
-        for delay in delays:
-            print('*** Starting test for delay={0}ms...'.format(delay))
-
-
-
-            # Create the net topology
-            print('*** Creating topology for delay={0}ms...'.format(delay))
-            topo = DumbbellTopo(delay=delay)
-
-            # Start mininet
-            net = Mininet(topo)
-        
-            restServer = RestServer(net)
-            net.start()
-     
-            # Get the hosts
-            h1, h2, h3, h4 = net.get('h1', 'h2', 'h3', 'h4')
-            host_addrs = dict({'h1': h1.IP(), 'h2': h2.IP(), 'h3': h3.IP(), 'h4': h4.IP()})
-            print('Host addrs: {0}'.format(host_addrs))
-            
-            
-            restServer.start()
-            ################%%%%%%%%%%%%%%%%%%%%%%%%%#############3
-            os.system("./config-singlelink_r1r2.sh")
-            info(__doc__)
-            #test(net) if 'test' in argv else CLI(net)
-            restServer.stop()
-            #net.stop()
-        
-
-
-            # Run iperf
-            popens = dict()
-            print("*** Starting iperf servers h2 and h4...")
-            popens[h2] = h2.popen(['iperf', '-s', '-p', '5001', '-w', '16m'])
-            popens[h4] = h4.popen(['iperf', '-s', '-p', '5001', '-w', '16m'])
-
-            # Client options:
-            # -i: interval between reports set to 1sec
-            # -l: length read/write buffer set to default 8KB
-            # -w: TCP window size (socket buffer size) set to 16MB
-            # -M: TCP MSS (MTU-40B) set to 1460B for an MTU of 1500B
-            # -N: disable Nagle's Alg
-            # -Z: select TCP Congestion Control alg
-            # -t: transmission time
-            # -f: format set to kilobits
-            # -y: report style set to CSV
-            # TODO: run iperfs without the -y C to see if we get errors setting the MSS. Use sudo?
-            print("*** Starting iperf client h1...")
-
-
-            popens[h1] = h1.popen('iperf -c {0} -p 5001 -i 1 -w 16m -M 1460 -N -Z {1} -t {2} -y C > \
-                                   iperf_{1}_{3}_{4}ms.txt'
-                                  .format(h2.IP(), alg, iperf_runtime, 'h1-h2', delay), shell=True)
-
-            # Delay before starting the second iperf proc
-            print("*** Waiting for {0}sec...".format(iperf_delayed_start))
-            sleep(iperf_delayed_start)
-
-            print("*** Starting iperf client h3...")
-
-            popens[h3] = h3.popen('iperf -c {0} -p 5001 -i 1 -w 16m -M 1460 -N -Z {1} -t {2} -y C > \
-                                   iperf_{1}_{3}_{4}ms.txt'
-                                  .format(h4.IP(), alg, iperf_runtime, 'h3-h4', delay), shell=True)
-
-            # Wait for clients to finish sending data
-            print("*** Waiting {0}sec for iperf clients to finish...".format(iperf_runtime))
-            popens[h1].wait()
-            popens[h3].wait()
-
-            # Terminate the servers and tcpprobe subprocesses
-            print('*** Terminate the iperf servers and tcpprobe processes...')
-            popens[h2].terminate()
-            popens[h4].terminate()
-         
-
-            popens[h2].wait()
-            popens[h4].wait()
-
-            print("*** Stopping test...")
-            net.stop()
-
-            print('*** Processing data...')
-            data_fairness = parse_iperf_data(alg, delay, host_addrs)
-
-            draw_fairness_plot(data_fairness['h1']['time'], data_fairness['h1']['Mbps'],
-                               data_fairness['h3']['time'], data_fairness['h3']['Mbps'], alg, delay)
+    # The optical configuration is the outer loop: a warm network is rebuilt only when it changes. The repetitions
+    # of a configuration follow each other, each on a freshly built network.
+    runs = list()
+    for optical in opticals:
+        optical_dir = outdir if len(opticals) == 1 else join(outdir, optical_tag(optical))
+        for repetition in range(repetitions):
+            run_dir = optical_dir if repetitions == 1 else join(optical_dir, 'rep{0}'.format(repetition))
+            os.makedirs(run_dir, exist_ok=True)
+            runs.append((optical, run_dir, repetition))
+
+    if multiplex:
+        if jobs > 1 or warm:
+            print('*** Multiplexed mode runs on a single network, ignoring --jobs and --warm')
+        for optical, run_dir, repetition in runs:
+            print('*** Starting tests for optical configuration {0}, repetition {1}...'
+                  .format(optical_tag(optical), repetition))
+            multiplex_tests(algs, delays, iperf_runtime, iperf_delayed_start, run_dir, store, live_port, adaptive,
+                            optical, sample_interval, layout, repetition)
+        return
+
+    if warm:
+        if jobs > 1:
+            print('*** Warm topology mode runs on a single network, ignoring --jobs={0}'.format(jobs))
+        for optical, run_dir, repetition in runs:
+            print('*** Starting tests for optical configuration {0}, repetition {1}...'
+                  .format(optical_tag(optical), repetition))
+            warm_tests(algs, delays, iperf_runtime, iperf_delayed_start, run_dir, store, live_port, adaptive,
+                       optical, sample_interval, layout, schedule, repetition)
+        return
+
+    if resume:
+        points = list()
+        for optical, run_dir, repetition in runs:
+            for alg in algs:
+                for delay in delays:
+                    params = dict(algorithm=alg, delay_ms=delay, iperf_runtime=iperf_runtime,
+                                  iperf_delayed_start=iperf_delayed_start, adaptive=adaptive,
+                                  optical=optical, sample_interval=sample_interval, layout=layout or wdm_layout,
+                                  schedule=schedule, repetition=repetition)
+                    # Only a non-default generator enters the hash, so that the points of older sweeps keep theirs
+                    if (traffic.name, traffic.interval) != (Iperf2.name, Iperf2().interval):
+                        params.update(traffic_generator=traffic.name, report_interval=traffic.interval)
+                    key = point_key(params)
+                    points.append(dict(key=key, params=params,
+                                       outdir=join(run_dir, '{0}_{1}ms_{2}'.format(alg, delay, key)),
+                                       args=(alg, delay, iperf_runtime, iperf_delayed_start, store, live_port,
+                                             adaptive, optical, sample_interval, layout, schedule, repetition, key)))
+
+        def run_points(pending):
+            if jobs > 1:
+                keys = dict((point['outdir'], point['key']) for point in pending)
+                failed = run_parallel(run_test, [(point['outdir'], point['args']) for point in pending], jobs)
+                return dict((keys[point_dir], error) for point_dir, error in failed.items())
+            errors = dict()
+            for point in pending:
+                print('*** Starting test {0}...'.format(point['outdir']))
+                try:
+                    run_test(*point['args'], outdir=point['outdir'])
+                except Exception as e:
+                    print('*** Test {0} failed: {1}'.format(point['outdir'], e))
+                    errors[point['key']] = str(e)
+            return errors
+
+        if plan is None:
+            run_sweep(points, run_points, store, retries)
+            return
+
+        def features(point):
+            # Measured OSNR of the first channel once the optical configuration was built, estimated before
+            params = point['params']
+            measured = cached_osnr(osnr_key(params['optical'], params['layout']['channels'][0], params['layout']),
+                                   store)
+            if measured is None or measured.get('osnr') is None:
+                osnr = estimate_osnr(params['optical']['span_km'], params['optical']['n_spans'],
+                                     params['optical']['launch_power_dbm'])
+            else:
+                osnr = measured['osnr']
+            return dict(algorithm=params['algorithm'], rtt_ms=2 * params['delay_ms'], osnr_db=osnr,
+                        queue=link_params(params['delay_ms'])[0]['max_queue_size'])
+
+        capacity = min(params['bw'] for params in link_params(delays[0]))
+        run_planned_sweep(points, run_points, store, features, plan['budget'], plan['batch'], retries,
+                          plan['objective'], capacity, (layout or wdm_layout)['pairs'])
+        return
+
+    if jobs > 1:
+        points = [(join(run_dir, '{0}_{1}ms'.format(alg, delay)),
+                   (alg, delay, iperf_runtime, iperf_delayed_start, store, live_port, adaptive, optical,
+                    sample_interval, layout, schedule, repetition))
+                  for optical, run_dir, repetition in runs for alg in algs for delay in delays]
+        run_parallel(run_test, points, jobs)
+        return
+
+    for optical, run_dir, repetition in runs:
+        print('*** Starting tests for optical configuration {0}, repetition {1}...'
+              .format(optical_tag(optical), repetition))
+        for alg in algs:
+            print('*** Starting test for algorithm={0}...'.format(alg))
+            for delay in delays:
+                print('*** Starting test for delay={0}ms...'.format(delay))
+                run_test(alg, delay, iperf_runtime, iperf_delayed_start, store, live_port, adaptive, optical,
+                         sample_interval, layout, schedule, repetition, outdir=run_dir)
+
+
+def spec_tests(spec, defaults, jobs=1, outdir='.', store=None, live_port=None, adaptive=None, sample_interval=None,
+               schedule=None, dry_run=False):
+    """ Run the tests of a declarative sweep specification (see sweep_spec), grouped by physical configuration.
+
+        Tests already in the result store (same sweep point key) are skipped. The tests left are ordered so that the
+        network is only rebuilt when the optical layer, the links or the layout change, and the estimated wall-clock
+        time of the sweep is printed before it starts, from the phase timings of the runs already in the store (see
+        phase_trace) or sweep_spec.default_costs.
+
+        :param  spec                Specification (see sweep_spec.load_spec()).
+        :param  defaults            Dictionary with the value of every parameter the specification does not give.
+        :param  jobs                Number of tests to run at the same time in cold mode.
+        :param  outdir              Directory where the results are written, one <n>_<optical tag> sub-directory per
+                                    group and one <alg>_<delay>ms_<hash> directory per test.
+        :param  store               Path of the SQLite result store.
+        :param  live_port           Local port of the live statistics endpoint, None to not monitor the flows live.
+        :param  adaptive            Dictionary with the convergence options, None to run the clients for their whole
+                                    runtime (see run_iperf()).
+        :param  sample_interval     Interval in seconds between two TCP state samples, None to not sample it.
+        :param  schedule            List of flows (see flow_scheduler) to run in every test instead of the pairs of
+                                    the layout.
+        :param  dry_run             Only print the tests and the estimate.
+    """
+    global link_config
+    tests, counts = sweep_spec.expand(spec, defaults, make_layout)
+    conn = open_store(store)
+    done = completed_points(conn)
+    costs = sweep_spec.measured_costs(conn)
+    conn.close()
+    pending = [test for test in tests if test['key'] not in done]
+    groups = sweep_spec.order(pending)
+    mode = spec.get('mode', 'warm')
+    estimate = sweep_spec.estimate(groups, costs, mode, jobs, admission_interval if jobs > 1 else 0)
+    print('*** Sweep specification: {0} combinations, {1} rejected by the constraints, {2} duplicates, {3} already '
+          'complete, {4} tests to run'.format(counts['combinations'], counts['rejected'], counts['duplicates'],
+                                               len(tests) - len(pending), len(pending)))
+    for number, group in enumerate(groups):
+        print('*** {0:3d} {1} {2} pairs={3}: {4}'.format(
+            number, optical_tag(group['optical']), group['links'], group['layout']['pairs'],
+            ', '.join('{algorithm}/{delay_ms}ms'.format(**test) for test in group['tests'])))
+    print('*** {0} mode: {builds} network builds, {osnr_reads} OSNR reads, {delay_changes} delay changes, estimated '
+          '{1}'.format(mode, sweep_spec.format_duration(estimate['total_s']), **estimate))
+    if dry_run:
+        return
+
+    start = time()
+    for number, group in enumerate(groups):
+        run_dir = join(outdir, '{0:03d}_{1}'.format(number, optical_tag(group['optical'])))
+        for test in group['tests']:
+            test['outdir'] = join(run_dir, '{0}_{1}ms_{2}'.format(test['algorithm'], test['delay_ms'], test['key']))
+            os.makedirs(test['outdir'], exist_ok=True)
+        # Forked parallel tests inherit the link parameters of their group
+        link_config = group['links']
+        print('*** Starting group {0} of {1}...'.format(number + 1, len(groups)))
+        if mode == 'warm':
+            warm_tests(None, None, None, None, run_dir, store, live_port, adaptive, group['optical'],
+                       sample_interval, group['layout'], schedule, group['repetition'], group['tests'])
+            continue
+        args = [(test['algorithm'], test['delay_ms'], test['iperf_runtime'], test['iperf_delayed_start'], store,
+                 live_port, adaptive, group['optical'], sample_interval, group['layout'], schedule,
+                 group['repetition'], test['key']) for test in group['tests']]
+        if jobs > 1:
+            run_parallel(run_test, [(test['outdir'], test_args) for test, test_args in zip(group['tests'], args)],
+                         jobs)
+        else:
+            for test, test_args in zip(group['tests'], args):
+                run_test(*test_args, outdir=test['outdir'])
+    print('*** Sweep done in {0} (estimated {1})'.format(sweep_spec.format_duration(time() - start),
+                                                          sweep_spec.format_duration(estimate['total_s'])))
 
 
 if __name__ == '__main__':
@@ -409,7 +1444,165 @@ if __name__ == '__main__':
                         help='Time to wait before starting the second iperf client.')
     parser.add_argument('-l', '--log-level', default='info', help='Verbosity level of the logger. Uses `info` by default.')
     parser.add_argument('-t', '--run-test', action='store_true', help='Run the dumbbell topology test.')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='Number of tests to run at the same time, each on its own emulated network.')
+    parser.add_argument('-o', '--outdir', default='.', help='Directory where the results are written.')
+    parser.add_argument('-s', '--store', help='SQLite result store. Uses <outdir>/results.db by default.')
+    parser.add_argument('--live', type=int, metavar='PORT',
+                        help='Monitor the flows live: print their throughput and Jain index, and serve them as JSON on '
+                             'http://127.0.0.1:PORT/.')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='Stop the iperf clients once throughput and fairness converged. The iperf runtime is '
+                             'then the maximum duration.')
+    parser.add_argument('--ci-width', type=float, default=0.05,
+                        help='Relative half-width of the 95%% confidence intervals to reach in adaptive mode.')
+    parser.add_argument('--min-runtime', type=int, default=60, help='Minimum test duration in adaptive mode.')
+    parser.add_argument('--span-lengths', nargs='+', type=float, default=[optical_params['span_km']],
+                        help='List of fiber span lengths (km) of the WDM links to test.')
+    parser.add_argument('--span-counts', nargs='+', type=int, default=[optical_params['n_spans']],
+                        help='List of numbers of spans per WDM link to test.')
+    parser.add_argument('--boost-gains', nargs='+', type=float, default=[optical_params['boost_gain_db']],
+                        help='List of boost amplifier gains (dB) to test.')
+    parser.add_argument('--amp-gains', nargs='+', default=['none'],
+                        help='List of in-line amplifier gains (dB) to test. An amplifier follows every span; '
+                             '`none` for no in-line amplifiers, `auto` to compensate the span loss.')
+    parser.add_argument('--launch-powers', nargs='+', type=float, default=[optical_params['launch_power_dbm']],
+                        help='List of transceiver launch powers (dBm) to test.')
+    parser.add_argument('--tcp-sample', type=float, metavar='MS',
+                        help='Sample cwnd, RTT and retransmissions of the iperf clients every MS milliseconds '
+                             '(down to about 10) into tcp_<alg>_<delay>ms.npz.')
+    parser.add_argument('--pairs', type=int,
+                        help='Number of sender/receiver host pairs (competing flows). 2 by default, 2 per channel '
+                             'with --multiplex.')
+    parser.add_argument('--channels', nargs='+', type=int, default=wdm_layout['channels'],
+                        help='List of WDM channels lit between t1 and t2, each carrying its own packet domain.')
+    parser.add_argument('--flow-channels', nargs='+', type=int,
+                        help='Channel of every pair, in pair order. Pairs are spread round robin over the channels '
+                             'by default.')
+    parser.add_argument('-m', '--multiplex', action='store_true',
+                        help='Run one (algorithm, delay) test per channel at the same time on a single network, each '
+                             'channel carrying its own packet domain.')
+    parser.add_argument('--schedule', metavar='FILE',
+                        help='Run the flows of a JSON or CSV schedule (start, src, dst, duration or bytes, alg) '
+                             'instead of the competing pairs.')
+    parser.add_argument('--poisson', type=float, metavar='RATE',
+                        help='Run size-limited flows arriving as a Poisson process of RATE flows/sec on the pairs '
+                             'during the iperf runtime, instead of the competing pairs.')
+    parser.add_argument('--mean-size', type=float, default=100,
+                        help='Mean size (MB) of the Poisson flows, exponentially distributed.')
+    parser.add_argument('--seed', type=int, help='Seed of the Poisson schedule.')
+    parser.add_argument('-r', '--repetitions', type=int, default=1,
+                        help='Run every test K times, each on a fresh network, to estimate between-run variance. '
+                             'Repetition n writes to the rep<n> sub-directory.')
+    parser.add_argument('--resume', action='store_true',
+                        help='Run the tests as a resumable sweep: every test is identified by a hash of its '
+                             'parameters and writes to its own directory, tests already in the result store are '
+                             'skipped and failed tests are retried.')
+    parser.add_argument('--retries', type=int, default=2, help='Number of times a failed test is retried with --resume.')
+    parser.add_argument('--plan', type=int, metavar='BUDGET',
+                        help='Adaptive sweep: run at most BUDGET of the tests, chosen batch by batch where the best '
+                             'algorithm predicted by surrogate models of the completed tests is most uncertain. '
+                             'Implies --resume.')
+    parser.add_argument('--plan-batch', type=int, default=4, help='Number of tests chosen at a time with --plan.')
+    parser.add_argument('--plan-objective', choices=['throughput', 'jain', 'mix'], default='throughput',
+                        help='Metric ranking the algorithms with --plan.')
+    parser.add_argument('--full-cleanup', action='store_true',
+                        help='Run `mn -c` before the tests instead of only removing the interfaces and bridges left '
+                             'by a previous test.')
+    parser.add_argument('--generator', choices=['iperf2', 'iperf3', 'builtin'], default=traffic.name,
+                        help='Traffic generator of the flows: iperf2 (CSV reports), iperf3 (JSON reports down to '
+                             '0.1s) or the built-in bulk sender of bulk_transfer.py (JSON reports down to 0.01s, '
+                             'algorithm switched on command).')
+    parser.add_argument('--report-interval', type=float, metavar='SEC',
+                        help='Throughput report interval of the flows, 1s for iperf2 and 0.1s for the JSON '
+                             'generators by default.')
+    parser.add_argument('--telemetry', type=float, metavar='SEC',
+                        help='Poll the OSNR, gOSNR and power of every channel at the optical monitors every SEC '
+                             'seconds during the tests, recorded with the runs and in telemetry_<alg>_<delay>ms.npz.')
+    parser.add_argument('--telemetry-monitors', nargs='+', default=telemetry_params['monitors'],
+                        help='Monitors polled with --telemetry, e.g. t1-monitor t2-monitor and amplifier or ROADM '
+                             'port monitors.')
+    parser.add_argument('--spec', metavar='FILE',
+                        help='Run the sweep described by a JSON specification (axes, fixed parameters, constraints, '
+                             'see sweep_spec.py) instead of the sweep of the command line. Algorithms, delays, timings '
+                             'and the layout of the command line are the defaults of the parameters it does not give.')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='With --spec, only print the tests, their order and the estimated wall-clock time.')
+    parser.add_argument('--watchdog', type=float, nargs='?', const=1.0, metavar='SEC',
+                        help='Watch the busy and softirq time of the cores (sampled every SEC seconds, 1 by default), '
+                             'the kernel receive backlog and the netem drops during the tests, and flag the runs where '
+                             'the emulation host was saturated (fidelity_saturated).')
+    parser.add_argument('--pin', action='store_true',
+                        help='Run the harness and Open vSwitch on dedicated cores and the iperf processes of every '
+                             'host on its own core (taskset). Implies --watchdog.')
+    parser.add_argument('--reruns', type=int, default=0, metavar='N',
+                        help='Run a test again, up to N times, when the emulation host was saturated. Implies '
+                             '--watchdog.')
+    parser.add_argument('--capture', type=int, nargs='?', const=default_snaplen, metavar='SNAPLEN',
+                        help='Capture the first SNAPLEN bytes ({0} by default) of the TCP packets on the backbone '
+                             'router to terminal and access links during the tests, analyzed into per-flow '
+                             'retransmissions, out-of-order segments and RTT samples in pcap_<alg>_<delay>ms_<link>/ '
+                             '(see Scripts/pcap_analysis.py) and recorded with the runs.'.format(default_snaplen))
+    parser.add_argument('--keep-pcap', action='store_true',
+                        help='Keep the pcap files of --capture after their analysis.')
+    parser.add_argument('--trace', metavar='FILE',
+                        help='Time every phase of the tests (cleanup, topology build, net.start(), REST '
+                             'configuration, flows, net.stop(), parsing...) and sample the host CPU and memory, '
+                             'written to FILE as Chrome trace events and with every run as phase_<name>_s values.')
+    parser.add_argument('-w', '--warm', action='store_true',
+                        help='Build the network once and only change the CCA and link parameters between tests.')
     args = parser.parse_args()
+    if args.pairs is None:
+        args.pairs = 2*len(args.channels) if args.multiplex else wdm_layout['pairs']
+    try:
+        layout = make_layout(args.pairs, args.channels, args.flow_channels)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.multiplex and any(ch not in layout['flow_channels'] for ch in layout['channels']):
+        parser.error('--multiplex needs at least one pair on every channel')
+    telemetry_params.update(interval=args.telemetry, monitors=args.telemetry_monitors)
+    fidelity_params.update(watch=args.watchdog is not None or args.pin or args.reruns > 0,
+                           interval=args.watchdog or 1.0, pin=args.pin, reruns=args.reruns)
+    capture_params.update(snaplen=args.capture, keep=args.keep_pcap)
+    try:
+        traffic = make_generator(args.generator, args.report_interval)
+    except ValueError as e:
+        parser.error(str(e))
+    schedule = None
+    if args.schedule or args.poisson:
+        if args.multiplex or args.adaptive:
+            parser.error('--schedule and --poisson can not be used with --multiplex or --adaptive')
+        if args.schedule:
+            schedule = load_schedule(args.schedule)
+        else:
+            schedule = poisson_schedule(flow_pairs(layout), args.poisson, args.iperf_runtime,
+                                        int(args.mean_size * 1e6), args.seed)
+        print('*** Schedule of {0} flows'.format(len(schedule)))
+
+    spec = None
+    if args.spec:
+        if args.resume or args.plan is not None or args.warm or args.multiplex:
+            parser.error('--spec sets the mode of its sweep, it can not be used with --resume, --plan, --warm or '
+                         '--multiplex')
+        try:
+            spec = sweep_spec.load_spec(args.spec)
+            # Algorithms and delays of the command line are swept unless the specification gives them
+            for name, values in (('algorithm', args.algorithms), ('delay_ms', args.delays)):
+                if name not in spec.get('fixed', dict()):
+                    spec.setdefault('axes', dict()).setdefault(name, values)
+            spec.setdefault('repetitions', args.repetitions)
+            spec_defaults = dict(optical_params, iperf_runtime=args.iperf_runtime,
+                                 iperf_delayed_start=args.iperf_delayed_start, pairs=layout['pairs'],
+                                 channels=layout['channels'], flow_channels=args.flow_channels, **link_config)
+            # Check the constraints and layouts before cleaning up and building anything
+            sweep_spec.expand(spec, spec_defaults, make_layout)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+
+    if args.plan is not None:
+        args.resume = True
+    if args.resume and (args.warm or args.multiplex):
+        parser.error('--resume runs every test on its own network, it can not be used with --warm or --multiplex')
 
     if args.log_level:
         # Tell mininet to print useful information
@@ -417,12 +1610,32 @@ if __name__ == '__main__':
     else:
         setLogLevel('info')
 
-    if args.run_test:
-        dumbbell_test()
-    
-    else:
-        tcp_tests(args.algorithms, args.delays, args.iperf_runtime, args.iperf_delayed_start)
-
-
-
-
+    if args.trace:
+        phase_trace.enable(args.trace)
+
+    try:
+        with span('cleanup', full=args.full_cleanup):
+            cleanup_network(args.full_cleanup)
+        if args.pin:
+            pin_system()
+
+        if args.run_test:
+            dumbbell_test()
+
+        elif spec is not None:
+            spec_tests(spec, spec_defaults, args.jobs, args.outdir, args.store or join(args.outdir, 'results.db'),
+                       args.live, dict(ci_width=args.ci_width, min_runtime=args.min_runtime) if args.adaptive else None,
+                       args.tcp_sample / 1000 if args.tcp_sample else None, schedule, args.dry_run)
+
+        else:
+            tcp_tests(args.algorithms, args.delays, args.iperf_runtime, args.iperf_delayed_start, args.jobs,
+                      args.outdir, args.warm, args.store or join(args.outdir, 'results.db'), args.live,
+                      dict(ci_width=args.ci_width, min_runtime=args.min_runtime) if args.adaptive else None,
+                      optical_configs(args.span_lengths, args.span_counts, args.boost_gains, args.amp_gains,
+                                      args.launch_powers),
+                      args.tcp_sample / 1000 if args.tcp_sample else None, layout, args.multiplex, schedule,
+                      args.repetitions, args.resume, args.retries,
+                      None if args.plan is None else dict(budget=args.plan, batch=args.plan_batch,
+                                                          objective=args.plan_objective))
+    finally:
+        phase_trace.save()
@@ -0,0 +1,135 @@
+##
+# Traffic generators of the test flows.
+#
+# Every backend knows how to start its servers and clients and how to parse one line of client output for the live
+# monitor. All of them produce files that ../Scripts/iperf_loader.load_iperf() turns into the same columnar time
+# series (time, start, end, bytes, mbps):
+#
+#   iperf2      `iperf -y C` CSV reports, down to 0.5s intervals (.txt).
+#   iperf3      `iperf3 --json-stream` reports, one JSON object per line, down to 0.1s intervals (.json).
+#   builtin     The asyncio bulk sender of bulk_transfer.py, writing the same JSON lines as iperf3 (.json). Its
+#               congestion control algorithm can be switched during the flow through a control socket.
+#
+# iperf3 servers handle one test at a time, so every iperf3 flow gets its own server and port.
+#
+
+import json
+import sys
+from os.path import dirname, join, realpath
+from live_monitor import parse_report
+
+# Server port of the flows. Backends with one server per flow use base_port + flow index.
+base_port = 5001
+# Program of the builtin generator
+bulk_transfer = join(dirname(realpath(__file__)), 'bulk_transfer.py')
+
+
+def parse_json_report(line):
+    """ Parse a `iperf3 --json-stream` line.
+
+        :param  line    String with the JSON line.
+        :return Tuple (interval start, interval end, Mbps), or None if the line is not an interval report.
+    """
+    if '"interval"' not in line:
+        return None
+    try:
+        total = json.loads(line)['data']['sum']
+        return total['start'], total['end'], total['bits_per_second'] / 1000000
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class Iperf2(object):
+    """ iperf 2 clients with CSV reports. One server per receiving host serves all its flows.
+    """
+    name = 'iperf2'
+    suffix = '.txt'
+    port_per_flow = False
+    switchable = False
+    min_interval = 0.5
+    parse_report = staticmethod(parse_report)
+
+    def __init__(self, interval=1):
+        self.interval = interval
+
+    def server(self, port):
+        return ['iperf', '-s', '-p', str(port), '-w', '16m']
+
+    def client(self, dst, port, alg, duration=None, size=None):
+        # -i: interval between reports
+        # -w: TCP window size (socket buffer size) set to 16MB
+        # -M: TCP MSS (MTU-40B) set to 1460B for an MTU of 1500B
+        # -N: disable Nagle's Alg
+        # -Z: select TCP Congestion Control alg
+        # -t: transmission time, or -n: amount of data to send, for size-limited flows
+        # -y: report style set to CSV
+        limit = ['-t', str(duration)] if size is None else ['-n', str(size)]
+        return ['iperf', '-c', dst, '-p', str(port), '-i', '{0:g}'.format(self.interval), '-w', '16m', '-M', '1460',
+                '-N', '-Z', alg] + limit + ['-y', 'C']
+
+
+class Iperf3(object):
+    """ iperf3 clients with JSON reports streamed as they are produced. Every flow has its own one-off server.
+    """
+    name = 'iperf3'
+    suffix = '.json'
+    port_per_flow = True
+    switchable = False
+    min_interval = 0.1
+    parse_report = staticmethod(parse_json_report)
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+
+    def server(self, port):
+        # -1: exit after serving one client
+        return ['iperf3', '-s', '-1', '-p', str(port)]
+
+    def client(self, dst, port, alg, duration=None, size=None):
+        # -C: TCP Congestion Control alg (-Z is zero copy in iperf3)
+        # --json-stream: one JSON object per report, --forceflush: write each one at once
+        limit = ['-t', str(duration)] if size is None else ['-n', str(size)]
+        return ['iperf3', '-c', dst, '-p', str(port), '-i', '{0:g}'.format(self.interval), '-w', '16m', '-M', '1460',
+                '-N', '-C', alg] + limit + ['--json-stream', '--forceflush']
+
+
+class Builtin(object):
+    """ The bulk TCP sender of bulk_transfer.py, with iperf3 JSON reports. One server per receiving host.
+    """
+    name = 'builtin'
+    suffix = '.json'
+    port_per_flow = False
+    switchable = True
+    min_interval = 0.01
+    parse_report = staticmethod(parse_json_report)
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+
+    def server(self, port):
+        return [sys.executable, bulk_transfer, 'server', '-p', str(port)]
+
+    def client(self, dst, port, alg, duration=None, size=None, control=None):
+        # --control: Unix socket receiving the congestion control switch commands
+        limit = ['-t', str(duration)] if size is None else ['-n', str(size)]
+        control = [] if control is None else ['--control', control]
+        return [sys.executable, bulk_transfer, 'client', dst, '-p', str(port), '-i',
+                '{0:g}'.format(self.interval), '-C', alg] + limit + control
+
+
+generators = dict((cls.name, cls) for cls in (Iperf2, Iperf3, Builtin))
+
+
+def make_generator(name, interval=None):
+    """ Return the traffic generator backend of the given name.
+
+        :param  name        'iperf2', 'iperf3' or 'builtin'.
+        :param  interval    Report interval in seconds, the default of the backend if None.
+        :raise  ValueError  Unknown backend, or interval below the resolution of the backend.
+    """
+    if name not in generators:
+        raise ValueError('Unknown traffic generator {0}, use one of {1}'.format(name, ', '.join(generators)))
+    cls = generators[name]
+    if interval is not None and interval < cls.min_interval:
+        raise ValueError('{0} reports every {1:g}s at the most'.format(name, cls.min_interval))
+    return cls() if interval is None else cls(interval)
@@ -0,0 +1,89 @@
+import argparse
+import random
+import threading
+import numpy as np
+from http.client import HTTPConnection
+from time import perf_counter
+from cca_decision import CcaDecision, OBJECTIVES, serve
+
+
+def random_queries(decision, n, seed=0):
+    """
+    Gera n consultas (OSNR, RTT, objetivo) uniformes sobre a grade da tabela, com um pouco de margem fora dela.
+    """
+    rnd = random.Random(seed)
+    osnr_max = decision.osnr0 + decision.osnr_step * (decision.n_osnr - 1)
+    rtt_max = decision.rtt0 + decision.rtt_step * (decision.n_rtt - 1)
+    return [(rnd.uniform(decision.osnr0 - 1, osnr_max + 1), rnd.uniform(decision.rtt0 - 1, rtt_max + 1),
+             rnd.choice(OBJECTIVES)) for _ in range(n)]
+
+
+def bench_api(decision, queries):
+    """
+    Latência (s) de cada chamada direta a decide().
+    """
+    latencies = np.empty(len(queries))
+    for k, (osnr, rtt, objective) in enumerate(queries):
+        start = perf_counter()
+        decision.decide(osnr, rtt, objective)
+        latencies[k] = perf_counter() - start
+    return latencies
+
+
+def bench_rest(port, queries, sessions):
+    """
+    Latência (s) de cada consulta REST com 'sessions' clientes concorrentes, cada um com sua conexão persistente.
+    """
+    latencies = np.empty(len(queries))
+    barrier = threading.Barrier(sessions)
+
+    def client(index):
+        conn = HTTPConnection('127.0.0.1', port)
+        barrier.wait()
+        for k in range(index, len(queries), sessions):
+            osnr, rtt, objective = queries[k]
+            start = perf_counter()
+            conn.request('GET', '/cca?osnr={0:.3f}&rtt={1:.3f}&objective={2}'.format(osnr, rtt, objective))
+            conn.getresponse().read()
+            latencies[k] = perf_counter() - start
+        conn.close()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(sessions)]
+    start = perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, perf_counter() - start
+
+
+def print_latencies(name, latencies, elapsed=None):
+    us = latencies * 1e6
+    rate = ' {0:9.0f} req/s'.format(len(latencies) / elapsed) if elapsed else ''
+    print(f'{name:>24}: p50 {np.percentile(us, 50):8.1f} us  p99 {np.percentile(us, 99):8.1f} us  '
+          f'max {us.max():8.1f} us{rate}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Latência do serviço de decisão de algoritmo sob carga concorrente.')
+    parser.add_argument('table_path', help='Tabela gerada por cca_decision.py build.')
+    parser.add_argument('-n', '--requests', type=int, default=20000, help='Número de consultas por teste.')
+    parser.add_argument('-c', '--sessions', type=int, nargs='+', default=[1, 8, 32, 128],
+                        help='Números de sessões concorrentes a testar.')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+
+    decision = CcaDecision.load(args.table_path)
+    queries = random_queries(decision, args.requests)
+    print_latencies('API Python', bench_api(decision, queries))
+
+    server = serve(decision, args.port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        for sessions in args.sessions:
+            latencies, elapsed = bench_rest(args.port, queries, sessions)
+            print_latencies('REST, {0} sessões'.format(sessions), latencies, elapsed)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,124 @@
+import argparse
+import json
+import numpy as np
+from time import perf_counter
+from result_store import open_store, find_runs, load_series
+from fairness_metrics import run_metrics
+
+# Colunas que definem uma configuração: execuções com os mesmos valores (e as mesmas bandas e filas dos enlaces, em
+# params['links']) são repetições (trials) dela
+CONFIG_COLUMNS = ['algorithm', 'delay_ms', 'span_km', 'n_spans', 'boost_gain_db', 'amp_gains_db', 'launch_power_dbm',
+                  'n_pairs', 'n_channels', 'queue_br', 'queue_ar', 'queue_hi']
+
+# Métricas de cada trial, na ordem do último eixo da matriz de trials
+METRICS = ['throughput', 'jain']
+
+
+def collect_trials(conn, **filters):
+    """
+    Agrupa as execuções do banco por configuração e calcula a vazão agregada média e o Jain médio de cada uma
+    (fairness_metrics.run_metrics()). Retorna (configurações, trials): a lista de dicionários com as colunas de
+    CONFIG_COLUMNS, os enlaces ('links', None nas execuções que não os gravaram) e o OSNR médio, e a matriz
+    configurações x repetições x métricas, com NaN onde uma configuração tem menos repetições que as demais.
+    """
+    groups = dict()
+    for run in find_runs(conn, **filters):
+        metrics = run_metrics(load_series(conn, run['id']))
+        if metrics is None:
+            continue
+        links = json.loads(run['params'] or '{}').get('links')
+        key = tuple(run[column] for column in CONFIG_COLUMNS) + (json.dumps(links, sort_keys=True),)
+        group = groups.setdefault(key, dict(values=list(), osnr=list()))
+        group['values'].append(metrics)
+        if run['osnr_db'] is not None:
+            group['osnr'].append(run['osnr_db'])
+
+    configs = list()
+    trials = np.full((len(groups), max([len(g['values']) for g in groups.values()] or [0]), len(METRICS)), np.nan)
+    for i, (key, group) in enumerate(sorted(groups.items(), key=lambda item: json.dumps(item[0]))):
+        config = dict(zip(CONFIG_COLUMNS, key))
+        config['links'] = json.loads(key[-1])
+        config['osnr_db'] = float(np.mean(group['osnr'])) if group['osnr'] else None
+        configs.append(config)
+        trials[i, :len(group['values'])] = group['values']
+    return configs, trials
+
+
+def bootstrap_ci(trials, n_boot=10000, alpha=0.05, seed=0, max_elements=2**24):
+    """
+    Intervalos de confiança bootstrap (percentil) da média das repetições de todas as configurações de uma vez.
+
+    'trials' é a matriz configurações x repetições (x métricas), com NaN nas repetições ausentes. Reamostrar n
+    repetições com reposição equivale a pesá-las por um vetor multinomial(n, 1/n): para cada número de repetições n,
+    os pesos das n_boot reamostras são sorteados uma vez e as médias de todas as configurações com n repetições saem
+    de um único produto de matrizes (em blocos de no máximo 'max_elements' médias, para limitar a memória). As
+    configurações com o mesmo n compartilham os sorteios, o que não altera o intervalo de cada uma.
+
+    Retorna um dicionário com vetores configurações (x métricas): 'mean', 'std' (desvio entre repetições), 'low' e
+    'high' (limites do intervalo de nível 1 - alpha) e 'n' (número de repetições).
+    """
+    trials = np.asarray(trials, dtype=float)
+    squeeze = trials.ndim == 2
+    if squeeze:
+        trials = trials[:, :, None]
+    n_configs, n_trials, n_metrics = trials.shape
+
+    # Repetições válidas primeiro em cada linha
+    missing = np.isnan(trials[:, :, 0])
+    order = np.argsort(missing, axis=1, kind='stable')
+    trials = np.take_along_axis(trials, order[:, :, None], axis=1)
+    counts = (~missing).sum(axis=1)
+
+    rng = np.random.default_rng(seed)
+    low = np.full((n_configs, n_metrics), np.nan)
+    high = np.full((n_configs, n_metrics), np.nan)
+    block = max(1, max_elements // max(1, n_boot * n_metrics))
+    for n in np.unique(counts[counts > 0]):
+        weights = rng.multinomial(n, np.full(n, 1.0 / n), size=n_boot).T / n  # n x n_boot
+        rows = np.flatnonzero(counts == n)
+        for start in range(0, len(rows), block):
+            selected = rows[start:start + block]
+            # configurações x métricas x reamostras
+            means = trials[selected, :n].transpose(0, 2, 1) @ weights
+            low[selected], high[selected] = np.percentile(means, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(trials, axis=1) / counts[:, None]
+        std = np.sqrt(np.nansum((trials - mean[:, None, :]) ** 2, axis=1) / (counts[:, None] - 1))
+    std[counts < 2] = np.nan
+
+    result = dict(mean=mean, std=std, low=low, high=high, n=counts)
+    if squeeze:
+        result = dict((key, value if key == 'n' else value[:, 0]) for key, value in result.items())
+    return result
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Intervalos de confiança bootstrap entre repetições dos testes.')
+    parser.add_argument('db_path', help='Arquivo SQLite gravado pelo topo.py.')
+    parser.add_argument('filters', nargs='*', help='Filtros coluna[_lt|_le|_gt|_ge|_ne]=valor, ex.: osnr_db_lt=28')
+    parser.add_argument('-b', '--resamples', type=int, default=10000, help='Número de reamostras bootstrap.')
+    parser.add_argument('--alpha', type=float, default=0.05, help='Intervalos de nível 1 - alpha.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    filters = dict()
+    for item in args.filters:
+        key, value = item.split('=', 1)
+        try:
+            filters[key] = float(value)
+        except ValueError:
+            filters[key] = value
+
+    configs, trials = collect_trials(open_store(args.db_path), **filters)
+    start = perf_counter()
+    ci = bootstrap_ci(trials, args.resamples, args.alpha, args.seed)
+    elapsed = perf_counter() - start
+
+    for i, config in enumerate(configs):
+        osnr = '' if config['osnr_db'] is None else ' OSNR {0:.2f} dB'.format(config['osnr_db'])
+        links = '' if config['links'] is None else ' enlaces ' + ' '.join(
+            '{0}={1}'.format(name, value) for name, value in sorted(config['links'].items()))
+        print(f"{config['algorithm']:>6} {config['delay_ms']:g}ms{osnr}{links}, {ci['n'][i]} repetições: "
+              f"vazão {ci['mean'][i, 0]:.2f} [{ci['low'][i, 0]:.2f}, {ci['high'][i, 0]:.2f}] Mbps, "
+              f"Jain {ci['mean'][i, 1]:.4f} [{ci['low'][i, 1]:.4f}, {ci['high'][i, 1]:.4f}]")
+    print(f"{len(configs)} configurações, {args.resamples} reamostras: {elapsed:.3f} s")
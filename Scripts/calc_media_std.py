@@ -1,37 +1,41 @@
 import os
-import csv
+import json
 import math
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Só grava o arquivo; funciona sem display
 import matplotlib.pyplot as plt
 from collections import defaultdict
 from matplotlib.patches import Patch
+from iperf_loader import load_iperf
+from result_store import open_store, find_runs, load_series
+from fairness_metrics import fairness_metrics
+
+# Ordem dos delays e algoritmos nos gráficos
+delay_order = ['75ms', '50ms', '10ms', '1ms']
+algorithm_order = ['reno', 'bic', 'cubic', 'bbr']
 
 def read_data(file_path, start_time, end_time, interval=10):
     """
     Lê os dados de um arquivo .txt e retorna as taxas em Mbps dentro de um intervalo de tempo específico,
     agrupando em janelas de tempo definidas por 'interval'.
     """
-    rates = defaultdict(list)
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file, delimiter=',')
-        for row in reader:
-            timestamp = int(float(row[6].split('-')[0]))  # Captura o início do intervalo em segundos
-            if start_time <= timestamp < end_time:
-                rates[timestamp // interval].append(float(row[8]) / 1e6)  # Converte bits/seg para Mbps
-
-    # Calcula a média da taxa em cada intervalo
-    avg_rates = [sum(values) / len(values) for values in rates.values() if values]
-    return avg_rates
+    return window_rates(load_iperf(file_path), start_time, end_time, interval)
 
-def jains_fairness_index(values):
+def window_rates(data, start_time, end_time, interval=10):
     """
-    Calcula o índice de equidade de Jain.
+    Retorna as taxas médias em Mbps por janela de 'interval' segundos, a partir dos vetores 'start' e 'mbps'
+    de um fluxo (lidos do arquivo do iperf ou do banco de resultados).
     """
-    if not values:
-        return 0
-    numerator = sum(values) ** 2
-    denominator = len(values) * sum(v ** 2 for v in values)
-    return numerator / denominator
+    timestamps = data['start'].astype(int)  # Início do intervalo em segundos
+    mask = (start_time <= timestamps) & (timestamps < end_time)
+    windows = timestamps[mask] // interval
+
+    # Calcula a média da taxa em cada intervalo
+    sums = np.bincount(windows, weights=data['mbps'][mask])
+    counts = np.bincount(windows)
+    avg_rates = sums[counts > 0] / counts[counts > 0]
+    return avg_rates.tolist()
 
 def calculate_statistics(values):
     """
@@ -52,9 +56,6 @@ def get_file_groups(directory):
     files = [f for f in os.listdir(directory) if f.endswith(".txt")]
     
     file_groups = defaultdict(lambda: {"h1-h2": None, "h3-h4": None})
-    
-    delay_order = ['75ms', '50ms', '10ms', '1ms']  
-    algorithm_order = ['reno', 'bic', 'cubic', 'bbr']  
 
     ordered_file_groups = defaultdict(lambda: defaultdict(list))
     
@@ -77,9 +78,56 @@ def get_file_groups(directory):
 
     return file_groups
 
-def plot_statistics(algorithms, means_h1_h2, stddevs_h1_h2, means_h3_h4, stddevs_h3_h4, jain_means, jain_stddevs):
+def optical_tag(run):
+    """
+    Nome curto da configuração óptica de uma execução, o mesmo dos diretórios do topo.py.
+    """
+    if run['span_km'] is None:
+        return 'baseline'
+    gains = '-'.join('{0:g}'.format(g) for g in sorted(set(json.loads(run['amp_gains_db'] or '[]')))) or 'none'
+    return '{0:g}km_x{1}_boost{2:g}dB_amp{3}_{4:g}dBm'.format(run['span_km'], run['n_spans'], run['boost_gain_db'],
+                                                             gains, run['launch_power_dbm'])
+
+def get_store_groups(db_path, **filters):
+    """
+    Agrupa as execuções do banco de resultados por configuração óptica e, em cada uma, por delay e algoritmo, na
+    mesma ordem de get_file_groups(). Os filtros são os de result_store.find_runs() (ex.: osnr_db_lt=28). Se houver
+    várias execuções para o mesmo par, usa a mais recente. Retorna {configuração óptica: {(algoritmo, delay):
+    {"h1-h2": séries, "h3-h4": séries}}}.
+    """
+    conn = open_store(db_path)
+    by_optical = dict()
+    for run in find_runs(conn, algorithm=algorithm_order, **filters):
+        by_optical.setdefault(optical_tag(run), list()).append(run)
+    store_groups = dict((tag, runs_groups(conn, runs)) for tag, runs in sorted(by_optical.items()))
+    conn.close()
+    return store_groups
+
+def runs_groups(conn, runs):
     """
-    Gera um gráfico bidirecional com faixas de fundo coloridas por delay.
+    Agrupa as execuções de uma configuração óptica por delay e algoritmo, usando a mais recente de cada par.
+    """
+    tags = sorted(set(optical_tag(run) for run in runs))
+    if len(tags) > 1:
+        print('Aviso: execuções de {0} configurações ópticas misturadas ({1}); use get_store_groups() ou um filtro'
+              .format(len(tags), ', '.join(tags)))
+
+    latest = dict()
+    for run in sorted(runs, key=lambda run: run['id']):
+        latest[(run['algorithm'], '{0:g}ms'.format(run['delay_ms']))] = run['id']
+
+    store_groups = dict()
+    for delay in delay_order:
+        for algorithm in algorithm_order:
+            if (algorithm, delay) in latest:
+                series = load_series(conn, latest[(algorithm, delay)])
+                store_groups[(algorithm, delay)] = {"h1-h2": series.get("h1-h2"), "h3-h4": series.get("h3-h4")}
+    return store_groups
+
+def plot_statistics(algorithms, means_h1_h2, stddevs_h1_h2, means_h3_h4, stddevs_h3_h4, jain_means, jain_stddevs,
+                    output_file="grafico_bidirecional_com_jain_e_delays.png"):
+    """
+    Gera um gráfico bidirecional com faixas de fundo coloridas por delay e o salva em output_file.
     """
     y_pos = np.arange(len(algorithms))
     fig, ax1 = plt.subplots(figsize=(10, 8))
@@ -159,11 +207,14 @@ def plot_statistics(algorithms, means_h1_h2, stddevs_h1_h2, means_h3_h4, stddevs
 
     plt.grid(True, linestyle='-.')
     plt.tight_layout()
-    plt.savefig("grafico_bidirecional_com_jain_e_delays.png")
-    plt.show()
+    plt.savefig(output_file)
+    plt.close()
 
-def main(directory, start_time1, end_time1, start_time2, end_time2, interval=10):
-    file_groups = get_file_groups(directory)
+def compute_statistics(file_groups, directory, start_time1, end_time1, start_time2, end_time2, interval=10):
+    """
+    Calcula média e desvio padrão das taxas de cada par e do índice de Jain para cada (algoritmo, delay).
+    Retorna a tupla de listas esperada por plot_statistics().
+    """
     algorithms = []
     means_h1_h2 = []
     stddevs_h1_h2 = []
@@ -176,8 +227,12 @@ def main(directory, start_time1, end_time1, start_time2, end_time2, interval=10)
         if hosts_files["h1-h2"] and hosts_files["h3-h4"]:
             print(f"Analisando para algoritmo {algorithm}, delay {delay}:")
 
-            rates_h1_h2 = read_data(os.path.join(directory, hosts_files["h1-h2"]), start_time1, end_time1, interval)
-            rates_h3_h4 = read_data(os.path.join(directory, hosts_files["h3-h4"]), start_time2, end_time2, interval)
+            if isinstance(hosts_files["h1-h2"], dict):
+                rates_h1_h2 = window_rates(hosts_files["h1-h2"], start_time1, end_time1, interval)
+                rates_h3_h4 = window_rates(hosts_files["h3-h4"], start_time2, end_time2, interval)
+            else:
+                rates_h1_h2 = read_data(os.path.join(directory, hosts_files["h1-h2"]), start_time1, end_time1, interval)
+                rates_h3_h4 = read_data(os.path.join(directory, hosts_files["h3-h4"]), start_time2, end_time2, interval)
 
             mean_h1_h2, stddev_h1_h2 = calculate_statistics(rates_h1_h2)
             mean_h3_h4, stddev_h3_h4 = calculate_statistics(rates_h3_h4)
@@ -191,11 +246,9 @@ def main(directory, start_time1, end_time1, start_time2, end_time2, interval=10)
             means_h3_h4.append(mean_h3_h4)
             stddevs_h3_h4.append(stddev_h3_h4)
 
-            # Índice de Jain por intervalos de tempo
-            jain_values = []
-            for i in range(len(rates_h1_h2)):
-                if i < len(rates_h3_h4):
-                    jain_values.append(jains_fairness_index([rates_h1_h2[i], rates_h3_h4[i]]))
+            # Índice de Jain por intervalos de tempo (matriz fluxos x janelas)
+            n_windows = min(len(rates_h1_h2), len(rates_h3_h4))
+            jain_values = fairness_metrics([rates_h1_h2[:n_windows], rates_h3_h4[:n_windows]])['jain'].tolist()
 
             mean_jain, stddev_jain = calculate_statistics(jain_values)
             print(f"  Índice de Equidade de Jain: {mean_jain:.4f} ± {stddev_jain:.4f}\n")
@@ -203,12 +256,30 @@ def main(directory, start_time1, end_time1, start_time2, end_time2, interval=10)
             jain_means.append(mean_jain)
             jain_stddevs.append(stddev_jain)
 
-    plot_statistics(algorithms, means_h1_h2, stddevs_h1_h2, means_h3_h4, stddevs_h3_h4, jain_means, jain_stddevs)
+    return algorithms, means_h1_h2, stddevs_h1_h2, means_h3_h4, stddevs_h3_h4, jain_means, jain_stddevs
+
+def main(directory, start_time1, end_time1, start_time2, end_time2, interval=10):
+    # Usa o banco de resultados do topo.py quando existir; senão, os nomes dos arquivos .txt
+    db_path = os.path.join(directory, "results.db")
+    if not os.path.exists(db_path):
+        plot_statistics(*compute_statistics(get_file_groups(directory), directory, start_time1, end_time1,
+                                            start_time2, end_time2, interval))
+        return
+    # Um gráfico por configuração óptica, para não misturar execuções de configurações diferentes
+    store_groups = get_store_groups(db_path)
+    for tag, file_groups in store_groups.items():
+        print(f"Configuração óptica {tag}:")
+        output_file = "grafico_bidirecional_com_jain_e_delays.png"
+        if len(store_groups) > 1:
+            output_file = "grafico_bidirecional_com_jain_e_delays - {0}.png".format(tag)
+        plot_statistics(*compute_statistics(file_groups, directory, start_time1, end_time1, start_time2, end_time2,
+                                            interval), output_file=output_file)
 
-directory = "."  
-start_time1 = 200
-end_time1 = 1000
-start_time2 = 0
-end_time2 = 800
+if __name__ == '__main__':
+    directory = "."
+    start_time1 = 200
+    end_time1 = 1000
+    start_time2 = 0
+    end_time2 = 800
 
-main(directory, start_time1, end_time1, start_time2, end_time2)
+    main(directory, start_time1, end_time1, start_time2, end_time2)
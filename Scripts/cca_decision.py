@@ -0,0 +1,169 @@
+import argparse
+import json
+import numpy as np
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from result_store import open_store, find_runs, load_series
+from fairness_metrics import run_metrics
+
+# Objetivos suportados. 'mix' pondera vazão normalizada e índice de Jain por 'weight'.
+OBJECTIVES = ['throughput', 'jain', 'mix']
+
+
+def collect_points(conn, **filters):
+    """
+    Lê as execuções do banco e retorna {algoritmo: vetor N x 4 com (OSNR dB, RTT ms, vazão, Jain)}.
+    Execuções repetidas no mesmo (OSNR, RTT) são mediadas.
+    """
+    samples = dict()
+    for run in find_runs(conn, **filters):
+        if run['osnr_db'] is None:
+            continue
+        metrics = run_metrics(load_series(conn, run['id']))
+        if metrics is None:
+            continue
+        key = (round(run['osnr_db'], 2), 2 * run['delay_ms'])
+        samples.setdefault(run['algorithm'], dict()).setdefault(key, list()).append(metrics)
+
+    points = dict()
+    for algorithm, by_key in samples.items():
+        points[algorithm] = np.array([[osnr, rtt] + list(np.mean(values, axis=0))
+                                      for (osnr, rtt), values in sorted(by_key.items())])
+    return points
+
+
+def interpolate(points, grid, scale, power=2):
+    """
+    Interpolação por inverso da distância (IDW) de valores dispersos 'points' (N x 3: x, y, valor) sobre os pontos
+    'grid' (G x 2). Os eixos são divididos por 'scale' para que OSNR (dB) e RTT (ms) pesem de forma comparável.
+    """
+    diff = (grid[:, None, :] - points[None, :, :2]) / scale
+    dist = np.sqrt((diff ** 2).sum(axis=2))
+    exact = dist < 1e-9
+    weights = 1.0 / np.maximum(dist, 1e-9) ** power
+    # Pontos da grade que coincidem com uma medida usam o valor medido
+    weights[exact.any(axis=1)] = exact[exact.any(axis=1)]
+    return (weights * points[None, :, 2]).sum(axis=1) / weights.sum(axis=1)
+
+
+def build_tables(points, osnr_step=0.1, rtt_step=1.0, weight=0.5):
+    """
+    Pré-calcula, para cada objetivo, a grade (OSNR, RTT) com o índice do melhor algoritmo em cada célula.
+    Retorna um dicionário pronto para np.savez / CcaDecision.
+    """
+    algorithms = sorted(points)
+    stacked = np.vstack([points[a] for a in algorithms])
+    osnr_axis = np.arange(stacked[:, 0].min(), stacked[:, 0].max() + osnr_step / 2, osnr_step)
+    rtt_axis = np.arange(stacked[:, 1].min(), stacked[:, 1].max() + rtt_step / 2, rtt_step)
+    grid = np.array(np.meshgrid(osnr_axis, rtt_axis, indexing='ij')).reshape(2, -1).T
+    scale = np.array([max(np.ptp(stacked[:, 0]), 1.0), max(np.ptp(stacked[:, 1]), 1.0)])
+
+    throughput = np.vstack([interpolate(points[a][:, [0, 1, 2]], grid, scale) for a in algorithms])
+    jain = np.vstack([interpolate(points[a][:, [0, 1, 3]], grid, scale) for a in algorithms])
+    scores = {
+        'throughput': throughput,
+        'jain': jain,
+        'mix': weight * throughput / max(throughput.max(), 1e-9) + (1 - weight) * jain,
+    }
+
+    tables = dict(algorithms=np.array(algorithms), osnr_axis=osnr_axis, rtt_axis=rtt_axis, weight=weight)
+    for objective, score in scores.items():
+        tables[objective] = score.argmax(axis=0).reshape(len(osnr_axis), len(rtt_axis)).astype(np.uint8)
+    return tables
+
+
+class CcaDecision(object):
+    """
+    Decide o algoritmo de controle de congestionamento a partir do OSNR informado pelo plano de controle e do RTT.
+    As consultas usam apenas aritmética e indexação de listas Python, sem NumPy, para levar microssegundos.
+    """
+
+    def __init__(self, tables):
+        self.algorithms = [str(a) for a in tables['algorithms']]
+        self.osnr0, self.rtt0 = float(tables['osnr_axis'][0]), float(tables['rtt_axis'][0])
+        self.osnr_step = float(tables['osnr_axis'][1] - tables['osnr_axis'][0]) if len(tables['osnr_axis']) > 1 else 1.0
+        self.rtt_step = float(tables['rtt_axis'][1] - tables['rtt_axis'][0]) if len(tables['rtt_axis']) > 1 else 1.0
+        self.n_osnr, self.n_rtt = len(tables['osnr_axis']), len(tables['rtt_axis'])
+        self.tables = dict((objective, [[self.algorithms[i] for i in row] for row in tables[objective].tolist()])
+                           for objective in OBJECTIVES)
+
+    @classmethod
+    def load(cls, table_path):
+        with np.load(table_path) as tables:
+            return cls(dict((key, tables[key]) for key in tables.files))
+
+    def decide(self, osnr, rtt, objective='throughput'):
+        """
+        Retorna o melhor algoritmo para o OSNR (dB) e RTT (ms) dados. Valores fora da grade usam a borda.
+        """
+        i = min(max(int((osnr - self.osnr0) / self.osnr_step + 0.5), 0), self.n_osnr - 1)
+        j = min(max(int((rtt - self.rtt0) / self.rtt_step + 0.5), 0), self.n_rtt - 1)
+        return self.tables[objective][i][j]
+
+
+def serve(decision, port=8081):
+    """
+    Serviço REST local: GET /cca?osnr=27.5&rtt=100&objective=jain -> {"algorithm": "bbr", ...}
+    Roda ao lado do RestServer do mnoptical (porta 8080).
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # mantém a conexão aberta entre consultas
+        disable_nagle_algorithm = True  # cabeçalho e corpo saem em escritas separadas
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            try:
+                osnr, rtt = float(query['osnr'][0]), float(query['rtt'][0])
+                objective = query.get('objective', ['throughput'])[0]
+                body = dict(algorithm=decision.decide(osnr, rtt, objective), osnr=osnr, rtt=rtt, objective=objective)
+                status = 200
+            except (KeyError, ValueError) as e:
+                body, status = dict(error='parâmetro inválido: {0}'.format(e)), 400
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        # Muitas sessões abrindo conexão ao mesmo tempo estourariam a fila padrão de 5
+        request_queue_size = 1024
+
+    return Server(('127.0.0.1', port), Handler)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Escolha do algoritmo de controle de congestionamento pelo OSNR.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='Gera a tabela de decisão a partir do banco de resultados.')
+    build.add_argument('db_path')
+    build.add_argument('-o', '--output', default='cca_table.npz')
+    build.add_argument('--osnr-step', type=float, default=0.1, help='Resolução da grade em OSNR (dB).')
+    build.add_argument('--rtt-step', type=float, default=1.0, help='Resolução da grade em RTT (ms).')
+    build.add_argument('--weight', type=float, default=0.5, help='Peso da vazão no objetivo mix.')
+    query = sub.add_parser('query', help='Consulta a tabela.')
+    query.add_argument('table_path')
+    query.add_argument('osnr', type=float)
+    query.add_argument('rtt', type=float)
+    query.add_argument('--objective', choices=OBJECTIVES, default='throughput')
+    server = sub.add_parser('serve', help='Serve a tabela via REST.')
+    server.add_argument('table_path')
+    server.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        tables = build_tables(collect_points(open_store(args.db_path)), args.osnr_step, args.rtt_step, args.weight)
+        np.savez(args.output, **tables)
+        print(f"Tabela salva em {args.output}: {len(tables['osnr_axis'])} x {len(tables['rtt_axis'])} células, "
+              f"algoritmos {', '.join(tables['algorithms'])}")
+    elif args.command == 'query':
+        print(CcaDecision.load(args.table_path).decide(args.osnr, args.rtt, args.objective))
+    else:
+        print(f"Servindo em http://127.0.0.1:{args.port}/cca?osnr=<dB>&rtt=<ms>&objective=<objetivo>")
+        serve(CcaDecision.load(args.table_path), args.port).serve_forever()
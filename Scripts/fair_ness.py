@@ -1,3 +1,5 @@
+import matplotlib
+matplotlib.use('Agg')  # Só grava o arquivo; funciona sem display
 import matplotlib.pyplot as plt
 from collections import defaultdict
 
@@ -41,13 +43,14 @@ def plot_jain_index(data, output_file):
     plt.savefig(output_file, dpi=300)
     plt.close()
 
-# Caminho do arquivo
-file_path = "Jain_Fairness_index.txt"
-output_file = "graf_Jain_fairness.png"
+if __name__ == '__main__':
+    # Caminho do arquivo
+    file_path = "Jain_Fairness_index.txt"
+    output_file = "graf_Jain_fairness.png"
 
-# Lê os dados e plota o gráfico
-jain_data = read_jain_data(file_path)
-plot_jain_index(jain_data, output_file)
+    # Lê os dados e plota o gráfico
+    jain_data = read_jain_data(file_path)
+    plot_jain_index(jain_data, output_file)
 
-print(f"Gráfico salvo como: {output_file}")
+    print(f"Gráfico salvo como: {output_file}")
 
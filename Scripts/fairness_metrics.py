@@ -0,0 +1,114 @@
+import argparse
+import numpy as np
+from result_store import open_store, find_runs, load_series
+
+
+def window_matrix(flows, start_time, end_time, interval=10, time_key='time'):
+    """
+    Monta a matriz fluxos x janelas com a taxa média (Mbps) de cada fluxo em cada janela de 'interval' segundos
+    entre start_time e end_time. 'flows' é uma lista de dicionários com os vetores 'mbps' e 'time_key' (por padrão
+    'time', o relógio comum a todos os fluxos do teste). Janelas sem amostras de um fluxo ficam com NaN.
+    """
+    n_windows = int(np.ceil((end_time - start_time) / interval))
+    index, weights = [], []
+    for i, flow in enumerate(flows):
+        timestamps = np.asarray(flow[time_key], dtype=float)
+        mask = (start_time <= timestamps) & (timestamps < end_time)
+        index.append(i * n_windows + ((timestamps[mask] - start_time) // interval).astype(np.int64))
+        weights.append(np.asarray(flow['mbps'], dtype=float)[mask])
+    index, weights = np.concatenate(index), np.concatenate(weights)
+
+    size = len(flows) * n_windows
+    sums = np.bincount(index, weights=weights, minlength=size)
+    counts = np.bincount(index, minlength=size)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums / np.where(counts > 0, counts, np.nan)).reshape(len(flows), n_windows)
+
+
+def fairness_metrics(matrix):
+    """
+    Calcula, para cada janela (coluna) de uma matriz fluxos x janelas, o índice de Jain, a razão mín/máx e o
+    coeficiente de variação das taxas, além da média e do número de fluxos ativos. As somas, somas dos quadrados,
+    mínimos e máximos são obtidos numa única passada pela matriz; fluxos sem amostra na janela (NaN) são ignorados.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    valid = ~np.isnan(matrix)
+    values = np.where(valid, matrix, 0.0)
+    n = valid.sum(axis=0)
+    total = values.sum(axis=0)
+    squares = (values ** 2).sum(axis=0)
+    low = np.where(valid, matrix, np.inf).min(axis=0)
+    high = np.where(valid, matrix, -np.inf).max(axis=0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / n
+        std = np.sqrt(np.maximum(squares / n - mean ** 2, 0.0))
+        return dict(
+            jain=np.where(squares > 0, total ** 2 / (n * squares), np.nan),
+            max_min=np.where(high > 0, low / high, np.nan),
+            cov=np.where(mean > 0, std / mean, np.nan),
+            mean=mean,
+            n_flows=n,
+        )
+
+
+def run_matrix(conn, run_id, start_time=0, end_time=None, interval=10):
+    """
+    Matriz fluxos x janelas de uma execução do banco de resultados. Retorna (nomes dos fluxos, matriz).
+    """
+    series = load_series(conn, run_id)
+    # Fluxos hX-hY na ordem dos emissores
+    names = sorted(series, key=lambda name: int(name.split('-')[0].lstrip('h')))
+    flows = [series[name] for name in names if len(series[name]['time'])]
+    if not flows:
+        return [], np.empty((0, 0))
+    if end_time is None:
+        end_time = max(float(flow['time'].max()) for flow in flows) + 1
+    return names, window_matrix(flows, start_time, end_time, interval)
+
+
+def run_metrics(series):
+    """
+    Calcula a vazão agregada média (Mbps) e o índice de Jain médio de uma execução, considerando apenas os
+    segundos em que todos os fluxos estavam ativos.
+    """
+    flows = [flow for flow in series.values() if len(flow.get('time', ()))]
+    if len(flows) < 2:
+        return None
+    # Janelas de 1 s no relógio comum aos fluxos
+    end_time = max(float(flow['time'].max()) for flow in flows) + 1
+    metrics = fairness_metrics(window_matrix(flows, 0, end_time, 1))
+    full = metrics['n_flows'] == len(flows)
+    if not full.any():
+        return None
+    return float((metrics['mean'][full] * len(flows)).mean()), float(metrics['jain'][full].mean())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Métricas de equidade (Jain, mín/máx, CoV) das execuções gravadas.')
+    parser.add_argument('db_path', help='Arquivo SQLite gravado pelo topo.py.')
+    parser.add_argument('filters', nargs='*', help='Filtros coluna[_lt|_le|_gt|_ge|_ne]=valor, ex.: n_pairs_ge=8')
+    parser.add_argument('--interval', type=float, default=10, help='Tamanho das janelas em segundos.')
+    parser.add_argument('--start', type=float, default=0, help='Início da análise (s).')
+    parser.add_argument('--end', type=float, help='Fim da análise (s). Por padrão, o fim do teste.')
+    args = parser.parse_args()
+
+    filters = dict()
+    for item in args.filters:
+        key, value = item.split('=', 1)
+        try:
+            filters[key] = float(value)
+        except ValueError:
+            filters[key] = value
+
+    conn = open_store(args.db_path)
+    for run in find_runs(conn, **filters):
+        names, matrix = run_matrix(conn, run['id'], args.start, args.end, args.interval)
+        if not names:
+            continue
+        metrics = fairness_metrics(matrix)
+        # Só as janelas em que todos os fluxos estavam ativos
+        full = metrics['n_flows'] == len(names)
+        print(f"run {run['id']} {run['algorithm']} {run['delay_ms']:g}ms, {len(names)} fluxos, {full.sum()} janelas: "
+              f"Jain {np.mean(metrics['jain'][full]):.4f}, mín/máx {np.mean(metrics['max_min'][full]):.4f}, "
+              f"CoV {np.mean(metrics['cov'][full]):.4f}")
@@ -1,4 +1,5 @@
-import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # Só grava o arquivo; funciona sem display
 import matplotlib.pyplot as plt
 import re
 import numpy as np
@@ -20,48 +21,59 @@ def read_jain_fairness(file_path):
     print(data)
     return data
 
-# Caminho do arquivo
-file_path = 'Jain_Fairness_index.txt'
+def plot_heatmap(matrix, rtts, algorithms, output_file="Jain_heatmap_RTT.png"):
+    """
+    Desenha o mapa de calor do índice de Jain, com uma linha por RTT e uma coluna por algoritmo, e o salva em
+    output_file.
+    """
+    matrix = np.asarray(matrix, dtype=float)
 
-# Ler os dados
-data = read_jain_fairness(file_path)
+    # Criando o gráfico de heatmap com matplotlib
+    fig, ax = plt.subplots(figsize=(10, 8))
 
-# Organizar os dados em um DataFrame
-df = pd.DataFrame(data, columns=['Algorithm', 'Delay', 'Fairness Index'])
+    # Definir a colormap
+    cmap = plt.get_cmap("YlGnBu")
 
-# Pivotar os dados para ter os algoritmos como colunas e os delays como linhas
-df_pivot = df.pivot(index='Delay', columns='Algorithm', values='Fairness Index')
+    # Plotando a matriz de dados com a colormap
+    cax = ax.matshow(matrix, cmap=cmap)
 
-# Criando o gráfico de heatmap com matplotlib
-fig, ax = plt.subplots(figsize=(10, 8))
+    # Adicionando uma barra de cores
+    fig.colorbar(cax)
 
-# Definir a colormap
-cmap = plt.get_cmap("YlGnBu")
+    # Definir os rótulos dos eixos
+    ax.set_xticks(np.arange(len(algorithms)))
+    ax.set_xticklabels(algorithms, rotation=45, ha="right")
+    ax.set_yticks(np.arange(len(rtts)))
+    ax.set_yticklabels(rtts)
 
-# Plotando a matriz de dados com a colormap
-cax = ax.matshow(df_pivot, cmap=cmap)
+    # Adicionando anotações nas células
+    for i in range(len(rtts)):
+        for j in range(len(algorithms)):
+            ax.text(j, i, f"{matrix[i, j]:.4f}", ha="center", va="center", color="black")
 
-# Adicionando uma barra de cores
-fig.colorbar(cax)
+    # Títulos e rótulos
+    plt.title("Jain's Fairness Index")
+    plt.xlabel("Algoritmos")
+    plt.ylabel("RTT (ms)")
 
-# Definir os rótulos dos eixos
-ax.set_xticks(np.arange(len(df_pivot.columns)))
-ax.set_xticklabels(df_pivot.columns, rotation=45, ha="right")
-ax.set_yticks(np.arange(len(df_pivot.index)))
-ax.set_yticklabels(df_pivot.index)
+    plt.tight_layout()
+    plt.savefig(output_file, dpi=300)
+    plt.close(fig)
 
-# Adicionando anotações nas células
-for i in range(len(df_pivot.index)):
-    for j in range(len(df_pivot.columns)):
-        ax.text(j, i, f"{df_pivot.iloc[i, j]:.4f}", ha="center", va="center", color="black")
+if __name__ == '__main__':
+    import pandas as pd
 
-# Títulos e rótulos
-plt.title("Jain's Fairness Index")
-plt.xlabel("Algoritmos")
-plt.ylabel("RTT (ms)")
+    # Caminho do arquivo
+    file_path = 'Jain_Fairness_index.txt'
 
-# Exibindo o gráfico
-plt.tight_layout()
-output_file = "Jain_heatmap_RTT.png"
-plt.savefig(output_file, dpi=300)
-plt.show()
+    # Ler os dados
+    data = read_jain_fairness(file_path)
+
+    # Organizar os dados em um DataFrame
+    df = pd.DataFrame(data, columns=['Algorithm', 'Delay', 'Fairness Index'])
+
+    # Pivotar os dados para ter os algoritmos como colunas e os delays como linhas
+    df_pivot = df.pivot(index='Delay', columns='Algorithm', values='Fairness Index')
+
+    output_file = "Jain_heatmap_RTT.png"
+    plot_heatmap(df_pivot.values, list(df_pivot.index), list(df_pivot.columns), output_file)
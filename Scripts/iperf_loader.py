@@ -0,0 +1,227 @@
+import os
+import re
+import json
+import numpy as np
+
+# Colunas da saída `iperf -y C`:
+# time (YYYYMMDDHHMMSS), src_addr, src_port, dst_addr, dst_port, id, interval (S.S-S.S), bytes, bps
+iperf_csv_header = ['time', 'src_addr', 'src_port', 'dst_addr', 'dst_port', 'other', 'interval', 'B_sent', 'bps']
+
+# Versão do formato do cache .npz; incrementar quando os campos mudarem
+CACHE_VERSION = 1
+
+# Tamanho dos blocos lidos pelo leitor incremental de JSON
+JSON_CHUNK = 1 << 16
+non_space = re.compile(r'\S')
+
+
+def timestamps_to_seconds(stamps):
+    """
+    Converte um vetor de timestamps YYYYMMDDHHMMSS (int64) em segundos desde a época, sem laço em Python.
+    Os timestamps são tratados como UTC; como só as diferenças entre eles são usadas, o fuso não importa.
+    """
+    stamps = np.asarray(stamps, dtype=np.int64)
+    year = stamps // 10**10
+    month = stamps // 10**8 % 100
+    day = stamps // 10**6 % 100
+    months = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    days = months.astype('datetime64[D]').astype(np.int64) + day - 1
+    return days * 86400 + stamps // 10**4 % 100 * 3600 + stamps // 100 % 100 * 60 + stamps % 100
+
+
+def parse_iperf_csv(file_path):
+    """
+    Lê um arquivo `iperf -y C` em vetores NumPy (um por coluna usada).
+    A linha de resumo final (intervalo 0.0-T com a média da sessão) é separada dos dados.
+    """
+    # O intervalo "S.S-S.S" vira duas colunas trocando o '-' por ','
+    with open(file_path, 'r') as file:
+        lines = file.read().replace('-', ',').split()
+    if lines:
+        rows = np.loadtxt(lines, delimiter=',', dtype=str, usecols=(0, 1, 6, 7, 8, 9), ndmin=2)
+    else:
+        rows = np.empty((0, 6), dtype=str)
+
+    columns = rows.T
+    data = {
+        'time': timestamps_to_seconds(columns[0].astype(np.int64)),
+        'src_addr': columns[1],
+        'start': columns[2].astype(float),
+        'end': columns[3].astype(float),
+        'bytes': columns[4].astype(np.int64),
+        'mbps': columns[5].astype(float) / 1e6,  # Converte bits/seg para Mbps
+    }
+
+    # A linha de resumo começa em 0 e termina depois do primeiro intervalo
+    has_summary = len(rows) > 1 and data['start'][-1] == 0 and data['end'][-1] > data['end'][0]
+    summary = np.array([data['end'][-1], data['mbps'][-1]]) if has_summary else np.empty(0)
+    if has_summary:
+        data = {key: values[:-1] for key, values in data.items()}
+    data['summary'] = summary
+    return data
+
+
+class JsonStream(object):
+    """
+    Leitor incremental de um documento JSON grande: percorre o objeto de nível mais alto e devolve seus valores um a
+    um, e os elementos do vetor 'intervals' (a parte que cresce com a duração do teste) também um a um. Só um
+    bloco do arquivo e um valor ficam em memória.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        # Descarta o que já foi consumido e lê mais um bloco
+        chunk = self.file.read(JSON_CHUNK)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return bool(chunk)
+
+    def peek(self):
+        """
+        Retorna o próximo caractere que não é espaço, sem consumi-lo ('' no fim do arquivo).
+        """
+        while True:
+            match = non_space.search(self.buffer, self.pos)
+            self.pos = match.start() if match else len(self.buffer)
+            if match or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError('JSON inválido: esperava {0!r} e encontrou {1!r}'.format(char, self.peek()))
+        self.pos += 1
+
+    def value(self):
+        """
+        Decodifica o próximo valor JSON, lendo mais blocos enquanto ele estiver incompleto.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # Um número no fim do bloco pode continuar no próximo
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def items(self):
+        """
+        Gera os pares (chave, valor) do objeto de nível mais alto; o vetor 'intervals' gera um par
+        ('interval', elemento) por elemento.
+        """
+        self.expect('{')
+        while self.peek() not in ('}', ''):
+            key = self.value()
+            self.expect(':')
+            if key == 'intervals':
+                self.expect('[')
+                while self.peek() != ']':
+                    yield 'interval', self.value()
+                    if self.peek() == ',':
+                        self.pos += 1
+                self.pos += 1
+            else:
+                yield key, self.value()
+            if self.peek() == ',':
+                self.pos += 1
+
+
+def iperf3_events(file):
+    """
+    Gera os eventos (nome, dados) da saída de um cliente iperf3, tanto de --json-stream (um objeto
+    {"event": ..., "data": ...} por linha) quanto de --json (um único documento, lido por JsonStream).
+    """
+    first = file.readline()
+    try:
+        event = json.loads(first)
+    except ValueError:
+        event = None
+    if isinstance(event, dict) and 'event' in event:
+        yield event['event'], event.get('data')
+        for line in file:
+            if line.strip():
+                event = json.loads(line)
+                yield event['event'], event.get('data')
+        return
+    file.seek(0)
+    yield from JsonStream(file).items()
+
+
+def parse_iperf3_json(file_path):
+    """
+    Lê a saída JSON de um cliente iperf3 (ou do gerador embutido do traffic.py) nos mesmos vetores que
+    parse_iperf_csv(). O tempo de cada linha é o início do teste mais o início do intervalo, com frações de segundo.
+    """
+    test_start, src_addr = 0.0, ''
+    columns = dict(start=list(), end=list(), bytes=list(), bps=list())
+    summary = np.empty(0)
+    with open(file_path, 'r') as file:
+        for event, data in iperf3_events(file):
+            if event == 'start':
+                test_start = float(data.get('timestamp', dict()).get('timesecs', 0))
+                connected = data.get('connected') or [dict()]
+                src_addr = connected[0].get('local_host', '')
+            elif event == 'interval':
+                total = data['sum']
+                columns['start'].append(total['start'])
+                columns['end'].append(total['end'])
+                columns['bytes'].append(total['bytes'])
+                columns['bps'].append(total['bits_per_second'])
+            elif event == 'end' and data.get('sum_sent'):
+                summary = np.array([data['sum_sent']['seconds'], data['sum_sent']['bits_per_second'] / 1e6])
+
+    start = np.array(columns['start'], dtype=float)
+    return {
+        'time': test_start + start,
+        'src_addr': np.full(len(start), src_addr),
+        'start': start,
+        'end': np.array(columns['end'], dtype=float),
+        'bytes': np.array(columns['bytes'], dtype=np.int64),
+        'mbps': np.array(columns['bps'], dtype=float) / 1e6,
+        'summary': summary,
+    }
+
+
+def load_iperf(file_path, src_addr=None, cache=True):
+    """
+    Carrega um arquivo `iperf -y C` ou, se terminar em .json, a saída JSON do iperf3, usando um cache .npz ao lado do
+    arquivo (<arquivo>.npz).
+    O cache é válido enquanto o mtime e o tamanho do arquivo não mudarem.
+
+    Retorna um dicionário de vetores: 'time' (s desde a época), 'src_addr', 'start' e 'end' (início e fim do
+    intervalo em s), 'bytes', 'mbps' e 'summary' ([duração, Mbps médio] da sessão, vazio se não houver).
+    Se src_addr for dado, mantém apenas as linhas cujo endereço de origem o contém.
+    """
+    stat = os.stat(file_path)
+    cache_path = file_path + '.npz'
+    data = None
+
+    if cache and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            if (int(cached['version']) == CACHE_VERSION and int(cached['mtime_ns']) == stat.st_mtime_ns
+                    and int(cached['size']) == stat.st_size):
+                data = {key: cached[key] for key in cached.files if key not in ('version', 'mtime_ns', 'size')}
+
+    if data is None:
+        data = parse_iperf3_json(file_path) if file_path.endswith('.json') else parse_iperf_csv(file_path)
+        if cache:
+            # Escreve num arquivo temporário e renomeia, para nunca deixar um cache pela metade
+            tmp_path = cache_path + '.tmp.npz'
+            np.savez(tmp_path, version=CACHE_VERSION, mtime_ns=stat.st_mtime_ns, size=stat.st_size, **data)
+            os.replace(tmp_path, cache_path)
+
+    if src_addr is not None:
+        mask = np.char.find(data['src_addr'], src_addr) >= 0
+        data = {key: (values if key == 'summary' else values[mask]) for key, values in data.items()}
+    return data
@@ -0,0 +1,473 @@
+import argparse
+import mmap
+import os
+import struct
+import numpy as np
+from time import time
+
+# Bytes de captura processados por bloco. O arquivo é mapeado em memória e as páginas já lidas são descartadas, então
+# a memória usada não depende do tamanho da captura.
+PCAP_CHUNK = 16 << 20
+# Um segmento que preenche um buraco na sequência até REORDER_WINDOW segundos depois de o buraco aparecer é contado
+# como fora de ordem; depois disso, como retransmissão (de um segmento perdido antes do ponto de captura).
+REORDER_WINDOW = 0.003
+# Segmentos ainda não confirmados guardados por fluxo para as amostras de RTT (limita a memória quando só um sentido
+# do fluxo é capturado)
+MAX_PENDING = 1 << 16
+
+# Tipos de enlace do pcap: (tamanho do cabeçalho de enlace, posição do ethertype)
+LINK_HEADERS = {1: (14, 12), 113: (16, 14)}
+SYN, FIN, ACK = 0x02, 0x01, 0x10
+
+# Colunas de eventos gravadas em arquivos .npy: nome e tipo
+EVENT_COLUMNS = [('rtt_flow', 'u2'), ('rtt_time', 'f8'), ('rtt_ms', 'f4'), ('retrans_flow', 'u2'),
+                 ('retrans_time', 'f8'), ('ooo_flow', 'u2'), ('ooo_time', 'f8')]
+# Colunas da tabela de fluxos (um fluxo por sentido de cada conexão)
+FLOW_COLUMNS = [('src', 'u4'), ('dst', 'u4'), ('sport', 'u2'), ('dport', 'u2'), ('packets', 'i8'),
+                ('segments', 'i8'), ('bytes', 'i8'), ('retransmissions', 'i8'), ('out_of_order', 'i8'),
+                ('holes', 'i8'), ('rtt_samples', 'i8'), ('first_time', 'f8'), ('last_time', 'f8')]
+
+
+def read_header(buf):
+    """
+    Lê o cabeçalho global de um pcap: ordem dos bytes, resolução dos timestamps, snaplen e tipo de enlace.
+    """
+    magic = bytes(buf[:4])
+    formats = {b'\xd4\xc3\xb2\xa1': ('<', 1e-6), b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+               b'\x4d\x3c\xb2\xa1': ('<', 1e-9), b'\xa1\xb2\x3c\x4d': ('>', 1e-9)}
+    if magic not in formats:
+        raise ValueError('Não é um arquivo pcap (pcapng não é suportado)')
+    endian, resolution = formats[magic]
+    snaplen, linktype = struct.unpack_from(endian + 'II', buf, 16)
+    if linktype not in LINK_HEADERS:
+        raise ValueError('Tipo de enlace {0} não suportado'.format(linktype))
+    return dict(endian=endian, resolution=resolution, snaplen=snaplen, linktype=linktype)
+
+
+def gather(data, positions, size, big_endian):
+    """
+    Lê inteiros sem sinal de 'size' bytes em posições arbitrárias de um vetor de bytes, sem laço em Python.
+    """
+    kind = '{0}u{1}'.format('>' if big_endian else '<', size)
+    # Um inteiro começando em cada byte do vetor: uma leitura não alinhada por posição
+    values = np.ndarray((len(data) - size + 1,), dtype=kind, buffer=data, strides=(1,))
+    return values[positions].astype(kind[1:])
+
+
+def record_offsets(data, start, limit, header):
+    """
+    Retorna as posições dos registros que começam entre 'start' e 'limit' e a posição do registro seguinte.
+
+    Os registros têm tamanho variável, então cada posição depende da anterior. Em vez de percorrê-los um a um, as
+    posições candidatas são as que têm um cabeçalho IPv4 no lugar certo e um cabeçalho de registro plausível, e só
+    ficam as apontadas por outra candidata (um falso candidato no meio dos dados não é apontado por nenhum registro);
+    a cadeia é então verificada de uma vez. Se não fechar (pacote que não é IPv4, por exemplo), o bloco é percorrido
+    registro a registro.
+    """
+    link_length, ethertype = LINK_HEADERS[header['linktype']]
+    big = header['endian'] == '>'
+    # Bytes necessários para testar uma posição: cabeçalho do registro, de enlace e o primeiro byte do IP
+    need = 16 + link_length + 1
+    end = min(limit, len(data) - need + 1)
+    if end <= start:
+        return np.zeros(0, dtype=np.int64), start
+    offsets = np.flatnonzero(data[start + 16 + ethertype:end + 16 + ethertype] == 8) + start
+    offsets = offsets[(data[offsets + 17 + ethertype] == 0) & (data[offsets + 16 + link_length] >> 4 == 4)]
+    caplen = gather(data, offsets + 8, 4, big).astype(np.int64)
+    length = gather(data, offsets + 12, 4, big).astype(np.int64)
+    plausible = (caplen <= header['snaplen']) & (caplen <= length) & (caplen > link_length)
+    offsets, caplen = offsets[plausible], caplen[plausible]
+    following = offsets + 16 + caplen
+    if len(offsets) and offsets[0] == start:
+        index = np.minimum(np.searchsorted(offsets, following), len(offsets) - 1)
+        target = np.where(offsets[index] == following, index, -1)
+        kept = np.ones(len(offsets), dtype=bool)
+        for _ in range(8):
+            pointed = np.zeros(len(offsets), dtype=bool)
+            pointed[target[kept & (target >= 0)]] = True
+            pointed[0] = True
+            if np.array_equal(pointed, kept):
+                break
+            kept = pointed
+        offsets, following = offsets[kept], following[kept]
+        # Último registro truncado (captura interrompida)
+        truncated = following[-1] > len(data)
+        if truncated:
+            offsets, following = offsets[:-1], following[:-1]
+        if len(offsets) and np.array_equal(offsets[1:], following[:-1]) and (truncated or following[-1] >= end):
+            return offsets, int(following[-1])
+
+    # Percurso registro a registro
+    unpack = struct.Struct(header['endian'] + 'I').unpack_from
+    offsets = list()
+    position = start
+    while position < limit and position + 16 <= len(data):
+        following = position + 16 + unpack(data, position + 8)[0]
+        if following > len(data):
+            break
+        offsets.append(position)
+        position = following
+    return np.array(offsets, dtype=np.int64), position
+
+
+def headers_dtype(header):
+    """
+    Tipo estruturado com os campos usados de um registro (cabeçalhos do registro, de enlace, IPv4 sem opções e TCP até
+    as flags), nas suas posições a partir do início do registro.
+    """
+    link_length, ethertype = LINK_HEADERS[header['linktype']]
+    ip = 16 + link_length
+    endian = header['endian']
+    fields = [('seconds', endian + 'u4', 0), ('fraction', endian + 'u4', 4), ('caplen', endian + 'u4', 8),
+              ('ethertype', '>u2', 16 + ethertype), ('version', 'u1', ip), ('total', '>u2', ip + 2),
+              ('protocol', 'u1', ip + 9), ('src', '>u4', ip + 12), ('dst', '>u4', ip + 16),
+              ('sport', '>u2', ip + 20), ('dport', '>u2', ip + 22), ('seq', '>u4', ip + 24), ('ack', '>u4', ip + 28),
+              ('offset', 'u1', ip + 32), ('flags', 'u1', ip + 33)]
+    return np.dtype(dict(names=[f[0] for f in fields], formats=[f[1] for f in fields],
+                         offsets=[f[2] for f in fields], itemsize=ip + 34))
+
+
+def gather_rows(data, positions, kind):
+    """
+    Lê um registro do tipo estruturado 'kind' em cada posição: uma cópia de bytes por registro em vez de uma leitura
+    por campo.
+    """
+    raw = np.dtype(('V', kind.itemsize))
+    rows = np.zeros(len(positions), dtype=raw)
+    inside = positions <= len(data) - kind.itemsize
+    rows[inside] = np.ndarray((len(data) - kind.itemsize + 1,), dtype=raw, buffer=data, strides=(1,))[
+        positions[inside]]
+    if not inside.all():
+        # Registros curtos no fim do arquivo
+        base = int(positions[~inside][0])
+        tail = np.zeros(len(data) - base + kind.itemsize, dtype=np.uint8)
+        tail[:len(data) - base] = data[base:]
+        rows[~inside] = np.ndarray((len(tail) - kind.itemsize + 1,), dtype=raw, buffer=tail, strides=(1,))[
+            positions[~inside] - base]
+    return rows.view(kind)
+
+
+def decode(data, offsets, header):
+    """
+    Extrai os campos dos pacotes TCP/IPv4 dos registros de um bloco, como vetores.
+    """
+    kind = headers_dtype(header)
+    rows = gather_rows(data, offsets, kind)
+    ip = kind.fields['version'][1]
+    ihl = (rows['version'] & 15).astype(np.int64) * 4
+    keep = (rows['ethertype'] == 0x0800) & (rows['protocol'] == 6) & (rows['caplen'] >= ip - 16 + 20)
+    # Cabeçalho TCP até as flags dentro do que foi capturado
+    keep &= ip + ihl + 14 <= 16 + rows['caplen'].astype(np.int64)
+    if not keep.all():
+        rows, ihl, offsets = rows[keep], ihl[keep], offsets[keep]
+    options = np.flatnonzero(ihl != 20)
+    if len(options):
+        # Cabeçalhos IP com opções: o TCP começa mais adiante
+        moved = gather_rows(data, offsets[options] + ihl[options] - 20, kind)
+        for name in ('sport', 'dport', 'seq', 'ack', 'offset', 'flags'):
+            rows[name][options] = moved[name]
+    length = rows['total'].astype(np.int64) - ihl - (rows['offset'] >> 4).astype(np.int64) * 4
+    return dict(time=rows['seconds'] + rows['fraction'] * header['resolution'], src=rows['src'].astype(np.uint32),
+                dst=rows['dst'].astype(np.uint32), sport=rows['sport'].astype(np.uint16),
+                dport=rows['dport'].astype(np.uint16), seq=rows['seq'].astype(np.uint32),
+                ack=rows['ack'].astype(np.uint32), flags=rows['flags'].copy(), length=np.maximum(length, 0))
+
+
+def unwrap(raw, last_raw, last):
+    """
+    Converte números de sequência de 32 bits em posições de 64 bits, continuando de (last_raw, last).
+    """
+    steps = np.diff(np.concatenate(([last_raw], raw.astype(np.int64))))
+    return last + np.cumsum((steps + (1 << 31)) % (1 << 32) - (1 << 31))
+
+
+def split(inverse):
+    """
+    Retorna as posições de cada grupo (ver numpy.unique(return_inverse=True)), em ordem dentro do grupo.
+    """
+    order = np.argsort(inverse, kind='stable')
+    bounds = np.searchsorted(inverse[order], np.arange(inverse.max() + 2))
+    return [order[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+
+class ColumnWriter(object):
+    """
+    Vetor gravado aos pedaços num arquivo .npy, cujo cabeçalho é reescrito com o tamanho final ao fechar.
+    """
+
+    HEADER = 128
+
+    def __init__(self, path, dtype):
+        self.dtype = np.dtype(dtype)
+        self.file = open(path, 'wb')
+        self.n = 0
+        self.file.write(self.header())
+
+    def header(self):
+        text = "{{'descr': {0!r}, 'fortran_order': False, 'shape': ({1},), }}".format(self.dtype.str, self.n)
+        return b'\x93NUMPY\x01\x00' + struct.pack('<H', self.HEADER - 10) + text.ljust(self.HEADER - 11).encode() \
+            + b'\n'
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        values.tofile(self.file)
+        self.n += len(values)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(self.header())
+        self.file.close()
+
+
+class FlowState(object):
+    """
+    Estado de um sentido de uma conexão TCP entre blocos da captura.
+    """
+
+    def __init__(self, number, key):
+        self.number = number
+        self.src, self.dst, self.sport, self.dport = key
+        self.base = None
+        self.last_raw = self.last = 0
+        self.max_end = None
+        self.holes = list()
+        self.pending_end = np.zeros(0, dtype=np.int64)
+        self.pending_time = np.zeros(0)
+        # Fins dos segmentos retransmitidos ainda não confirmados
+        self.retrans_ends = np.zeros(0, dtype=np.int64)
+        self.ack_raw = None
+        self.ack_last = self.max_ack = 0
+        self.counts = dict((name, 0) for name, _ in FLOW_COLUMNS[4:11])
+        self.first_time = self.last_time = None
+
+    def row(self):
+        return [self.src, self.dst, self.sport, self.dport] + [self.counts[name] for name, _ in FLOW_COLUMNS[4:11]] \
+            + [self.first_time, self.last_time]
+
+
+class PcapAnalyzer(object):
+    """
+    Retransmissões, segmentos fora de ordem e amostras de RTT por fluxo de uma captura, processada bloco a bloco.
+
+    Um segmento abaixo do maior número de sequência já visto é uma retransmissão se seus bytes já passaram pelo ponto
+    de captura, e fora de ordem se preenche um buraco da sequência logo depois de o buraco aparecer. As amostras de RTT
+    casam cada ACK novo com o segmento (transmitido uma só vez, algoritmo de Karn) cujo fim ele confirma: medem o tempo
+    do ponto de captura até o receptor e de volta.
+    """
+
+    def __init__(self, outdir, reorder_window=REORDER_WINDOW):
+        os.makedirs(outdir, exist_ok=True)
+        self.outdir = outdir
+        self.reorder_window = reorder_window
+        self.flows = dict()
+        self.columns = dict((name, ColumnWriter(os.path.join(outdir, name + '.npy'), kind))
+                            for name, kind in EVENT_COLUMNS)
+
+    def flow(self, key):
+        if key not in self.flows:
+            self.flows[key] = FlowState(len(self.flows), key)
+        return self.flows[key]
+
+    def feed(self, packets):
+        """
+        Processa os pacotes de um bloco (ver decode()), em ordem de captura.
+        """
+        if not len(packets['time']):
+            return
+        src, dst, sport, dport = packets['src'], packets['dst'], packets['sport'], packets['dport']
+        # Chave de 64 bits misturando o endereço e as portas: cada grupo é conferido campo a campo, e numa colisão
+        # (improvável) os pacotes são agrupados pela tupla completa
+        keys = (src.astype(np.uint64) << np.uint64(32) | dst) * np.uint64(0x9e3779b97f4a7c15) \
+            ^ (sport.astype(np.uint64) << np.uint64(16) | dport)
+        members = split(np.unique(keys, return_inverse=True)[1])
+        if not all((src[index] == src[index[0]]).all() & (dst[index] == dst[index[0]]).all()
+                   & (sport[index] == sport[index[0]]).all() & (dport[index] == dport[index[0]]).all()
+                   for index in members):
+            tuples = np.stack((src, dst, sport, dport), axis=1).astype(np.int64)
+            members = split(np.unique(tuples, axis=0, return_inverse=True)[1].ravel())
+        groups = list()
+        for index in members:
+            i = int(index[0])
+            flow = self.flow((int(src[i]), int(dst[i]), int(sport[i]), int(dport[i])))
+            groups.append((flow, dict((name, values[index]) for name, values in packets.items())))
+        # Os dados de todos os fluxos do bloco entram antes dos ACKs que os confirmam
+        for flow, columns in groups:
+            self.data(flow, columns)
+        for flow, columns in groups:
+            reverse = self.flows.get((flow.dst, flow.src, flow.dport, flow.sport))
+            if reverse is not None and reverse.base is not None:
+                self.acks(flow, reverse, columns)
+
+    def data(self, flow, columns):
+        times, flags = columns['time'], columns['flags']
+        if flow.first_time is None:
+            flow.first_time = float(times[0])
+            flow.base = flow.last_raw = int(columns['seq'][0])
+        flow.last_time = float(times[-1])
+        flow.counts['packets'] += len(times)
+        position = unwrap(columns['seq'], flow.last_raw, flow.last)
+        flow.last_raw, flow.last = int(columns['seq'][-1]), int(position[-1])
+        length = columns['length'] + (flags & SYN > 0) + (flags & FIN > 0)
+        segment = length > 0
+        start, end, times = position[segment], position[segment] + length[segment], times[segment]
+        if not len(start):
+            return
+        flow.counts['segments'] += len(start)
+        flow.counts['bytes'] += int(columns['length'][segment].sum())
+        highest = np.maximum.accumulate(np.concatenate(([start[0] if flow.max_end is None else flow.max_end], end)))
+        before = highest[:-1]
+        flow.max_end = int(highest[-1])
+        advancing = end > before
+
+        # Segmentos novos: candidatos às amostras de RTT
+        flow.pending_end = np.concatenate((flow.pending_end, end[advancing]))[-MAX_PENDING:]
+        flow.pending_time = np.concatenate((flow.pending_time, times[advancing]))[-MAX_PENDING:]
+
+        # Buracos abertos e segmentos abaixo do maior já visto são raros: tratados um a um, em ordem
+        events = np.flatnonzero((start > before) | (start < before))
+        retrans, ends, ooo = list(), list(), list()
+        for i in events.tolist():
+            s, e, t = int(start[i]), int(end[i]), float(times[i])
+            if s > before[i]:
+                flow.holes.append([int(before[i]), s, t])
+                flow.counts['holes'] += 1
+                continue
+            filled = None
+            for hole in list(flow.holes):
+                if hole[0] < e and s < hole[1]:
+                    filled = hole[2] if filled is None else min(filled, hole[2])
+                    flow.holes.remove(hole)
+                    if hole[0] < s:
+                        flow.holes.append([hole[0], s, hole[2]])
+                    if e < hole[1]:
+                        flow.holes.append([e, hole[1], hole[2]])
+            if filled is not None and t - filled < self.reorder_window:
+                ooo.append(t)
+            else:
+                retrans.append(t)
+                ends.append(e)
+        flow.counts['retransmissions'] += len(retrans)
+        flow.counts['out_of_order'] += len(ooo)
+        if retrans:
+            flow.retrans_ends = np.sort(np.concatenate((flow.retrans_ends, ends)))
+            self.columns['retrans_flow'].append(np.full(len(retrans), flow.number))
+            self.columns['retrans_time'].append(retrans)
+        if ooo:
+            self.columns['ooo_flow'].append(np.full(len(ooo), flow.number))
+            self.columns['ooo_time'].append(ooo)
+
+    def acks(self, flow, reverse, columns):
+        """
+        Casa os ACKs de um fluxo com os segmentos do fluxo inverso.
+        """
+        acked = (columns['flags'] & ACK) > 0
+        raw, times = columns['ack'][acked], columns['time'][acked]
+        if not len(raw):
+            return
+        if flow.ack_raw is None:
+            # Primeiro ACK: posicionado em relação ao último segmento do fluxo inverso
+            flow.ack_raw, flow.ack_last = reverse.last_raw, reverse.last
+            flow.max_ack = int(unwrap(raw[:1], reverse.last_raw, reverse.last)[0]) - 1
+        position = unwrap(raw, flow.ack_raw, flow.ack_last)
+        flow.ack_raw, flow.ack_last = int(raw[-1]), int(position[-1])
+        highest = np.maximum.accumulate(np.concatenate(([flow.max_ack], position)))
+        new = position > highest[:-1]
+        flow.max_ack = int(highest[-1])
+        position, previous, times = position[new], highest[:-1][new], times[new]
+
+        index = np.searchsorted(reverse.pending_end, position)
+        found = index < len(reverse.pending_end)
+        found[found] &= reverse.pending_end[index[found]] == position[found]
+        sent = reverse.pending_time[index[found]]
+        position, previous, times = position[found], previous[found], times[found]
+        # Karn: um ACK que passa por bytes retransmitidos pode ter sido gerado pela retransmissão
+        ends = reverse.retrans_ends
+        valid = (sent <= times) & (np.searchsorted(ends, position, 'right') == np.searchsorted(ends, previous, 'right'))
+        rtt = times[valid] - sent[valid]
+        if len(rtt):
+            reverse.counts['rtt_samples'] += len(rtt)
+            self.columns['rtt_flow'].append(np.full(len(rtt), reverse.number))
+            self.columns['rtt_time'].append(times[valid])
+            self.columns['rtt_ms'].append(rtt * 1e3)
+        keep = reverse.pending_end > flow.max_ack
+        reverse.pending_end, reverse.pending_time = reverse.pending_end[keep], reverse.pending_time[keep]
+        reverse.retrans_ends = ends[ends > flow.max_ack]
+
+    def close(self):
+        """
+        Grava a tabela de fluxos (flows.npz) e fecha as colunas de eventos. Retorna a tabela.
+        """
+        for column in self.columns.values():
+            column.close()
+        rows = [flow.row() for flow in sorted(self.flows.values(), key=lambda flow: flow.number)]
+        table = dict((name, np.array([row[i] for row in rows], dtype=kind))
+                     for i, (name, kind) in enumerate(FLOW_COLUMNS))
+        np.savez(os.path.join(self.outdir, 'flows.npz'), **table)
+        return table
+
+
+def analyze_pcap(path, outdir=None, chunk=PCAP_CHUNK, reorder_window=REORDER_WINDOW):
+    """
+    Processa uma captura em blocos de 'chunk' bytes e grava a análise em 'outdir' (por padrão <captura>.flows/):
+    flows.npz com a tabela de fluxos e um .npy por coluna de eventos (ver EVENT_COLUMNS), para abrir com
+    load_analysis(). Retorna a tabela de fluxos.
+    """
+    outdir = outdir or os.path.splitext(path)[0] + '.flows'
+    analyzer = PcapAnalyzer(outdir, reorder_window)
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size <= 24:
+            return analyzer.close()
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            data = np.frombuffer(mapped, dtype=np.uint8)
+            header = read_header(mapped)
+            position = released = 24
+            while position < len(data):
+                offsets, position = record_offsets(data, position, position + chunk, header)
+                if not len(offsets):
+                    break
+                analyzer.feed(decode(data, offsets, header))
+                # Descarta as páginas já processadas
+                done = position // mmap.PAGESIZE * mmap.PAGESIZE
+                if done > released and hasattr(mapped, 'madvise'):
+                    mapped.madvise(mmap.MADV_DONTNEED, released // mmap.PAGESIZE * mmap.PAGESIZE,
+                                   done - released // mmap.PAGESIZE * mmap.PAGESIZE)
+                    released = done
+            del data
+    return analyzer.close()
+
+
+def load_analysis(outdir):
+    """
+    Abre uma análise gravada por analyze_pcap(): retorna {'flows': tabela, <coluna de evento>: vetor mapeado}.
+    """
+    with np.load(os.path.join(outdir, 'flows.npz')) as flows:
+        result = dict(flows=dict(flows))
+    for name, _ in EVENT_COLUMNS:
+        result[name] = np.load(os.path.join(outdir, name + '.npy'), mmap_mode='r')
+    return result
+
+
+def address(value):
+    return '.'.join(str(int(value) >> shift & 255) for shift in (24, 16, 8, 0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Retransmissões, fora de ordem e RTT por fluxo de capturas pcap.')
+    parser.add_argument('captures', nargs='+', help='Arquivos pcap (só cabeçalhos, ver packet_capture.py).')
+    parser.add_argument('--chunk', type=int, default=PCAP_CHUNK >> 20, help='Tamanho dos blocos em MB.')
+    parser.add_argument('--reorder-window', type=float, default=REORDER_WINDOW * 1e3,
+                        help='Janela (ms) em que um buraco preenchido conta como fora de ordem.')
+    args = parser.parse_args()
+
+    for capture in args.captures:
+        start = time()
+        table = analyze_pcap(capture, chunk=args.chunk << 20, reorder_window=args.reorder_window / 1e3)
+        elapsed = time() - start
+        print('{0}: {1:.0f} MB em {2:.2f}s ({3:.0f} MB/s)'.format(capture, os.path.getsize(capture) / 1e6, elapsed,
+                                                                 os.path.getsize(capture) / 1e6 / elapsed))
+        for i in range(len(table['src'])):
+            if table['segments'][i]:
+                print('  {0}:{1} -> {2}:{3}: {4} segmentos, {5} retransmissões, {6} fora de ordem, {7} amostras de '
+                      'RTT'.format(address(table['src'][i]), table['sport'][i], address(table['dst'][i]),
+                                   table['dport'][i], table['segments'][i], table['retransmissions'][i],
+                                   table['out_of_order'][i], table['rtt_samples'][i]))
@@ -0,0 +1,222 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Renderiza sem display, também nos processos do pool
+import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+from result_store import open_store, find_runs, load_series
+from calc_media_std import runs_groups, compute_statistics, plot_statistics, optical_tag
+from fair_ness import plot_jain_index
+from heat_map_jain import plot_heatmap
+
+# Arquivo, no diretório das figuras, com o hash das entradas de cada figura já gerada
+MANIFEST = '.figures.json'
+
+# Número máximo de pontos desenhados por curva
+MAX_POINTS = 2000
+
+
+def lttb(x, y, n_out=MAX_POINTS):
+    """
+    Reduz a curva (x, y) a n_out pontos pelo Largest-Triangle-Three-Buckets, que mantém picos e vales.
+    O primeiro e o último ponto são preservados; os demais são escolhidos um por balde.
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+
+    # Baldes do meio (sem o primeiro e o último ponto)
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    # Centroide de cada balde, usado como terceiro vértice do triângulo do balde anterior
+    sums_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    avg_x = np.append(sums_x / sizes, x[-1])
+    avg_y = np.append(sums_y / sizes, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # Área (dobrada) do triângulo entre o ponto escolhido antes, cada candidato e o centroide seguinte
+        area = np.abs((x[a] - avg_x[b + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[b + 1] - y[a]))
+        a = lo + int(area.argmax())
+        selected[b + 1] = a
+    return x[selected], y[selected]
+
+
+def _feed(digest, value):
+    """
+    Alimenta o hash com um valor: vetores pelo tipo, forma e bytes; dicionários em ordem de chave.
+    """
+    if isinstance(value, np.ndarray):
+        digest.update('nd{0}{1}'.format(value.dtype.str, value.shape).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, dict):
+        digest.update(b'{')
+        for key in sorted(value, key=str):
+            _feed(digest, str(key))
+            _feed(digest, value[key])
+        digest.update(b'}')
+    elif isinstance(value, (list, tuple)):
+        digest.update(b'[')
+        for item in value:
+            _feed(digest, item)
+        digest.update(b']')
+    else:
+        digest.update(repr(value).encode())
+
+
+def figure_hash(plot, args):
+    """
+    Hash de uma figura: código da função de desenho e todos os seus argumentos (dados e parâmetros).
+    Mudar os dados ou a função invalida a figura.
+    """
+    digest = hashlib.sha256()
+    digest.update('{0}.{1}'.format(plot.__module__, plot.__qualname__).encode())
+    digest.update(inspect.getsource(plot).encode())
+    _feed(digest, args)
+    return digest.hexdigest()
+
+
+def _render_one(figure):
+    plot, args, output_file = figure
+    plot(*args, output_file)
+    plt.close('all')
+    return output_file
+
+
+def render(figures, manifest_path, workers=None, force=False):
+    """
+    Gera as figuras cujas entradas mudaram desde a última vez, em paralelo.
+    'figures' é uma lista de (função, argumentos, arquivo); cada figura é desenhada por função(*argumentos, arquivo).
+    As já geradas com o mesmo hash (registrado em manifest_path) e cujo arquivo ainda existe são puladas.
+    Retorna a lista dos arquivos gerados.
+    """
+    try:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        manifest = dict()
+
+    stale = list()
+    for plot, args, output_file in figures:
+        key = figure_hash(plot, args)
+        if force or manifest.get(output_file) != key or not os.path.exists(output_file):
+            stale.append(((plot, args, output_file), key))
+
+    rendered = list()
+    try:
+        if len(stale) > 1 and workers != 1:
+            with ProcessPoolExecutor(workers) as pool:
+                outputs = pool.map(_render_one, [figure for figure, _ in stale])
+                for output_file, (_, key) in zip(outputs, stale):
+                    manifest[output_file] = key
+                    rendered.append(output_file)
+        else:
+            for figure, key in stale:
+                manifest[_render_one(figure)] = key
+                rendered.append(figure[2])
+    finally:
+        # Grava o que foi gerado mesmo se uma figura falhar, para não redesenhar tudo na próxima vez
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+    return rendered
+
+
+def plot_fairness(series, alg, delay, output_file):
+    """
+    Gráfico de vazão x tempo dos fluxos de um teste (o mesmo do topo.py), com as curvas reduzidas por lttb().
+    'series' é {fluxo: {'time': vetor, 'mbps': vetor, 'src': host de origem (opcional)}}.
+    """
+    for i, (flow, values) in enumerate(series.items(), 1):
+        seconds, mbps = lttb(values['time'], values['mbps'])
+        label = 'Source Host {0} ({1})'.format(i, values['src']) if 'src' in values else flow
+        plt.plot(seconds, mbps, label=label)
+
+    plt.xlabel('Time (sec)')
+    plt.ylabel('Bandwidth (Mbps)')
+    plt.ylim(0, 120)
+    plt.grid()
+    plt.title("TCP Fairness Graph\n{0} TCP Cong Control Alg Delay={1:g}ms".format(alg.capitalize(), delay))
+    # Uma legenda com centenas de fluxos cobriria o gráfico
+    if len(series) <= 10:
+        plt.legend()
+    plt.savefig(output_file)
+    plt.close()
+
+
+def gallery_figures(db_path, outdir, start_time1=200, end_time1=1000, start_time2=0, end_time2=800, interval=10):
+    """
+    Lista as figuras da galeria de resultados: o gráfico de vazão de cada execução do banco e, para cada
+    configuração óptica, o gráfico bidirecional, o mapa de calor e as curvas do índice de Jain.
+    Retorna uma lista de (função, argumentos, arquivo) para render().
+    """
+    conn = open_store(db_path)
+    runs = find_runs(conn)
+    figures = list()
+    os.makedirs(os.path.join(outdir, 'runs'), exist_ok=True)
+    for run in runs:
+        series = dict((flow, dict(time=values['time'], mbps=values['mbps']))
+                      for flow, values in load_series(conn, run['id']).items() if 'time' in values)
+        output_file = os.path.join(outdir, 'runs', 'fairness_graph_{0}_{1:g}ms_run{2}.png'
+                                   .format(run['algorithm'], run['delay_ms'], run['id']))
+        figures.append((plot_fairness, (series, run['algorithm'], run['delay_ms']), output_file))
+
+    by_optical = dict()
+    for run in runs:
+        by_optical.setdefault(optical_tag(run), list()).append(run)
+    for tag, optical_runs in sorted(by_optical.items()):
+        statistics = compute_statistics(runs_groups(conn, optical_runs), outdir, start_time1, end_time1,
+                                        start_time2, end_time2, interval)
+        if not statistics[0]:
+            continue
+        figures.append((plot_statistics, statistics,
+                        os.path.join(outdir, 'grafico_bidirecional_com_jain_e_delays - {0}.png'.format(tag))))
+
+        # Índice de Jain médio por algoritmo e delay
+        jain = dict()
+        for label, mean in zip(statistics[0], statistics[5]):
+            algorithm, delay = label.rstrip(')').split(' (')
+            jain.setdefault(algorithm, list()).append((int(float(delay.replace('ms', ''))), mean))
+        figures.append((plot_jain_index, (jain,), os.path.join(outdir, 'graf_Jain_fairness - {0}.png'.format(tag))))
+
+        algorithms = sorted(jain)
+        rtts = sorted(set(2 * delay for values in jain.values() for delay, _ in values))
+        matrix = np.full((len(rtts), len(algorithms)), np.nan)
+        for j, algorithm in enumerate(algorithms):
+            for delay, mean in jain[algorithm]:
+                matrix[rtts.index(2 * delay), j] = mean
+        figures.append((plot_heatmap, (matrix, rtts, algorithms),
+                        os.path.join(outdir, 'Jain_heatmap_RTT - {0}.png'.format(tag))))
+    conn.close()
+    return figures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Gera, em paralelo, as figuras da galeria de resultados que mudaram.')
+    parser.add_argument('db_path', help='Banco de resultados gravado pelo topo.py.')
+    parser.add_argument('-o', '--outdir', default='../Results', help='Diretório da galeria.')
+    parser.add_argument('-j', '--jobs', type=int, help='Processos de desenho (padrão: um por CPU).')
+    parser.add_argument('-f', '--force', action='store_true', help='Redesenha todas as figuras.')
+    parser.add_argument('--start1', type=int, default=200, help='Início da janela do fluxo h1-h2 (s).')
+    parser.add_argument('--end1', type=int, default=1000, help='Fim da janela do fluxo h1-h2 (s).')
+    parser.add_argument('--start2', type=int, default=0, help='Início da janela do fluxo h3-h4 (s).')
+    parser.add_argument('--end2', type=int, default=800, help='Fim da janela do fluxo h3-h4 (s).')
+    parser.add_argument('--interval', type=int, default=10, help='Janela de tempo das médias (s).')
+    args = parser.parse_args()
+
+    start = time()
+    figures = gallery_figures(args.db_path, args.outdir, args.start1, args.end1, args.start2, args.end2, args.interval)
+    rendered = render(figures, os.path.join(args.outdir, MANIFEST), args.jobs, args.force)
+    print(f'{len(rendered)} figuras geradas, {len(figures) - len(rendered)} sem mudança, em {time() - start:.1f} s')
@@ -0,0 +1,234 @@
+import argparse
+import json
+import sqlite3
+import numpy as np
+from time import time
+
+# Colunas indexáveis de cada execução. Os demais parâmetros ficam em 'params' (JSON).
+RUN_COLUMNS = [
+    ('algorithm', 'TEXT'),
+    ('delay_ms', 'REAL'),
+    ('span_km', 'REAL'),
+    ('n_spans', 'INTEGER'),
+    ('boost_gain_db', 'REAL'),
+    ('amp_gains_db', 'TEXT'),  # lista em JSON
+    ('launch_power_dbm', 'REAL'),
+    ('n_pairs', 'INTEGER'),
+    ('n_channels', 'INTEGER'),
+    ('queue_br', 'REAL'),
+    ('queue_ar', 'REAL'),
+    ('queue_hi', 'REAL'),
+    ('osnr_db', 'REAL'),
+    ('gosnr_db', 'REAL'),
+    ('repetition', 'INTEGER'),
+    ('started', 'REAL'),
+    ('duration_s', 'REAL'),
+    ('stop_reason', 'TEXT'),
+    ('outdir', 'TEXT'),
+    ('point_key', 'TEXT'),  # hash do ponto da varredura (ver sweep_manifest.py no Mininet-topology)
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    {columns},
+    params TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_alg_delay ON runs (algorithm, delay_ms);
+CREATE INDEX IF NOT EXISTS runs_osnr ON runs (osnr_db);
+CREATE INDEX IF NOT EXISTS runs_optical ON runs (span_km, n_spans, boost_gain_db, launch_power_dbm);
+CREATE TABLE IF NOT EXISTS series (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    flow TEXT NOT NULL,
+    name TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (run_id, flow, name)
+);
+CREATE TABLE IF NOT EXISTS telemetry (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    monitor TEXT NOT NULL,
+    name TEXT NOT NULL,
+    dtype TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (run_id, monitor, name)
+);
+CREATE TABLE IF NOT EXISTS sweep_points (
+    key TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated REAL
+);
+CREATE TABLE IF NOT EXISTS optical (
+    key TEXT PRIMARY KEY,
+    osnr_db REAL,
+    gosnr_db REAL,
+    power_dbm REAL
+);
+""".format(columns=',\n    '.join('{0} {1}'.format(name, kind) for name, kind in RUN_COLUMNS))
+
+# Sufixos aceitos nos filtros de find_runs()
+OPERATORS = {'lt': '<', 'le': '<=', 'gt': '>', 'ge': '>=', 'ne': '!='}
+
+
+def open_store(db_path):
+    """
+    Abre (e cria, se preciso) o banco SQLite de resultados.
+    O modo WAL e o timeout permitem que execuções paralelas gravem no mesmo arquivo.
+    """
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.executescript(SCHEMA)
+
+    # Bancos criados por versões anteriores ganham as colunas novas
+    existing = set(row['name'] for row in conn.execute('PRAGMA table_info(runs)'))
+    for name, kind in RUN_COLUMNS:
+        if name not in existing:
+            conn.execute('ALTER TABLE runs ADD COLUMN {0} {1}'.format(name, kind))
+    conn.execute('CREATE INDEX IF NOT EXISTS runs_point ON runs (point_key)')
+    return conn
+
+
+def add_run(conn, params, series=None, telemetry=None):
+    """
+    Grava uma execução com seu conjunto completo de parâmetros e, opcionalmente, suas séries temporais.
+    'series' é um dicionário {fluxo: {nome_da_coluna: vetor}}, por exemplo {'h1-h2': {'start': ..., 'mbps': ...}}.
+    'telemetry' é a telemetria da camada óptica, {monitor: {'time': vetor, 'channels': vetor, 'osnr': matriz
+    amostras x canais, ...}} (ver optical_telemetry.py no Mininet-topology).
+    Retorna o id da execução.
+    """
+    values = dict(params)
+    if isinstance(values.get('amp_gains_db'), (list, tuple)):
+        values['amp_gains_db'] = json.dumps(list(values['amp_gains_db']))
+    columns = [name for name, _ in RUN_COLUMNS]
+
+    with conn:
+        cursor = conn.execute(
+            'INSERT INTO runs ({0}, params) VALUES ({1}, ?)'.format(', '.join(columns), ', '.join('?' * len(columns))),
+            [values.get(name) for name in columns] + [json.dumps(params, sort_keys=True, default=str)])
+        run_id = cursor.lastrowid
+        for flow, arrays in (series or dict()).items():
+            for name, values in arrays.items():
+                values = np.ascontiguousarray(values)
+                conn.execute('INSERT INTO series (run_id, flow, name, dtype, data) VALUES (?, ?, ?, ?, ?)',
+                             (run_id, flow, name, values.dtype.str, values.tobytes()))
+        for monitor, arrays in (telemetry or dict()).items():
+            for name, values in arrays.items():
+                values = np.ascontiguousarray(values)
+                conn.execute('INSERT INTO telemetry (run_id, monitor, name, dtype, data) VALUES (?, ?, ?, ?, ?)',
+                             (run_id, monitor, name, values.dtype.str, values.tobytes()))
+    return run_id
+
+
+def find_optical(conn, key):
+    """
+    Retorna o OSNR/gOSNR/potência já medidos para uma configuração óptica ('key' é o JSON canônico dos parâmetros),
+    ou None se ela ainda não foi avaliada.
+    """
+    row = conn.execute('SELECT * FROM optical WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        return None
+    return dict(osnr=row['osnr_db'], gosnr=row['gosnr_db'], power=row['power_dbm'])
+
+
+def add_optical(conn, key, measured):
+    """
+    Grava o OSNR/gOSNR/potência medidos para uma configuração óptica.
+    """
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO optical (key, osnr_db, gosnr_db, power_dbm) VALUES (?, ?, ?, ?)',
+                     (key, measured.get('osnr'), measured.get('gosnr'), measured.get('power')))
+
+
+def completed_points(conn):
+    """
+    Retorna o conjunto dos hashes de pontos da varredura que já têm uma execução gravada. Como a execução e suas
+    séries são gravadas numa única transação, um ponto nunca aparece pela metade.
+    """
+    return set(row[0] for row in conn.execute('SELECT DISTINCT point_key FROM runs WHERE point_key IS NOT NULL'))
+
+
+def record_attempt(conn, key, params, error=None):
+    """
+    Registra uma tentativa de um ponto da varredura (com o erro, se falhou) e retorna o número de tentativas.
+    """
+    with conn:
+        conn.execute('INSERT OR IGNORE INTO sweep_points (key, params) VALUES (?, ?)',
+                     (key, json.dumps(params, sort_keys=True, default=str)))
+        conn.execute('UPDATE sweep_points SET attempts = attempts + 1, last_error = ?, updated = ? WHERE key = ?',
+                     (error, time(), key))
+    return conn.execute('SELECT attempts FROM sweep_points WHERE key = ?', (key,)).fetchone()[0]
+
+
+def find_runs(conn, order_by='id', **filters):
+    """
+    Consulta indexada das execuções. Cada filtro é uma coluna de 'runs', com um sufixo opcional de comparação:
+    find_runs(conn, algorithm='cubic', osnr_db_lt=28) retorna as execuções cubic com OSNR < 28 dB.
+    Listas e tuplas viram IN (...).
+    """
+    clauses, args = [], []
+    for key, value in filters.items():
+        column, _, suffix = key.rpartition('_')
+        if suffix not in OPERATORS:
+            column, operator = key, '='
+        else:
+            operator = OPERATORS[suffix]
+        if column not in dict(RUN_COLUMNS) and column != 'id':
+            raise ValueError('Coluna desconhecida: {0}'.format(column))
+        if isinstance(value, (list, tuple)):
+            clauses.append('{0} IN ({1})'.format(column, ', '.join('?' * len(value))))
+            args.extend(value)
+        else:
+            clauses.append('{0} {1} ?'.format(column, operator))
+            args.append(value)
+
+    where = 'WHERE ' + ' AND '.join(clauses) if clauses else ''
+    return conn.execute('SELECT * FROM runs {0} ORDER BY {1}'.format(where, order_by), args).fetchall()
+
+
+def load_series(conn, run_id):
+    """
+    Retorna as séries temporais de uma execução como {fluxo: {nome_da_coluna: vetor}}.
+    """
+    series = dict()
+    for row in conn.execute('SELECT flow, name, dtype, data FROM series WHERE run_id = ?', (run_id,)):
+        series.setdefault(row['flow'], dict())[row['name']] = np.frombuffer(row['data'], dtype=row['dtype'])
+    return series
+
+
+def load_telemetry(conn, run_id):
+    """
+    Retorna a telemetria óptica de uma execução como {monitor: {'time': vetor, 'channels': vetor, 'osnr': matriz
+    amostras x canais, 'gosnr': ..., 'power': ...}}, no mesmo relógio (época) da coluna 'time' das séries.
+    """
+    telemetry = dict()
+    for row in conn.execute('SELECT monitor, name, dtype, data FROM telemetry WHERE run_id = ?', (run_id,)):
+        telemetry.setdefault(row['monitor'], dict())[row['name']] = np.frombuffer(row['data'], dtype=row['dtype'])
+    for arrays in telemetry.values():
+        n_channels = len(arrays.get('channels', ()))
+        for name, values in arrays.items():
+            if name not in ('time', 'channels') and n_channels:
+                arrays[name] = values.reshape(-1, n_channels)
+    return telemetry
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Consulta o banco de resultados dos testes.')
+    parser.add_argument('db_path', help='Arquivo SQLite gravado pelo topo.py.')
+    parser.add_argument('filters', nargs='*', help='Filtros coluna[_lt|_le|_gt|_ge|_ne]=valor, ex.: osnr_db_lt=28')
+    args = parser.parse_args()
+
+    filters = dict()
+    for item in args.filters:
+        key, value = item.split('=', 1)
+        try:
+            filters[key] = float(value)
+        except ValueError:
+            filters[key] = value
+
+    conn = open_store(args.db_path)
+    for run in find_runs(conn, **filters):
+        print(dict((key, run[key]) for key in run.keys() if key != 'params'))
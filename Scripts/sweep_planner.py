@@ -0,0 +1,267 @@
+import argparse
+import math
+import numpy as np
+from itertools import product
+from result_store import open_store, find_runs, load_series
+from fairness_metrics import run_metrics
+
+# Eixos do modelo: RTT (ms), OSNR (dB) e fila do enlace de backbone (pacotes)
+FEATURES = ['rtt_ms', 'osnr_db', 'queue']
+
+# Algoritmos baseados em perda, cuja vazão a priori segue Mathis et al.; os demais (bbr, vegas...) partem da
+# capacidade do gargalo
+LOSS_BASED = {'reno', 'cubic', 'bic', 'htcp', 'highspeed', 'scalable', 'westwood', 'illinois', 'hybla', 'yeah'}
+
+# Comprimentos de escala (eixos normalizados em [0, 1]) testados no ajuste do processo gaussiano
+LENGTHSCALES = (0.1, 0.2, 0.35, 0.6, 1.0)
+
+# Ruído das medidas, como fração da variância do sinal
+NOISE_FRACTION = 0.05
+
+# Índice de Jain a priori e seu desvio
+JAIN_PRIOR, JAIN_STD = 0.9, 0.1
+
+_erfc = np.vectorize(math.erfc, otypes=[float])
+
+
+def estimate_osnr(span_km, n_spans, launch_power_dbm, loss_db_km=0.2, nf_db=5.5):
+    """
+    OSNR (dB, banda de referência de 0,1 nm) de uma cadeia de n_spans vãos amplificados, pela fórmula clássica
+    58 + P - NF - perda do vão - 10 log10(N). Usado para configurações ópticas ainda não medidas.
+    """
+    return 58 + launch_power_dbm - nf_db - loss_db_km * span_km - 10 * math.log10(max(n_spans, 1))
+
+
+def mathis_prior(algorithm, rtt_ms, osnr_db, capacity_mbps=96, n_flows=2, mss=1460, loss_floor=1e-4,
+                 baud_gbd=32):
+    """
+    Vazão agregada a priori (Mbps). Para algoritmos baseados em perda, n_flows fluxos de Mathis, MSS/RTT * 1,22/sqrt(p),
+    limitados pela capacidade; a perda p é a perda mínima da fila (loss_floor) mais a perda de pacotes causada pela
+    BER de um sinal QPSK com o OSNR dado. Os demais algoritmos partem da capacidade do gargalo.
+    """
+    rtt_ms, osnr_db = np.asarray(rtt_ms, dtype=float), np.asarray(osnr_db, dtype=float)
+    if algorithm not in LOSS_BASED:
+        return np.full(np.broadcast(rtt_ms, osnr_db).shape, float(capacity_mbps))
+    snr = 10 ** (osnr_db / 10) * 12.5 / baud_gbd
+    ber = 0.5 * _erfc(np.sqrt(snr / 2))
+    loss = loss_floor + np.minimum(1.0, 8 * (mss + 40) * ber)
+    mathis = 8 * mss / (np.maximum(rtt_ms, 0.1) / 1e3) * 1.22 / np.sqrt(loss) / 1e6
+    return np.minimum(capacity_mbps, n_flows * mathis)
+
+
+class Surrogate(object):
+    """
+    Processo gaussiano (kernel RBF) sobre os resíduos de uma média a priori. 'X' são os pontos medidos nos eixos
+    normalizados e 'residuals' as medidas menos a média a priori. O comprimento de escala é o de maior verossimilhança
+    marginal entre 'lengthscales'; com menos de 3 medidas, usa-se o desvio a priori 'prior_std' como sinal.
+    """
+
+    def __init__(self, X, residuals, prior_std, lengthscales=LENGTHSCALES, signal=None):
+        self.X = np.asarray(X, dtype=float)
+        residuals = np.asarray(residuals, dtype=float)
+        if signal is None:
+            signal = max(float(residuals.var()), (0.05 * prior_std) ** 2) if len(residuals) >= 3 else prior_std ** 2
+        self.signal = signal
+        self.noise = NOISE_FRACTION * signal
+        best = None
+        for lengthscale in lengthscales:
+            K = self.kernel(self.X, self.X, lengthscale) + self.noise * np.eye(len(self.X))
+            L = np.linalg.cholesky(K)
+            alpha = np.linalg.solve(L.T, np.linalg.solve(L, residuals))
+            fit = -0.5 * residuals @ alpha - np.log(np.diag(L)).sum()
+            if best is None or fit > best[0]:
+                best = (fit, lengthscale, L, alpha)
+        _, self.lengthscale, self.L, self.alpha = best
+        self.residuals = residuals
+
+    def kernel(self, A, B, lengthscale):
+        d2 = ((A[:, None, :] - B[None, :, :]) ** 2).sum(axis=2)
+        return self.signal * np.exp(-0.5 * d2 / lengthscale ** 2)
+
+    def predict(self, Xs):
+        """
+        Média (dos resíduos) e desvio a posteriori nos pontos Xs.
+        """
+        Xs = np.asarray(Xs, dtype=float)
+        if not len(self.X):
+            return np.zeros(len(Xs)), np.full(len(Xs), math.sqrt(self.signal))
+        Ks = self.kernel(Xs, self.X, self.lengthscale)
+        v = np.linalg.solve(self.L, Ks.T)
+        return Ks @ self.alpha, np.sqrt(np.maximum(self.signal - (v ** 2).sum(axis=0), 0.0))
+
+    def add(self, x, residual):
+        """
+        Novo modelo com uma medida a mais, mantendo os hiperparâmetros.
+        """
+        return Surrogate(np.vstack([self.X, x]), np.append(self.residuals, residual), 0, (self.lengthscale,),
+                         self.signal)
+
+
+def collect_observations(conn, **filters):
+    """
+    Lê as execuções do banco com suas métricas (fairness_metrics.run_metrics()): lista de dicionários com o
+    algoritmo, os eixos de FEATURES, 'throughput' (Mbps agregado) e 'jain'. Execuções sem OSNR são ignoradas.
+    """
+    observations = list()
+    for run in find_runs(conn, **filters):
+        if run['osnr_db'] is None:
+            continue
+        metrics = run_metrics(load_series(conn, run['id']))
+        if metrics is None:
+            continue
+        observations.append(dict(algorithm=run['algorithm'], rtt_ms=2 * run['delay_ms'], osnr_db=run['osnr_db'],
+                                 queue=run['queue_br'], throughput=metrics[0], jain=metrics[1]))
+    return observations
+
+
+class SweepModel(object):
+    """
+    Modelos substitutos da vazão e do índice de Jain de cada algoritmo, ajustados às execuções já feitas.
+    """
+
+    def __init__(self, observations, algorithms, configs, capacity_mbps=96, n_flows=2, features=FEATURES):
+        """
+        'configs' é a matriz configurações x eixos de todos os pontos de interesse, usada (com as medidas) para
+        normalizar os eixos em [0, 1].
+        """
+        self.algorithms, self.features = list(algorithms), list(features)
+        self.capacity, self.n_flows = capacity_mbps, n_flows
+        points = np.array([[o[f] for f in self.features] for o in observations] + list(configs), dtype=float)
+        self.low = points.min(axis=0) if len(points) else np.zeros(len(self.features))
+        self.span = np.maximum(points.max(axis=0) - self.low, 1e-9) if len(points) else np.ones(len(self.features))
+        self.models = dict()
+        for algorithm in self.algorithms:
+            own = [o for o in observations if o['algorithm'] == algorithm]
+            X = self.scale([[o[f] for f in self.features] for o in own])
+            thr = np.array([o['throughput'] for o in own]) - self.prior(algorithm, X)
+            jain = np.array([o['jain'] for o in own]) - JAIN_PRIOR
+            self.models[algorithm] = dict(throughput=Surrogate(X, thr, self.capacity / 2),
+                                          jain=Surrogate(X, jain, JAIN_STD))
+
+    def scale(self, values):
+        return (np.asarray(values, dtype=float).reshape(-1, len(self.features)) - self.low) / self.span
+
+    def prior(self, algorithm, X):
+        values = dict(zip(self.features, (X * self.span + self.low).T))
+        return mathis_prior(algorithm, values['rtt_ms'], values['osnr_db'], self.capacity, self.n_flows)
+
+    def predict(self, X, objective='throughput', weight=0.5):
+        """
+        Média e desvio do objetivo de cada algoritmo nos pontos X (normalizados): matrizes algoritmos x pontos.
+        'mix' pondera a vazão normalizada pela capacidade e o índice de Jain por 'weight', como em cca_decision.
+        """
+        mean, std = np.empty((len(self.algorithms), len(X))), np.empty((len(self.algorithms), len(X)))
+        for i, algorithm in enumerate(self.algorithms):
+            thr_mean, thr_std = self.models[algorithm]['throughput'].predict(X)
+            thr_mean += self.prior(algorithm, X)
+            jain_mean, jain_std = self.models[algorithm]['jain'].predict(X)
+            jain_mean += JAIN_PRIOR
+            if objective == 'throughput':
+                mean[i], std[i] = thr_mean, thr_std
+            elif objective == 'jain':
+                mean[i], std[i] = jain_mean, jain_std
+            else:
+                mean[i] = weight * thr_mean / self.capacity + (1 - weight) * jain_mean
+                std[i] = np.hypot(weight * thr_std / self.capacity, (1 - weight) * jain_std)
+        return mean, std
+
+    def believe(self, algorithm, x):
+        """
+        Acrescenta uma medida fictícia igual à média prevista em x ("kriging believer"), para que os próximos pontos
+        de um mesmo lote se afastem dele.
+        """
+        for name, model in self.models[algorithm].items():
+            model_mean, _ = model.predict(x[None, :])
+            self.models[algorithm][name] = model.add(x, model_mean[0])
+
+
+def ranking(mean, std):
+    """
+    Melhor algoritmo, segundo melhor e probabilidade de que a ordem dos dois esteja trocada, por ponto.
+    """
+    order = np.argsort(-mean, axis=0)
+    columns = np.arange(mean.shape[1])
+    first, second = order[0], order[min(1, len(order) - 1)]
+    gap = mean[first, columns] - mean[second, columns]
+    spread = np.hypot(std[first, columns], std[second, columns])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        swapped = np.where(spread > 0, 0.5 * _erfc(gap / np.maximum(spread, 1e-12) / math.sqrt(2)), 0.0)
+    swapped[first == second] = 0.0
+    return first, second, swapped
+
+
+def plan(model, candidates, batch=4, objective='throughput', weight=0.5, beta=0.5):
+    """
+    Escolhe as próximas 'batch' execuções entre os candidatos (dicionários com 'algorithm' e os eixos do modelo).
+
+    Cada configuração recebe a probabilidade de troca entre o melhor e o segundo algoritmo (fronteira da decisão,
+    multiplicada por 2 para ficar em [0, 1]); cada candidato soma a isso, ponderado por 'beta', o desvio previsto do
+    seu algoritmo relativo ao desvio a priori. Candidatos de algoritmos fora dos dois primeiros valem um quarto na
+    fronteira. Após cada escolha, o modelo recebe uma medida fictícia no ponto, o que reduz a incerteza ao redor.
+    Retorna os candidatos escolhidos, cada um com sua 'score'.
+    """
+    remaining = list(candidates)
+    if not remaining:
+        return list()
+    X = model.scale([[c[f] for f in model.features] for c in remaining])
+    rows = [model.algorithms.index(c['algorithm']) for c in remaining]
+    prior_std = {'throughput': model.capacity / 2, 'jain': JAIN_STD}.get(objective, 0.5)
+
+    chosen = list()
+    while remaining and len(chosen) < batch:
+        mean, std = model.predict(X, objective, weight)
+        first, second, swapped = ranking(mean, std)
+        columns = np.arange(len(remaining))
+        own_std = std[rows, columns]
+        top = (np.array(rows) == first) | (np.array(rows) == second)
+        score = 2 * swapped * np.where(top, 1.0, 0.25) + beta * own_std / prior_std
+        best = int(score.argmax())
+        chosen.append(dict(remaining[best], score=float(score[best])))
+        model.believe(remaining[best]['algorithm'], X[best])
+        del remaining[best], rows[best]
+        X = np.delete(X, best, axis=0)
+    return chosen
+
+
+def decision_map(model, configs, objective='throughput', weight=0.5):
+    """
+    Melhor algoritmo previsto em cada configuração, com o segundo e a probabilidade de estarem trocados.
+    """
+    X = model.scale(configs)
+    mean, std = model.predict(X, objective, weight)
+    first, second, swapped = ranking(mean, std)
+    return [dict(zip(model.features, config), best=model.algorithms[f], second=model.algorithms[s],
+                 swapped=float(p), mean=float(mean[f, i])) for i, (config, f, s, p) in
+            enumerate(zip(np.asarray(configs).tolist(), first, second, swapped))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Próximas execuções de uma varredura adaptativa e mapa do melhor '
+                                                 'algoritmo previsto.')
+    parser.add_argument('db_path', help='Banco de resultados gravado pelo topo.py.')
+    parser.add_argument('-a', '--algorithms', nargs='+', required=True)
+    parser.add_argument('-d', '--delays', nargs='+', type=float, required=True,
+                        help='Delays (ms, um sentido) candidatos, combinados com os OSNR já medidos no banco.')
+    parser.add_argument('-b', '--batch', type=int, default=4, help='Número de execuções a propor.')
+    parser.add_argument('--objective', choices=['throughput', 'jain', 'mix'], default='throughput')
+    parser.add_argument('--weight', type=float, default=0.5, help='Peso da vazão no objetivo mix.')
+    parser.add_argument('--capacity', type=float, default=96, help='Capacidade do gargalo (Mbps), da média a priori.')
+    parser.add_argument('--flows', type=int, default=2, help='Número de fluxos de cada teste.')
+    args = parser.parse_args()
+
+    # O eixo da fila acompanha o delay no topo.py; aqui só RTT e OSNR
+    features = ['rtt_ms', 'osnr_db']
+    observations = collect_observations(open_store(args.db_path))
+    osnrs = sorted(set(round(o['osnr_db'], 2) for o in observations))
+    configs = [(2 * delay, osnr) for delay, osnr in product(args.delays, osnrs)]
+    done = set((o['algorithm'], o['rtt_ms'], round(o['osnr_db'], 2)) for o in observations)
+    candidates = [dict(algorithm=a, rtt_ms=rtt, osnr_db=osnr) for a, (rtt, osnr) in product(args.algorithms, configs)
+                  if (a, rtt, osnr) not in done]
+
+    model = SweepModel(observations, args.algorithms, configs, args.capacity, args.flows, features)
+    for row in decision_map(model, configs, args.objective, args.weight):
+        print('RTT {rtt_ms:6.1f} ms, OSNR {osnr_db:5.2f} dB: {best:>6} (segundo {second}, P(troca) {swapped:.2f})'
+              .format(**row))
+    print('{0} execuções medidas, {1} candidatas. Próximas:'.format(len(observations), len(candidates)))
+    for candidate in plan(model, candidates, args.batch, args.objective, args.weight):
+        print('  {algorithm:>6} RTT {rtt_ms:6.1f} ms, OSNR {osnr_db:5.2f} dB (score {score:.3f})'.format(**candidate))